@@ -0,0 +1,334 @@
+import math
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+
+import numpy as np
+
+from audio_wav import analizza_wav
+
+# --- Analisi dell'audio ---
+# Picco, RMS, loudness integrata (ITU-R BS.1770: ponderazione K e gating a blocchi di 400 ms),
+# tratti di silenzio e miniatura della forma d'onda vengono calcolati in un solo passaggio
+# vettoriale con numpy sui campioni PCM del WAV (bytes o mmap), a blocchi di dimensione fissa:
+# la memoria usata non dipende dalla durata dell'audio.
+# Il risultato alimenta i filtri "taglia silenzi" e "normalizza loudness" (vedi filtri_audio.py)
+# e viene conservato per id dell'audio nell'archivio, quindi ogni audio si analizza una volta.
+
+# Sotto questa soglia (dBFS, su finestre di 10 ms) l'audio è considerato silenzio
+SOGLIA_SILENZIO_DB = -45.0
+FINESTRA_SILENZIO_MS = 10
+# Tratti di silenzio più brevi (pause tra le parole) non vengono riportati
+MIN_SILENZIO_MS = 300
+# Silenzio lasciato prima e dopo la voce quando si tagliano i silenzi iniziali e finali
+MARGINE_TAGLIO_MS = 150
+# Picco massimo dopo la normalizzazione: il guadagno viene limitato per non saturare
+PICCO_MASSIMO_DB = -1.0
+PUNTI_MINIATURA = 200
+# Gating BS.1770: blocchi di 400 ms con passo di 100 ms, soglia assoluta e relativa
+_BLOCCO_LOUDNESS_S = 0.4
+_PASSO_LOUDNESS_S = 0.1
+_GATE_ASSOLUTO_LUFS = -70.0
+_GATE_RELATIVO_LU = -10.0
+# Campioni per blocco nel filtraggio FFT (overlap-add) della ponderazione K
+_CAMPIONI_BLOCCO_FFT = 1 << 18
+MAX_VOCI_CACHE_ANALISI = 512
+
+
+def campioni_float(formato, pcm):
+    """Campioni PCM come array float32 (frame × canali) in [-1, 1)."""
+    if formato.larghezza == 3:
+        # 24 bit: i tre byte di ogni campione diventano i byte alti di un int32
+        grezzi = np.frombuffer(pcm, dtype=np.uint8)
+        grezzi = grezzi[:len(grezzi) - len(grezzi) % 3].reshape(-1, 3).astype(np.int32)
+        interi = (grezzi[:, 0] << 8) | (grezzi[:, 1] << 16) | (grezzi[:, 2] << 24)
+        campioni = interi.astype(np.float32) / 2.0 ** 31
+    elif formato.larghezza == 1:
+        campioni = (np.frombuffer(pcm, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    else:
+        tipo = {2: "<i2", 4: "<i4"}[formato.larghezza]
+        grezzi = np.frombuffer(pcm, dtype=tipo, count=len(pcm) // formato.larghezza)
+        campioni = grezzi.astype(np.float32) / float(2 ** (8 * formato.larghezza - 1))
+    n_frame = len(campioni) // formato.canali
+    return campioni[:n_frame * formato.canali].reshape(n_frame, formato.canali)
+
+
+def _db(valore):
+    return 20.0 * math.log10(valore) if valore > 0 else None
+
+
+def _biquad_k(frequenza):
+    """Coefficienti (b, a) dei due stadi della ponderazione K alla frequenza data (come pyloudnorm)."""
+    # Stadio 1: high shelf +4 dB a 1500 Hz
+    guadagno = 10.0 ** (4.0 / 40.0)
+    w0 = 2.0 * math.pi * 1500.0 / frequenza
+    alfa = math.sin(w0) / (2.0 * (1.0 / math.sqrt(2.0)))
+    radice = 2.0 * math.sqrt(guadagno) * alfa
+    coseno = math.cos(w0)
+    shelf = (
+        (guadagno * ((guadagno + 1) + (guadagno - 1) * coseno + radice),
+         -2.0 * guadagno * ((guadagno - 1) + (guadagno + 1) * coseno),
+         guadagno * ((guadagno + 1) + (guadagno - 1) * coseno - radice)),
+        ((guadagno + 1) - (guadagno - 1) * coseno + radice,
+         2.0 * ((guadagno - 1) - (guadagno + 1) * coseno),
+         (guadagno + 1) - (guadagno - 1) * coseno - radice),
+    )
+    # Stadio 2: passa-alto a 38 Hz (RLB)
+    w0 = 2.0 * math.pi * 38.0 / frequenza
+    alfa = math.sin(w0) / (2.0 * 0.5)
+    coseno = math.cos(w0)
+    passa_alto = (
+        ((1 + coseno) / 2.0, -(1 + coseno), (1 + coseno) / 2.0),
+        (1 + alfa, -2.0 * coseno, 1 - alfa),
+    )
+    return shelf, passa_alto
+
+
+@lru_cache(maxsize=8)
+def _risposta_k(frequenza):
+    """
+    Risposta all'impulso della ponderazione K troncata a mezzo secondo (la coda oltre è
+    trascurabile) e dimensione FFT per filtrarla a blocchi con overlap-add.
+    """
+    lunghezza = 1 << max(8, (frequenza // 2 - 1).bit_length())
+    impulso = np.zeros(lunghezza)
+    impulso[0] = 1.0
+    risposta = impulso
+    for b, a in _biquad_k(frequenza):
+        # Equazione alle differenze su un impulso: una volta per frequenza, poi resta in cache
+        ingresso, uscita = risposta.tolist(), [0.0] * lunghezza
+        x1 = x2 = y1 = y2 = 0.0
+        for i, x in enumerate(ingresso):
+            y = (b[0] * x + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2) / a[0]
+            x2, x1, y2, y1 = x1, x, y1, y
+            uscita[i] = y
+        risposta = np.array(uscita)
+    dimensione_fft = 1 << (_CAMPIONI_BLOCCO_FFT + lunghezza - 1).bit_length()
+    return np.fft.rfft(risposta, dimensione_fft), lunghezza, dimensione_fft
+
+
+class _MisuraLoudness:
+    """
+    Loudness integrata BS.1770 di `n_frame` frame ricevuti a blocchi consecutivi (al massimo
+    _CAMPIONI_BLOCCO_FFT frame ciascuno): la ponderazione K viene applicata con overlap-add,
+    portando al blocco successivo la coda della convoluzione, e dell'energia pesata resta solo
+    la somma progressiva ai bordi dei blocchi di gating.
+    """
+
+    def __init__(self, n_frame, frequenza, canali):
+        self._blocco = int(round(_BLOCCO_LOUDNESS_S * frequenza))
+        passo = int(round(_PASSO_LOUDNESS_S * frequenza))
+        inizi = np.arange(0, max(0, n_frame - self._blocco + 1), passo)
+        # Bordi dei blocchi di gating, in ordine, e somma cumulativa dell'energia in ciascuno
+        self._bordi = np.union1d(inizi, inizi + self._blocco)
+        self._indici_inizio = np.searchsorted(self._bordi, inizi)
+        self._indici_fine = np.searchsorted(self._bordi, inizi + self._blocco)
+        self._cumulate = np.zeros(len(self._bordi))
+        self._energia = 0.0
+        self._letti = 0
+        if len(inizi):
+            self._spettro_k, lunghezza_k, self._dimensione_fft = _risposta_k(frequenza)
+            self._coda = np.zeros((lunghezza_k - 1, canali))
+
+    def aggiungi(self, campioni):
+        if not len(self._bordi):
+            return
+        n = len(campioni)
+        uscita = np.fft.irfft(
+            np.fft.rfft(campioni, self._dimensione_fft, axis=0) * self._spettro_k[:, None], self._dimensione_fft, axis=0
+        )
+        uscita = uscita[:n + len(self._coda)]
+        uscita[:len(self._coda)] += self._coda
+        self._coda = uscita[n:].copy()
+        cumulate = np.cumsum(np.square(uscita[:n]).sum(axis=1))
+        cumulate += self._energia
+        # Somma cumulativa fino al bordo b (escluso) per i bordi che cadono in questo blocco
+        dentro = slice(*np.searchsorted(self._bordi, (self._letti + 1, self._letti + n + 1)))
+        self._cumulate[dentro] = cumulate[self._bordi[dentro] - self._letti - 1]
+        self._energia = float(cumulate[-1])
+        self._letti += n
+
+    def risultato(self):
+        """Loudness in LUFS, oppure None se l'audio è più corto di un blocco o resta tutto sotto la soglia assoluta."""
+        if not len(self._bordi):
+            return None
+        energie = (self._cumulate[self._indici_fine] - self._cumulate[self._indici_inizio]) / self._blocco
+        with np.errstate(divide="ignore"):
+            loudness_blocchi = -0.691 + 10.0 * np.log10(energie)
+        energie = energie[loudness_blocchi > _GATE_ASSOLUTO_LUFS]
+        if not len(energie):
+            return None
+        soglia_relativa = -0.691 + 10.0 * math.log10(energie.mean()) + _GATE_RELATIVO_LU
+        with np.errstate(divide="ignore"):
+            energie = energie[-0.691 + 10.0 * np.log10(energie) > soglia_relativa]
+        return -0.691 + 10.0 * math.log10(energie.mean())
+
+
+def loudness_integrata(campioni, frequenza):
+    """
+    Loudness integrata in LUFS secondo BS.1770 (tutti i canali con peso 1), oppure None se
+    l'audio è più corto di un blocco o resta tutto sotto la soglia assoluta.
+    """
+    misura = _MisuraLoudness(len(campioni), frequenza, campioni.shape[1])
+    for inizio in range(0, len(campioni), _CAMPIONI_BLOCCO_FFT):
+        misura.aggiungi(campioni[inizio:inizio + _CAMPIONI_BLOCCO_FFT])
+    return misura.risultato()
+
+
+def _tratti(maschera):
+    """Inizi e fini (esclusa) dei tratti consecutivi di True in un array booleano."""
+    bordi = np.diff(np.concatenate(([0], maschera.view(np.int8), [0])))
+    return np.flatnonzero(bordi == 1), np.flatnonzero(bordi == -1)
+
+
+def analizza_pcm(formato, pcm, soglia_silenzio_db=SOGLIA_SILENZIO_DB, min_silenzio_ms=MIN_SILENZIO_MS,
+                 punti_miniatura=PUNTI_MINIATURA):
+    """
+    Analizza i campioni PCM `pcm` (bytes, memoryview o mmap, senza copiarli) e restituisce un
+    dizionario con durata_s, picco_db e rms_db (dBFS, None per il silenzio digitale), loudness_lufs
+    (None se non misurabile), silenzi (lista di (inizio_s, fine_s)), voce ((inizio_s, fine_s) dal
+    primo all'ultimo tratto sopra la soglia, None se è tutto silenzio) e miniatura (picco assoluto
+    per ciascuno di `punti_miniatura` intervalli, tra 0 e 1).
+    """
+    byte_per_frame = formato.canali * formato.larghezza
+    n_frame = len(pcm) // byte_per_frame
+    analisi = {
+        "durata_s": n_frame / formato.frequenza, "picco_db": None, "rms_db": None, "loudness_lufs": None,
+        "silenzi": [], "voce": None, "miniatura": [],
+    }
+    if n_frame == 0:
+        return analisi
+
+    finestra = max(1, formato.frequenza * FINESTRA_SILENZIO_MS // 1000)
+    # Blocchi multipli della finestra del silenzio, entro la dimensione del filtraggio FFT
+    frame_blocco = _CAMPIONI_BLOCCO_FFT // finestra * finestra
+    punti = min(punti_miniatura, n_frame)
+    inizi_punti = np.linspace(0, n_frame, punti, endpoint=False).astype(np.int64)
+    miniatura = np.zeros(punti, dtype=np.float32)
+    potenza_finestre = []
+    picco = potenza_totale = 0.0
+    loudness = _MisuraLoudness(n_frame, formato.frequenza, formato.canali)
+    for inizio in range(0, n_frame, frame_blocco):
+        fine = min(inizio + frame_blocco, n_frame)
+        campioni = campioni_float(formato, pcm[inizio * byte_per_frame:fine * byte_per_frame])
+        ampiezze = np.abs(campioni).max(axis=1)
+        potenza = np.square(campioni, dtype=np.float64).mean(axis=1)
+        picco = max(picco, float(ampiezze.max()))
+        potenza_totale += float(potenza.sum())
+        inizi_finestre = np.arange(0, fine - inizio, finestra)
+        lunghezze = np.diff(np.append(inizi_finestre, fine - inizio))
+        potenza_finestre.append(np.add.reduceat(potenza, inizi_finestre) / lunghezze)
+        # Intervalli della miniatura presenti nel blocco: il primo può essere iniziato nel blocco precedente
+        primo = int(np.searchsorted(inizi_punti, inizio, side="right")) - 1
+        interni = inizi_punti[(inizi_punti > inizio) & (inizi_punti < fine)] - inizio
+        massimi = np.maximum.reduceat(ampiezze, np.concatenate(([0], interni)))
+        intervalli = slice(primo, primo + len(massimi))
+        miniatura[intervalli] = np.maximum(miniatura[intervalli], massimi)
+        loudness.aggiungi(campioni)
+
+    analisi["picco_db"] = _db(picco)
+    analisi["rms_db"] = _db(math.sqrt(potenza_totale / n_frame))
+    analisi["loudness_lufs"] = loudness.risultato()
+
+    potenza_finestre = np.concatenate(potenza_finestre)
+    soglia = 10.0 ** (soglia_silenzio_db / 10.0)
+    silenzio = potenza_finestre < soglia
+
+    secondi = lambda indice_finestra: min(int(indice_finestra) * finestra, n_frame) / formato.frequenza  # noqa: E731
+    voce = np.flatnonzero(~silenzio)
+    if len(voce):
+        analisi["voce"] = (secondi(voce[0]), secondi(voce[-1] + 1))
+    min_finestre = max(1, int(math.ceil(min_silenzio_ms / FINESTRA_SILENZIO_MS)))
+    inizi, fini = _tratti(silenzio)
+    lunghi = (fini - inizi) >= min_finestre
+    analisi["silenzi"] = [(secondi(i), secondi(f)) for i, f in zip(inizi[lunghi], fini[lunghi])]
+    analisi["miniatura"] = np.round(miniatura, 4).tolist()
+    return analisi
+
+
+def analizza_audio(dati_wav, **opzioni):
+    """Analizza un WAV PCM in memoria (bytes, bytearray, memoryview o mmap). Vedi analizza_pcm."""
+    formato, offset, lunghezza = analizza_wav(dati_wav)
+    with memoryview(dati_wav) as vista:
+        return analizza_pcm(formato, vista[offset:offset + lunghezza], **opzioni)
+
+
+def byte_taglio(formato, analisi, n_bytes, margine_ms=MARGINE_TAGLIO_MS):
+    """
+    Intervallo (inizio, fine) in byte, allineato ai frame, dei campioni da tenere tagliando i
+    silenzi iniziali e finali con `margine_ms` di margine. Un audio tutto silenzio resta intero.
+    """
+    if analisi["voce"] is None:
+        return 0, n_bytes
+    byte_per_frame = formato.canali * formato.larghezza
+    margine_s = margine_ms / 1000.0
+    inizio_s, fine_s = analisi["voce"]
+    inizio = int(max(0.0, inizio_s - margine_s) * formato.frequenza) * byte_per_frame
+    fine = int(math.ceil((fine_s + margine_s) * formato.frequenza)) * byte_per_frame
+    return min(inizio, n_bytes), min(fine, n_bytes - n_bytes % byte_per_frame)
+
+
+def guadagno_normalizzazione(analisi, obiettivo_lufs, picco_massimo_db=PICCO_MASSIMO_DB):
+    """
+    Guadagno in dB che porta la loudness integrata a `obiettivo_lufs`, limitato in modo che il
+    picco non superi `picco_massimo_db`. 0 se la loudness non è misurabile.
+    """
+    if analisi["loudness_lufs"] is None or analisi["picco_db"] is None:
+        return 0.0
+    return min(obiettivo_lufs - analisi["loudness_lufs"], picco_massimo_db - analisi["picco_db"])
+
+
+# --- Analisi per audio dell'archivio ---
+class CacheAnalisi:
+    """
+    Risultati di analisi_pcm per id dell'archivio (LRU in memoria). Gli id identificano il
+    contenuto, quindi un risultato non diventa mai obsoleto: serve solo un limite di voci.
+    """
+
+    def __init__(self, max_voci=MAX_VOCI_CACHE_ANALISI):
+        self.max_voci = max_voci
+        self.hit = 0
+        self.miss = 0
+        self._voci = OrderedDict()
+        self._lock = threading.Lock()
+
+    def leggi(self, id_audio):
+        """Analisi già calcolata per l'audio, oppure None."""
+        with self._lock:
+            analisi = self._voci.get(id_audio)
+            if analisi is not None:
+                self._voci.move_to_end(id_audio)
+            return analisi
+
+    def ottieni(self, id_audio, dati_wav):
+        """Analisi dell'audio `id_audio`, calcolata su `dati_wav` (il suo contenuto) solo la prima volta."""
+        analisi = self.leggi(id_audio)
+        with self._lock:
+            if analisi is not None:
+                self.hit += 1
+                return analisi
+            self.miss += 1
+        analisi = analizza_audio(dati_wav)
+        with self._lock:
+            self._voci[id_audio] = analisi
+            while len(self._voci) > self.max_voci:
+                self._voci.popitem(last=False)
+        return analisi
+
+    def statistiche(self):
+        with self._lock:
+            totale = self.hit + self.miss
+            return {"hit": self.hit, "miss": self.miss, "hit_ratio": self.hit / totale if totale else 0.0, "voci": len(self._voci)}
+
+
+_cache_analisi_condivisa = None
+_lock_cache_analisi = threading.Lock()
+
+
+def ottieni_cache_analisi_condivisa():
+    """Cache delle analisi condivisa da tutte le sessioni del processo."""
+    global _cache_analisi_condivisa
+    with _lock_cache_analisi:
+        if _cache_analisi_condivisa is None:
+            _cache_analisi_condivisa = CacheAnalisi()
+        return _cache_analisi_condivisa
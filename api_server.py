@@ -0,0 +1,230 @@
+"""
+Servizio HTTP di sintesi di NovaStudioVocale (Flask).
+
+Endpoint:
+    GET  /api/speakers     elenco delle voci con durata, frequenza e canali
+    POST /api/synthesize   JSON {text, speaker, language?, pause_ms?, pitch?, speed?, volume?}
+                           risposta WAV in streaming: intestazione, poi i campioni frase per frase
+    POST /api/filter       corpo WAV, parametri pitch/speed/volume nella query string
+    GET  /metrics          metriche in formato Prometheus (vedi metriche.py)
+
+Tutte le richieste condividono un solo worker TTS con il modello caricato. Oltre
+NOVA_API_MAX_CONCORRENZA richieste contemporanee il servizio attende fino a
+NOVA_API_ATTESA_CODA_S secondi e poi risponde 429.
+
+Avvio:
+    python api_server.py --port 5000
+    NOVA_TTS_MOTORE=stub python api_server.py      # senza modello, per le prove in locale
+"""
+import os
+import time
+import argparse
+import threading
+
+from flask import Flask, Response, jsonify, request
+from pydub.exceptions import CouldntDecodeError
+
+from audio_wav import ErroreFormatoWav, durata_secondi, durata_wav, intestazione_wav, componi_wav, leggi_pcm, silenzio_pcm
+from cache_sintesi import ottieni_cache_condivisa
+from filtri_audio import filtra_wav, ErroreFiltri
+from indice_speaker import ottieni_indice_condiviso
+from metriche import ottieni_metriche_condivise, registra_sorgenti_predefinite
+from motore_tts import ottieni_worker_condiviso, ErroreSintesi, LINGUA_PREDEFINITA
+from pipeline_sintesi import dividi_in_frasi, genera_blocchi, risolvi_voce, PAUSA_TRA_FRASI_MS
+
+SPEAKER_DIR = "speaker_previews"
+ENV_MAX_CONCORRENZA = "NOVA_API_MAX_CONCORRENZA"
+ENV_ATTESA_CODA_S = "NOVA_API_ATTESA_CODA_S"
+
+
+class LimiteConcorrenza:
+    """Semaforo con attesa limitata: al massimo `massimo` richieste in lavorazione."""
+
+    def __init__(self, massimo, attesa_s=0.0):
+        self.massimo = massimo
+        self.attesa_s = attesa_s
+        self._semaforo = threading.BoundedSemaphore(massimo)
+
+    def acquisisci(self):
+        """Restituisce una funzione di rilascio (idempotente), oppure None se il servizio è saturo."""
+        if self.attesa_s > 0:
+            acquisito = self._semaforo.acquire(timeout=self.attesa_s)
+        else:
+            acquisito = self._semaforo.acquire(blocking=False)
+        if not acquisito:
+            return None
+        rilasciato = threading.Event()
+
+        def rilascia():
+            if not rilasciato.is_set():
+                rilasciato.set()
+                self._semaforo.release()
+        return rilascia
+
+
+def _errore(messaggio, stato):
+    return jsonify({"errore": messaggio}), stato
+
+
+def _parametri_filtri(sorgente):
+    """Pitch, velocità e volume da un dizionario di richiesta (ValueError se non validi)."""
+    pitch = int(sorgente.get("pitch", 0))
+    velocita = float(sorgente.get("speed", 1.0))
+    volume = float(sorgente.get("volume", 0))
+    if not -12 <= pitch <= 12 or not 0.25 <= velocita <= 4.0 or not -20 <= volume <= 20:
+        raise ValueError("parametri fuori intervallo (pitch -12..12, speed 0.25..4.0, volume -20..20)")
+    return pitch, velocita, volume
+
+
+def crea_app(worker=None, cartella_speaker=SPEAKER_DIR, cache=None, max_concorrenza=None, attesa_coda_s=None):
+    """Crea l'applicazione Flask. Senza argomenti usa il worker e la cache condivisi dal processo."""
+    app = Flask(__name__)
+    worker = worker or ottieni_worker_condiviso()
+    cache = cache if cache is not None else ottieni_cache_condivisa()
+    if max_concorrenza is None:
+        max_concorrenza = int(os.environ.get(ENV_MAX_CONCORRENZA, max(1, worker.parallelismo)))
+    if attesa_coda_s is None:
+        attesa_coda_s = float(os.environ.get(ENV_ATTESA_CODA_S, "0"))
+    limite = LimiteConcorrenza(max_concorrenza, attesa_coda_s)
+    metriche = ottieni_metriche_condivise()
+    registra_sorgenti_predefinite(metriche, cache={"sintesi": cache} if cache is not None else None, worker=worker)
+
+    def servizio_saturo():
+        risposta, stato = _errore("Servizio saturo, riprova più tardi.", 429)
+        risposta.headers["Retry-After"] = "5"
+        return risposta, stato
+
+    @app.get("/metrics")
+    def esporta_metriche():
+        return Response(metriche.testo_prometheus(), mimetype="text/plain; version=0.0.4")
+
+    @app.get("/api/speakers")
+    def elenco_speaker():
+        indice = ottieni_indice_condiviso(cartella_speaker)
+        voci = []
+        for nome in indice.elenco():
+            info = indice.info(nome)
+            voci.append({"name": nome, "duration_s": info["durata_s"], "sample_rate": info["frequenza"],
+                         "channels": info["canali"]})
+        return jsonify({"speakers": voci})
+
+    @app.post("/api/synthesize")
+    def sintetizza():
+        dati = request.get_json(silent=True) or {}
+        testo = dati.get("text", "")
+        speaker = dati.get("speaker", "")
+        if not isinstance(testo, str) or not isinstance(speaker, str):
+            return _errore("I campi text e speaker devono essere stringhe.", 400)
+        if not testo.strip() or not speaker:
+            return _errore("Campi obbligatori: text, speaker.", 400)
+        # Un testo senza nulla da pronunciare (es. "...") è un errore del client, non del motore
+        if not dividi_in_frasi(testo):
+            return _errore("Il testo non contiene parole da sintetizzare.", 400)
+        try:
+            pitch, velocita, volume = _parametri_filtri(dati)
+            pausa_ms = int(dati.get("pause_ms", PAUSA_TRA_FRASI_MS))
+        except (TypeError, ValueError) as e:
+            return _errore(f"Parametri non validi: {e}", 400)
+
+        inizio = time.perf_counter()
+        indice = ottieni_indice_condiviso(cartella_speaker)
+        if indice.info(speaker) is None:
+            return _errore(f"Voce dello speaker non trovata: {speaker}", 404)
+
+        rilascia = limite.acquisisci()
+        if rilascia is None:
+            return servizio_saturo()
+
+        filtri_attivi = (pitch, velocita, volume) != (0, 1.0, 0)
+
+        def pcm_in_uscita(formato, pcm):
+            # Con i filtri ogni frase viene filtrata da sola: le frasi sono separate da silenzio
+            if not filtri_attivi:
+                return formato, pcm
+            return leggi_pcm(filtra_wav(componi_wav(formato, [pcm]), pitch, velocita, volume))
+
+        blocchi = None
+        try:
+            argomenti_voce = risolvi_voce(speaker, cartella_speaker, worker, indice)
+            blocchi = genera_blocchi(
+                testo, worker=worker, lingua=dati.get("language", LINGUA_PREDEFINITA), cache=cache, **argomenti_voce
+            )
+            # La prima frase viene sintetizzata e filtrata prima di rispondere, così gli errori
+            # hanno il loro codice HTTP invece di una risposta 200 vuota
+            _, _, formato, pcm = next(blocchi)
+            formato_uscita, pcm_primo = pcm_in_uscita(formato, pcm)
+            prima_frase_s = time.perf_counter() - inizio
+        except (ErroreSintesi, ErroreFiltri) as e:
+            if blocchi is not None:
+                blocchi.close()
+            rilascia()
+            return _errore(str(e), 503 if isinstance(e, ErroreSintesi) else 500)
+
+        def flusso():
+            try:
+                with metriche.traccia("sintesi", origine="api", speaker=speaker, caratteri=len(testo)) as traccia:
+                    # La traccia parte dall'arrivo della richiesta: la prima frase è già stata sintetizzata
+                    traccia.inizio = inizio
+                    traccia.imposta(profilo_cpu=(worker.descrizione_profilo() or {}).get("preset"))
+                    traccia.stadi["prima_frase"] = prima_frase_s
+                    n_bytes = len(pcm_primo)
+                    # Intestazione con dimensioni "sconosciute": il client può iniziare a riprodurre subito
+                    yield intestazione_wav(formato_uscita)
+                    yield bytes(pcm_primo)
+                    for _, _, formato, pcm in blocchi:
+                        silenzio = silenzio_pcm(formato_uscita, pausa_ms)
+                        pcm_uscita = pcm_in_uscita(formato, pcm)[1]
+                        n_bytes += len(silenzio) + len(pcm_uscita)
+                        yield silenzio
+                        yield bytes(pcm_uscita)
+                    traccia.audio_s = durata_secondi(formato_uscita, n_bytes)
+            except (ErroreSintesi, ErroreFiltri) as e:
+                app.logger.error("Sintesi interrotta durante lo streaming: %s", e)
+            finally:
+                blocchi.close()
+                rilascia()
+
+        risposta = Response(flusso(), mimetype="audio/wav")
+        # Rilascio anche se il client si disconnette prima che il generatore parta
+        risposta.call_on_close(rilascia)
+        return risposta
+
+    @app.post("/api/filter")
+    def filtra():
+        try:
+            pitch, velocita, volume = _parametri_filtri(request.args)
+        except (TypeError, ValueError) as e:
+            return _errore(f"Parametri non validi: {e}", 400)
+        dati_wav = request.get_data()
+        if dati_wav[:4] != b"RIFF":
+            return _errore("Il corpo della richiesta deve essere un file WAV.", 400)
+
+        rilascia = limite.acquisisci()
+        if rilascia is None:
+            return servizio_saturo()
+        try:
+            with metriche.traccia("filtri", origine="api", pitch=pitch, velocita=velocita, volume=volume) as traccia:
+                traccia.audio_s = durata_wav(dati_wav)
+                with traccia.stadio("filtri"):
+                    filtrato = filtra_wav(dati_wav, pitch, velocita, volume)
+        except ErroreFiltri as e:
+            return _errore(str(e), 500)
+        except (ErroreFormatoWav, CouldntDecodeError) as e:
+            return _errore(f"Audio non valido: {e}", 400)
+        finally:
+            rilascia()
+        return Response(bytes(filtrato), mimetype="audio/wav")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servizio HTTP di sintesi di NovaStudioVocale.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    argomenti = parser.parse_args()
+    crea_app().run(host=argomenti.host, port=argomenti.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,37 @@
 import os
-import subprocess
-from pydub import AudioSegment
+import logging
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import datetime
 import io
-import shutil
 import json
-import re
-
-st.write(f"KMP_DUPLICATE_LIB_OK nell'ambiente Streamlit: {os.environ.get('KMP_DUPLICATE_LIB_OK')}")
+import time
+import uuid
+
+from audio_wav import FormatoPCM, ErroreFormatoWav, componi_wav, durata_wav, regione_wav, silenzio_pcm
+from filtri_audio import filtra_wav, ErroreFiltri, FiltriAnnullati
+from cache_sintesi import ottieni_cache_condivisa
+from pronuncia import ottieni_motore_pronuncia
+from archivio_audio import ottieni_archivio_condiviso, id_render, AudioNonDisponibile
+from indice_speaker import ottieni_indice_condiviso, avvia_precalcolo_in_background
+from motore_tts import ottieni_worker_condiviso, ErroreSintesi
+from pipeline_sintesi import sintetizza_voce, PAUSA_TRA_FRASI_MS
+from documento_lungo import renderizza_documento, CARTELLA_DOCUMENTI
+from copione import analizza_copione, renderizza_copione, ErroreCopione, INTERVALLO_BATTUTE_MS
+from esportazione import esporta_audio, FORMATI_ESPORTAZIONE, BITRATE_PREDEFINITO_KBPS
+from lavori import ottieni_scheduler_condiviso, COMPLETATO, ANNULLATO, ERRORE
+from metriche import ottieni_metriche_condivise, registra_sorgenti_predefinite
+
+# Inizio del rerun: la durata dell'intero script viene registrata in fondo (vedi benchmark/bench_rerun.py)
+_inizio_rerun = time.perf_counter()
 
 # --- Configurazione e cartelle ---
 SPEAKER_DIR = "speaker_previews"
 OUTPUT_DIR = "filtered_output_audio"
-TEMP_PYDUB_OUTPUT_FOR_FFMPEG = "temp_pydub_for_ffmpeg_streamlit.wav"
-TEMP_FILTER_PREVIEW = "temp_filter_preview_streamlit.wav"
-TEMP_TTS_OUTPUT_WAV = "temp_tts_raw.wav"
-TEMP_INPUT_AUDIO_FOR_PYDUB = "temp_input_audio_for_pydub.wav"
+
+# Con NOVA_PRECALCOLA_SPEAKER=1 i condizionamenti di tutte le voci vengono calcolati all'avvio
+# (altrimenti al primo utilizzo di ogni voce)
+ENV_PRECALCOLA_SPEAKER = "NOVA_PRECALCOLA_SPEAKER"
 
 # Percorso al file del vocabolario JSON
 # ASSICURATI CHE QUESTO PERCORSO SIA CORRETTO PER IL TUO SISTEMA
@@ -24,104 +39,521 @@ VOCABOLARIO_JSON_PATH = "/Users/marioansaldi/NovaStudioVocale/vocabolario.json"
 # Testo predefinito per l'area di input
 DEFAULT_TTS_TEXT = "Benvenuti in NovaStudioVocale! Scrivi qui il testo che vuoi trasformare in voce."
 
-# Assicurati che le cartelle esistano
-os.makedirs(SPEAKER_DIR, exist_ok=True)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs("assets", exist_ok=True)
+LOGO_PATH = os.path.join("assets", "logo.png")
+# Numero di lavori mostrati nel pannello delle metriche
+LAVORI_NEL_PANNELLO = 10
+# Secondi di audio renderizzati dall'anteprima istantanea dei filtri (regione predefinita: l'inizio)
+DURATA_REGIONE_ANTEPRIMA_S = 10.0
+# Valori dei filtri senza effetto: (pitch, velocità, volume, taglio dei silenzi, loudness obiettivo)
+FILTRI_NEUTRI = (0, 1.0, 0, False, None)
+# Obiettivi proposti per la normalizzazione della loudness (LUFS)
+OBIETTIVI_LOUDNESS = {
+    None: "Nessuna (solo volume)",
+    -14.0: "-14 LUFS (streaming musicale)",
+    -16.0: "-16 LUFS (podcast, voce)",
+    -19.0: "-19 LUFS (podcast mono)",
+    -23.0: "-23 LUFS (EBU R128, broadcast)",
+}
+
+# Sezioni che vengono rieseguite da sole quando cambiano i loro widget (st.fragment, Streamlit >= 1.37);
+# con versioni precedenti si ripiega sul rerun completo dello script
+_frammento = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda funzione: funzione)
+
+
+def _frammento_periodico(intervallo_s):
+    """Frammento rieseguito ogni `intervallo_s` secondi (per seguire un lavoro senza bloccare lo script)."""
+    frammento = getattr(st, "fragment", None)
+    if frammento is None:
+        return lambda funzione: funzione
+    return frammento(run_every=intervallo_s)
+
+
+# --- Risorse caricate una sola volta ---
+# Streamlit riesegue l'intero script a ogni interazione: cartelle, servizi condivisi e file
+# statici vengono preparati una volta (st.cache_resource / st.cache_data) e ricaricati solo
+# quando il file corrispondente cambia (mtime e dimensione fanno parte della chiave di cache).
+@st.cache_resource(show_spinner=False)
+def inizializza_servizi():
+    """Cartelle di lavoro, servizi condivisi e sorgenti delle metriche: una volta per processo."""
+    for cartella in (SPEAKER_DIR, OUTPUT_DIR, CARTELLA_DOCUMENTI, "assets"):
+        os.makedirs(cartella, exist_ok=True)
+    logging.getLogger(__name__).info("KMP_DUPLICATE_LIB_OK nell'ambiente Streamlit: %s", os.environ.get("KMP_DUPLICATE_LIB_OK"))
+    # Thread e affinità valgono nel processo worker, non in quello di Streamlit
+    logging.getLogger(__name__).info("Profilo CPU del worker TTS: %s", ottieni_worker_condiviso().descrizione_profilo())
+
+    # Metriche di tutte le sessioni: log JSON (NOVA_METRICHE_LOG) e file Prometheus (NOVA_METRICHE_PROM)
+    metriche = ottieni_metriche_condivise()
+    registra_sorgenti_predefinite(
+        metriche,
+        cache={"sintesi": ottieni_cache_condivisa(), "archivio": ottieni_archivio_condiviso()},
+        scheduler=ottieni_scheduler_condiviso(),
+        worker=ottieni_worker_condiviso(),
+    )
+    if os.environ.get(ENV_PRECALCOLA_SPEAKER) == "1":
+        avvia_precalcolo_in_background(ottieni_indice_condiviso(SPEAKER_DIR), ottieni_worker_condiviso())
+    return metriche
+
+
+def _versione_file(percorso):
+    """(mtime, dimensione) di un file, oppure None se non esiste: invalida le cache quando il file cambia."""
+    try:
+        stato = os.stat(percorso)
+    except OSError:
+        return None
+    return stato.st_mtime_ns, stato.st_size
+
+
+def _versione_cartella_speaker(cartella):
+    """Impronta di nomi, mtime e dimensioni dei WAV della cartella (un intero: costa poco da confrontare)."""
+    with os.scandir(cartella) as voci:
+        return hash(tuple(sorted(
+            (voce.name, voce.stat().st_mtime_ns, voce.stat().st_size) for voce in voci if voce.name.endswith(".wav")
+        )))
+
+
+@st.cache_data(show_spinner=False)
+def catalogo_speaker(cartella, versione):
+    """Voci e metadati dell'indice degli speaker, ricalcolati solo quando cambia `versione`."""
+    indice = ottieni_indice_condiviso(cartella)
+    return {nome: indice.info(nome) for nome in indice.elenco()}
 
-# --- Funzione di applicazione filtri ---
-def applica_filtri_audio(input_audio_bytes_or_path, output_path, pitch_semitoni=0, velocita_fattore=1.0, volume_db=0):
+
+@st.cache_data(show_spinner=False)
+def logo_ridimensionato(percorso, versione, larghezza):
     """
-    Applica filtri audio (pitch, velocità, volume) a un file audio.
-    input_audio_bytes_or_path può essere BytesIO o un percorso file.
+    Logo già ridimensionato a `larghezza` pixel (PNG): st.image non deve decodificare e
+    ridimensionare l'immagine originale a ogni rerun.
     """
+    from PIL import Image
+
+    with Image.open(percorso) as immagine:
+        if immagine.width > larghezza:
+            altezza = max(1, round(immagine.height * larghezza / immagine.width))
+            immagine = immagine.resize((larghezza, altezza), Image.LANCZOS)
+        uscita = io.BytesIO()
+        immagine.save(uscita, format="PNG")
+    return uscita.getvalue()
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def leggi_file_statico(percorso, versione):
+    """Contenuto di un file statico (logo, anteprime delle voci), riletto solo quando cambia `versione`."""
+    with open(percorso, "rb") as f:
+        return f.read()
+
+
+def _id_caricamento(file_caricato):
+    """Identifica un file caricato, per elaborarlo una sola volta anche se resta nel widget."""
+    return getattr(file_caricato, "file_id", None) or (file_caricato.name, file_caricato.size)
+
+
+# --- Render dei filtri ---
+def id_render_filtri(id_audio_base, filtri):
+    """Id nell'archivio del render di `id_audio_base` con i filtri `filtri` (vedi FILTRI_NEUTRI)."""
+    pitch_semitoni, velocita_fattore, volume_db, taglia_silenzi, loudness_lufs = filtri
+    return id_render(
+        id_audio_base, pitch_semitoni, velocita_fattore, volume_db, "wav",
+        taglia_silenzi=taglia_silenzi, loudness_lufs=loudness_lufs,
+    )
+
+
+def filtri_correnti():
+    """Valori correnti dei controlli dei filtri, nell'ordine di FILTRI_NEUTRI."""
+    return (
+        st.session_state.get("pitch_slider", 0), st.session_state.get("speed_slider", 1.0),
+        st.session_state.get("volume_slider", 0), st.session_state.get("trim_silence_checkbox", False),
+        st.session_state.get("loudness_target_select"),
+    )
+
+
+def descrizione_filtri(pitch_semitoni, velocita_fattore, volume_db, taglia_silenzi=False, loudness_lufs=None):
+    descrizione = f"Pitch: {pitch_semitoni} semitoni, Velocità: {velocita_fattore:.2f}x, Volume: {volume_db} dB"
+    if taglia_silenzi:
+        descrizione += ", silenzi tagliati"
+    if loudness_lufs is not None:
+        descrizione += f", loudness {loudness_lufs:g} LUFS"
+    return descrizione
+
+
+def _analisi_se_serve(id_audio, dati, taglia_silenzi, loudness_lufs):
+    """Analisi dell'audio (dalla cache, o calcolata su `dati`) se taglio o normalizzazione la richiedono."""
+    if not taglia_silenzi and loudness_lufs is None:
+        return None
+    # analisi_audio (e numpy) viene caricato solo quando un'analisi serve davvero
+    from analisi_audio import ottieni_cache_analisi_condivisa
+    return ottieni_cache_analisi_condivisa().ottieni(id_audio, dati)
+
+
+def analisi_audio_archivio(id_audio):
+    """Analisi (calcolata una volta per audio) di un audio dell'archivio, oppure None se non è disponibile."""
+    from analisi_audio import ottieni_cache_analisi_condivisa
     try:
-        # Pulisci i file temporanei prima di iniziare
-        if os.path.exists(TEMP_PYDUB_OUTPUT_FOR_FFMPEG):
-            os.remove(TEMP_PYDUB_OUTPUT_FOR_FFMPEG)
-        if os.path.exists(TEMP_INPUT_AUDIO_FOR_PYDUB):
-            os.remove(TEMP_INPUT_AUDIO_FOR_PYDUB)
-
-        # Carica l'audio usando pydub
-        if isinstance(input_audio_bytes_or_path, io.BytesIO):
-            # Se è BytesIO, salvalo temporaneamente per pydub
-            with open(TEMP_INPUT_AUDIO_FOR_PYDUB, "wb") as f:
-                f.write(input_audio_bytes_or_path.getvalue())
-            audio = AudioSegment.from_file(TEMP_INPUT_AUDIO_FOR_PYDUB)
-        elif isinstance(input_audio_bytes_or_path, str) and os.path.exists(input_audio_bytes_or_path):
-            audio = AudioSegment.from_file(input_audio_bytes_or_path)
-        else:
-            raise ValueError("Input audio non valido. Deve essere BytesIO o un percorso file esistente.")
-        
-        # Applica il volume con pydub (più semplice qui)
-        if volume_db != 0:
-            audio = audio + volume_db
-        
-        # Esporta l'audio modificato dal volume in un file temporaneo per ffmpeg
-        audio.export(TEMP_PYDUB_OUTPUT_FOR_FFMPEG, format="wav")
+        with ottieni_archivio_condiviso().mappa(id_audio) as dati:
+            return ottieni_cache_analisi_condivisa().ottieni(id_audio, dati)
+    except (AudioNonDisponibile, ErroreFormatoWav):
+        return None
 
-        filter_commands = []
-        
-        # Pitch (cambio di intonazione)
-        if pitch_semitoni != 0:
-            pitch_rate_factor = (2.0 ** (pitch_semitoni / 12.0))
-            new_sample_rate = int(audio.frame_rate * pitch_rate_factor)
-            filter_commands.append(f"asetrate={new_sample_rate},atempo={1/pitch_rate_factor}")
-
-        # Velocità (tempo)
-        if velocita_fattore != 1.0:
-            current_speed_factor = velocita_fattore
-            atempo_filters = []
-            
-            # FFmpeg atempo ha limiti di fattore, quindi applica in più passaggi se necessario
-            while current_speed_factor > 2.0:
-                atempo_filters.append("atempo=2.0")
-                current_speed_factor /= 2.0
-            while current_speed_factor < 0.5:
-                atempo_filters.append("atempo=0.5")
-                current_speed_factor /= 0.5 
-            if current_speed_factor != 1.0: # Aggiungi l'ultimo fattore rimanente
-                atempo_filters.append(f"atempo={current_speed_factor}")
-            
-            filter_commands.append(",".join(atempo_filters))
-
-        # Esegui FFmpeg solo se ci sono filtri da applicare
-        if filter_commands:
-            filter_string = ",".join(filter_commands)
-            ffmpeg_command = [
-                "ffmpeg", "-y", "-i", TEMP_PYDUB_OUTPUT_FOR_FFMPEG,
-                "-filter:a", filter_string,
-                output_path 
-            ]
-            
-            process = subprocess.run(ffmpeg_command, capture_output=True, text=True, check=False)
-            
-            if process.returncode != 0:
-                st.error(f"ERRORE FFmpeg (stdout): {process.stdout}")
-                st.error(f"ERRORE FFmpeg (stderr): {process.stderr}")
-                raise Exception(f"FFmpeg ha fallito con codice {process.returncode}: {process.stderr}")
-            
+
+def _filtra_annullabile(lavoro, dati_wav, *args, **kwargs):
+    """filtra_wav che termina ffmpeg appena viene chiesto l'annullamento del lavoro (LavoroAnnullato)."""
+    try:
+        return filtra_wav(dati_wav, *args, annullato=lambda: lavoro.annullamento_richiesto, **kwargs)
+    except FiltriAnnullati:
+        lavoro.verifica_annullamento()
+        raise
+
+
+def _lavoro_filtri(lavoro, id_audio_base, id_filtrato, pitch_semitoni, velocita_fattore, volume_db,
+                   taglia_silenzi=False, loudness_lufs=None):
+    """
+    Corpo del lavoro dei filtri: l'audio base viene letto dall'archivio tramite mmap (nessuna copia)
+    e il render viene archiviato con il suo id, anche se la sessione nel frattempo si è ricaricata.
+    """
+    archivio = ottieni_archivio_condiviso()
+    with metriche.traccia(
+        "filtri", lavoro=lavoro, pitch=pitch_semitoni, velocita=velocita_fattore, volume=volume_db,
+        taglio=taglia_silenzi, loudness=loudness_lufs,
+    ) as traccia:
+        with archivio.mappa(id_audio_base) as dati_ingresso:
+            traccia.audio_s = durata_wav(dati_ingresso)
+            with traccia.stadio("analisi"):
+                analisi = _analisi_se_serve(id_audio_base, dati_ingresso, taglia_silenzi, loudness_lufs)
+            # Un render superato da un nuovo movimento dei cursori si ferma prima e durante ffmpeg
+            lavoro.verifica_annullamento()
+            with traccia.stadio("filtri"):
+                dati_filtrati = _filtra_annullabile(
+                    lavoro, dati_ingresso, pitch_semitoni, velocita_fattore, volume_db,
+                    taglia_silenzi=taglia_silenzi, loudness_lufs=loudness_lufs, analisi=analisi,
+                )
+        # ...e non viene archiviato
+        lavoro.verifica_annullamento()
+        with traccia.stadio("archiviazione"):
+            archivio.aggiungi(dati_filtrati, sessione=lavoro.sessione, id_audio=id_filtrato)
+    return id_filtrato
+
+
+def attendi_lavoro(lavoro):
+    """Attende la fine di un lavoro mostrando la sua posizione finché resta in coda."""
+    stato_lavoro = st.empty()
+    while not lavoro.attendi(timeout=0.2):
+        posizione = lavoro.posizione
+        if posizione:
+            stato_lavoro.info(f"⏳ In coda: posizione {posizione}. Altri utenti stanno usando il server.")
         else:
-            # Se nessun filtro è applicato, copia semplicemente il file temporaneo all'output
-            shutil.copy(TEMP_PYDUB_OUTPUT_FOR_FFMPEG, output_path)
+            stato_lavoro.empty()
+    stato_lavoro.empty()
 
-        # Verifica che il file di output sia stato creato e non sia vuoto
-        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
-            raise Exception(f"Il file di output {output_path} non è stato creato correttamente o è vuoto.")
 
-        return True, "Filtri applicati con successo."
+def render_filtri_memoizzato(filtri):
+    """
+    Render filtrato dell'audio base corrente, condiviso tra "Anteprima" e "Salva Audio":
+    se gli stessi parametri sono già stati applicati allo stesso audio, il render dell'archivio
+    viene riutilizzato. Altrimenti il render è un lavoro dello scheduler condiviso (vedi lavori.py).
+    Restituisce (id nell'archivio, riutilizzato, messaggio).
+    """
+    archivio = ottieni_archivio_condiviso()
+    id_audio_base = st.session_state.base_audio
+    if filtri == FILTRI_NEUTRI:
+        # Nessun filtro: il render è l'audio base stesso
+        return id_audio_base, False, "Nessun filtro da applicare."
+    id_filtrato = id_render_filtri(id_audio_base, filtri)
+    if archivio.contiene(id_filtrato):
+        archivio.acquisisci(id_filtrato, st.session_state.session_id)
+        return id_filtrato, True, "Render riutilizzato."
+    lavoro = ottieni_scheduler_condiviso().invia(
+        "filtri", _lavoro_filtri, id_audio_base, id_filtrato, *filtri, sessione=st.session_state.session_id,
+    )
+    attendi_lavoro(lavoro)
+    if lavoro.stato == COMPLETATO:
+        return lavoro.risultato, False, "Filtri applicati con successo."
+    if isinstance(lavoro.errore, ErroreFiltri):
+        st.error(f"ERRORE FFmpeg: {lavoro.errore}")
+    return None, False, f"❌ Errore nell'applicazione filtri: {lavoro.errore or 'lavoro annullato'}"
+
+
+# --- Anteprima istantanea dei filtri ---
+# Appena un cursore cambia viene renderizzata solo una regione breve dell'audio base, che si
+# ascolta subito; il render completo parte in background e sostituisce l'anteprima quando è pronto.
+# I lavori superati da un nuovo movimento dei cursori vengono annullati.
+def _lavoro_anteprima_regione(lavoro, id_audio_base, id_regione, inizio_s, fine_s, pitch_semitoni, velocita_fattore,
+                              volume_db, taglia_silenzi=False, loudness_lufs=None):
+    """
+    Corpo del lavoro dell'anteprima istantanea: filtri sui soli secondi della regione scelta.
+    Taglio e normalizzazione usano l'analisi dell'audio intero: la regione parte dall'inizio
+    della voce e riceve lo stesso guadagno del render completo.
+    """
+    archivio = ottieni_archivio_condiviso()
+    with metriche.traccia(
+        "anteprima", lavoro=lavoro, pitch=pitch_semitoni, velocita=velocita_fattore, volume=volume_db,
+        taglio=taglia_silenzi, loudness=loudness_lufs,
+    ) as traccia:
+        with archivio.mappa(id_audio_base) as dati_base:
+            with traccia.stadio("analisi"):
+                analisi = _analisi_se_serve(id_audio_base, dati_base, taglia_silenzi, loudness_lufs)
+            if taglia_silenzi and analisi["voce"] is not None:
+                from analisi_audio import MARGINE_TAGLIO_MS
+                scostamento_s = max(0.0, analisi["voce"][0] - MARGINE_TAGLIO_MS / 1000.0)
+                inizio_s, fine_s = inizio_s + scostamento_s, min(fine_s + scostamento_s, analisi["voce"][1] + MARGINE_TAGLIO_MS / 1000.0)
+            with traccia.stadio("regione"):
+                regione = regione_wav(dati_base, inizio_s, fine_s)
+        if loudness_lufs is not None:
+            from analisi_audio import guadagno_normalizzazione
+            volume_db += guadagno_normalizzazione(analisi, loudness_lufs)
+        traccia.audio_s = durata_wav(regione)
+        lavoro.verifica_annullamento()
+        with traccia.stadio("filtri"):
+            dati_filtrati = _filtra_annullabile(lavoro, regione, pitch_semitoni, velocita_fattore, volume_db)
+        lavoro.verifica_annullamento()
+        with traccia.stadio("archiviazione"):
+            archivio.aggiungi(dati_filtrati, sessione=lavoro.sessione, id_audio=id_regione)
+    return id_regione
+
+
+def durata_audio(id_audio):
+    """Durata in secondi di un audio dell'archivio (letta dall'intestazione), oppure None."""
+    try:
+        with ottieni_archivio_condiviso().mappa(id_audio) as dati:
+            return durata_wav(dati)
+    except AudioNonDisponibile:
+        return None
+
+
+def imposta_anteprima_filtrata(id_audio, filtri):
+    """Registra un render completo come anteprima della sessione (riusato da "Salva"), rilasciando il precedente."""
+    archivio = ottieni_archivio_condiviso()
+    precedente = st.session_state.last_filtered_audio
+    if precedente not in (id_audio, st.session_state.base_audio):
+        archivio.rilascia(precedente, st.session_state.session_id)
+    try:
+        archivio.acquisisci(id_audio, st.session_state.session_id)
+    except AudioNonDisponibile:
+        return
+    st.session_state.last_filtered_audio = id_audio
+    st.session_state.last_applied_filters = dict(zip(("pitch", "speed", "volume", "trim", "loudness"), filtri))
+
+
+def aggiorna_anteprima_istantanea(filtri, regione, regione_intera):
+    """
+    Se cursori o regione sono cambiati dall'ultima esecuzione, annulla i lavori ormai superati e
+    mette in coda l'anteprima della regione e (solo se sono cambiati i filtri) il render completo.
+    Restituisce lo stato dell'anteprima della sessione.
+    """
+    archivio = ottieni_archivio_condiviso()
+    id_base = st.session_state.base_audio
+    sessione = st.session_state.session_id
+    stato = st.session_state.anteprima_istantanea
+    if stato is not None and (stato["base"], stato["filtri"], stato["regione"]) == (id_base, filtri, regione):
+        return stato
+
+    filtri_cambiati = stato is None or (stato["base"], stato["filtri"]) != (id_base, filtri)
+    if stato is not None:
+        # Un lavoro superato ancora in coda sparisce subito; uno già avviato termina il passo in corso
+        if stato["lavoro_regione"] is not None:
+            stato["lavoro_regione"].annulla()
+        archivio.rilascia(stato["id_regione"], sessione)
+        if filtri_cambiati and stato["lavoro_completo"] is not None:
+            stato["lavoro_completo"].annulla()
+
+    nuovo = {
+        "base": id_base, "filtri": filtri, "regione": regione, "id_regione": None, "lavoro_regione": None,
+        "id_completo": id_base, "lavoro_completo": None if filtri_cambiati else stato["lavoro_completo"],
+    }
+    if filtri != FILTRI_NEUTRI:
+        nuovo["id_completo"] = id_render_filtri(id_base, filtri)
+        scheduler = ottieni_scheduler_condiviso()
+        if not archivio.contiene(nuovo["id_completo"]):
+            if not regione_intera:
+                nuovo["id_regione"] = id_render_filtri(f"{id_base}@{regione[0]:.2f}-{regione[1]:.2f}", filtri)
+                if not archivio.contiene(nuovo["id_regione"]):
+                    nuovo["lavoro_regione"] = scheduler.invia(
+                        "anteprima", _lavoro_anteprima_regione, id_base, nuovo["id_regione"], *regione, *filtri, sessione=sessione
+                    )
+            if nuovo["lavoro_completo"] is None:
+                nuovo["lavoro_completo"] = scheduler.invia(
+                    "filtri", _lavoro_filtri, id_base, nuovo["id_completo"], *filtri, sessione=sessione
+                )
+    st.session_state.anteprima_istantanea = nuovo
+    return nuovo
+
 
-    except Exception as e:
-        # Pulisci i file temporanei in caso di errore
-        if os.path.exists(TEMP_FILTER_PREVIEW): os.remove(TEMP_FILTER_PREVIEW)
-        if os.path.exists(TEMP_PYDUB_OUTPUT_FOR_FFMPEG): os.remove(TEMP_PYDUB_OUTPUT_FOR_FFMPEG)
-        if os.path.exists(TEMP_INPUT_AUDIO_FOR_PYDUB): os.remove(TEMP_INPUT_AUDIO_FOR_PYDUB)
-        return False, f"❌ Errore nell'applicazione filtri: {e}"
+def mostra_anteprima_istantanea(stato):
+    """
+    Mostra il render completo se è pronto; altrimenti l'anteprima della regione appena disponibile,
+    sostituita dal render completo quando il lavoro in background termina. Un nuovo movimento dei
+    cursori interrompe l'attesa (Streamlit riesegue la sezione).
+    """
+    valori = descrizione_filtri(*stato["filtri"])
+    lavoro_regione, lavoro_completo = stato["lavoro_regione"], stato["lavoro_completo"]
+    segnaposto = st.empty()
+    stato_lavori = st.empty()
+
+    def mostra(id_audio, descrizione):
+        percorso = percorso_audio(id_audio) if id_audio else None
+        if percorso is not None:
+            with segnaposto.container():
+                st.markdown("#### Anteprima Audio Filtrato:")
+                st.markdown(f"**{descrizione}** · {valori}")
+                st.audio(percorso, format="audio/wav", start_time=0)
+        return percorso is not None
+
+    def mostra_completo():
+        if (lavoro_completo is None or lavoro_completo.stato == COMPLETATO) and mostra(stato["id_completo"], "Audio completo"):
+            imposta_anteprima_filtrata(stato["id_completo"], stato["filtri"])
+            return True
+        return False
+
+    if mostra_completo():
+        return
+    if lavoro_regione is not None:
+        while not lavoro_regione.attendi(timeout=0.1):
+            stato_lavori.caption("⚡ Anteprima della regione in preparazione...")
+    inizio_s, fine_s = stato["regione"]
+    mostra(stato["id_regione"], f"Anteprima {inizio_s:.1f}–{fine_s:.1f} s")
+
+    if lavoro_completo is not None:
+        while not lavoro_completo.attendi(timeout=0.25):
+            posizione = lavoro_completo.posizione
+            if posizione:
+                stato_lavori.caption(f"⏳ Render completo in coda: posizione {posizione}.")
+            else:
+                stato_lavori.caption("⏳ Render completo in corso: sostituirà l'anteprima appena pronto.")
+        stato_lavori.empty()
+        if not mostra_completo() and lavoro_completo.stato == ERRORE:
+            st.error(f"❌ Errore nell'applicazione filtri: {lavoro_completo.errore}")
+
+
+def mostra_analisi(analisi):
+    """Forma d'onda in miniatura e misure dell'audio (picco, RMS, loudness, silenzi ai bordi)."""
+    if analisi is None or not analisi["miniatura"]:
+        return
+    # Spec Vega-Lite diretta: st.area_chart ricostruisce e valida un grafico Altair a ogni rerun
+    passo_s = analisi["durata_s"] / len(analisi["miniatura"])
+    st.vega_lite_chart({
+        "data": {"values": [{"t": i * passo_s, "picco": picco} for i, picco in enumerate(analisi["miniatura"])]},
+        "mark": {"type": "area", "line": True, "opacity": 0.6},
+        "encoding": {
+            "x": {"field": "t", "type": "quantitative", "title": "secondi"},
+            "y": {"field": "picco", "type": "quantitative", "title": None},
+        },
+        "width": "container",
+        "height": 80,
+    })
+    misure = [
+        f"Picco {analisi['picco_db']:.1f} dBFS" if analisi["picco_db"] is not None else "Silenzio digitale",
+        f"RMS {analisi['rms_db']:.1f} dBFS" if analisi["rms_db"] is not None else None,
+        f"Loudness {analisi['loudness_lufs']:.1f} LUFS" if analisi["loudness_lufs"] is not None else None,
+    ]
+    if analisi["voce"] is not None:
+        inizio_voce_s, fine_voce_s = analisi["voce"]
+        misure.append(f"silenzio iniziale {inizio_voce_s:.2f} s, finale {analisi['durata_s'] - fine_voce_s:.2f} s")
+    st.caption(" · ".join(misura for misura in misure if misura))
+
+
+def _lavoro_analisi(lavoro, id_audio):
+    """Corpo del lavoro di analisi: il risultato resta anche nella cache delle analisi condivisa."""
+    return analisi_audio_archivio(id_audio)
+
+
+@_frammento_periodico(0.5)
+def segui_analisi():
+    """Attende l'analisi dell'audio base senza bloccare la pagina; al termine la mostra il rerun completo."""
+    if st.session_state.lavoro_analisi["lavoro"].finito:
+        st.rerun()
+    st.caption("📈 Analisi dell'audio in corso...")
+
+
+def mostra_analisi_audio_base():
+    """
+    Analisi dell'audio base: calcolata da un lavoro dello scheduler (una volta per audio),
+    così un audio lungo non rallenta i rerun della pagina.
+    """
+    id_audio = st.session_state.base_audio
+    stato = st.session_state.lavoro_analisi
+    if stato is None or stato["id"] != id_audio:
+        stato = st.session_state.lavoro_analisi = {
+            "id": id_audio,
+            "lavoro": ottieni_scheduler_condiviso().invia(
+                "analisi", _lavoro_analisi, id_audio, sessione=st.session_state.session_id,
+            ),
+        }
+    lavoro = stato["lavoro"]
+    if not lavoro.finito:
+        segui_analisi()
+    elif lavoro.stato == COMPLETATO:
+        mostra_analisi(lavoro.risultato)
+
+
+def imposta_audio_base(id_audio):
+    """
+    Imposta il nuovo audio base (id nell'archivio, già acquisito per la sessione, o None) e azzera
+    l'anteprima dei filtri, rilasciando gli audio che la sessione non usa più.
+    """
+    archivio = ottieni_archivio_condiviso()
+    for precedente in (st.session_state.base_audio, st.session_state.last_filtered_audio):
+        if precedente != id_audio:
+            archivio.rilascia(precedente, st.session_state.session_id)
+    st.session_state.base_audio = id_audio
+    st.session_state.last_filtered_audio = None
+    st.session_state.last_applied_filters = None
+    st.session_state.anteprima_istantanea = None
+
+
+def percorso_audio(id_audio):
+    """Percorso nell'archivio di un audio della sessione, oppure None se è stato eliminato."""
+    try:
+        return ottieni_archivio_condiviso().percorso(id_audio)
+    except AudioNonDisponibile:
+        return None
 
 # --- Funzione per generare audio da testo (TTS) con XTTS v2 ---
-def genera_audio_base_xtts(testo, speaker_name):
+def _lavoro_sintesi(lavoro, testo, speaker_name, pausa_ms):
     """
-    Genera un file audio da testo usando il modello XTTS v2 di Coqui-AI TTS.
+    Corpo del lavoro di sintesi, eseguito da un thread dello scheduler: niente chiamate a Streamlit,
+    l'avanzamento e la prima frase pronta vengono pubblicati in `lavoro.progresso`.
+    """
+    lavoro.progresso = {"frase": 0, "totale": None, "prima_frase": None}
+    with metriche.traccia("sintesi", lavoro=lavoro, speaker=speaker_name, caratteri=len(testo)) as traccia:
+        inizio = time.perf_counter()
+
+        def al_blocco(indice, totale, formato, pcm):
+            # L'annullamento ha effetto tra una frase e l'altra
+            lavoro.verifica_annullamento()
+            if indice == 0:
+                traccia.stadi["prima_frase"] = time.perf_counter() - inizio
+                if totale > 1:
+                    lavoro.progresso["prima_frase"] = componi_wav(formato, [pcm])
+            lavoro.progresso.update(frase=indice + 1, totale=totale)
+
+        # Il modello XTTS resta caricato nel worker persistente: nessun avvio del comando `tts` per click
+        worker = ottieni_worker_condiviso()
+        traccia.imposta(profilo_cpu=worker.descrizione_profilo()["preset"])
+        # Condizionamento XTTS precalcolato dall'indice degli speaker e frasi già sintetizzate
+        # riprese dalla cache su disco
+        cache = ottieni_cache_condivisa()
+        statistiche_prima = cache.statistiche()
+        with traccia.stadio("sintesi"):
+            wav_completo = sintetizza_voce(
+                testo, speaker_name, SPEAKER_DIR, worker, indice=ottieni_indice_condiviso(SPEAKER_DIR), cache=cache,
+                lingua="it", pausa_ms=pausa_ms, al_blocco=al_blocco, cartella_lavoro=lavoro.cartella,
+            )
+        statistiche_dopo = cache.statistiche()
+        traccia.audio_s = durata_wav(wav_completo)
+        # La sessione riceve solo l'id dell'audio: i byte restano nell'archivio su disco
+        with traccia.stadio("archiviazione"):
+            id_audio = ottieni_archivio_condiviso().aggiungi(wav_completo, sessione=lavoro.sessione)
+        risultato = {
+            "audio": id_audio,
+            "frasi_riusate": statistiche_dopo["hit"] - statistiche_prima["hit"],
+            "frasi_sintetizzate": statistiche_dopo["miss"] - statistiche_prima["miss"],
+        }
+        traccia.imposta(frasi_riusate=risultato["frasi_riusate"], frasi_sintetizzate=risultato["frasi_sintetizzate"])
+    return risultato
+
+
+def avvia_generazione_xtts(testo, speaker_name, pausa_ms=PAUSA_TRA_FRASI_MS):
+    """
+    Mette in coda la sintesi del testo con il modello XTTS v2 di Coqui-AI TTS (caricato una sola
+    volta nel worker persistente, vedi motore_tts.py). Il lavoro viene seguito da segui_generazione_xtts.
     """
     if not testo.strip():
         st.error("❌ Testo vuoto per la generazione vocale.")
@@ -132,48 +564,303 @@ def genera_audio_base_xtts(testo, speaker_name):
         st.error(f"❌ Voce dello speaker non trovata: {speaker_name}. Assicurati che il file '{speaker_name}.wav' sia nella cartella '{SPEAKER_DIR}'.")
         return None
 
-    if os.path.exists(TEMP_TTS_OUTPUT_WAV):
-        os.remove(TEMP_TTS_OUTPUT_WAV)
+    lavoro = ottieni_scheduler_condiviso().invia(
+        "sintesi", _lavoro_sintesi, testo, speaker_name, pausa_ms, sessione=st.session_state.session_id
+    )
+    st.session_state.lavoro_sintesi = lavoro
+    return lavoro
 
-    tts_command = [
-        "tts",
-        "--model_name", "tts_models/multilingual/multi-dataset/xtts_v2",
-        "--text", testo,
-        "--speaker_wav", speaker_path,
-        "--language_idx", "it",
-        "--out_path", TEMP_TTS_OUTPUT_WAV
-    ]
 
-    try:
-        process = subprocess.run(tts_command, check=True, capture_output=True, text=True)
-        
-        if not os.path.exists(TEMP_TTS_OUTPUT_WAV):
-            raise Exception(f"Il file di output TTS '{TEMP_TTS_OUTPUT_WAV}' non è stato creato da tts.")
-        
-        file_size = os.path.getsize(TEMP_TTS_OUTPUT_WAV)
-        if file_size == 0:
-            raise Exception(f"Il file di output TTS '{TEMP_TTS_OUTPUT_WAV}' è vuoto (dimensione 0 bytes).")
-            
-        with open(TEMP_TTS_OUTPUT_WAV, "rb") as f:
-            audio_bytes = io.BytesIO(f.read())
-        audio_bytes.seek(0) # Riporta il "puntatore" all'inizio del BytesIO
-        
-        os.remove(TEMP_TTS_OUTPUT_WAV) # Pulisci il file temporaneo
-        
+def segui_generazione_xtts(anteprima_placeholder=None):
+    """
+    Segue il lavoro di sintesi della sessione: posizione in coda, avanzamento frase per frase e
+    prima frase ascoltabile in `anteprima_placeholder` appena pronta. Al termine imposta l'audio base.
+    Il lavoro sopravvive ai rerun: se la pagina si ricarica, viene ripreso da qui.
+    """
+    lavoro = st.session_state.lavoro_sintesi
+    if lavoro is None:
+        return
+    if not lavoro.finito and st.button("⏹️ Annulla generazione", key="cancel_tts_button"):
+        lavoro.annulla()
+
+    stato_lavoro = st.empty()
+    prima_frase_mostrata = False
+    while not lavoro.attendi(timeout=0.25):
+        posizione = lavoro.posizione
+        progresso = lavoro.progresso
+        if lavoro.annullamento_richiesto:
+            stato_lavoro.info("Annullamento in corso: la frase in sintesi viene completata...")
+        elif posizione:
+            stato_lavoro.info(f"⏳ In coda: posizione {posizione}. Altri utenti stanno generando audio.")
+        elif progresso and progresso["totale"]:
+            stato_lavoro.progress(
+                progresso["frase"] / progresso["totale"], text=f"Frase {progresso['frase']} di {progresso['totale']} pronta"
+            )
+        else:
+            stato_lavoro.progress(0.0, text="Sintesi della prima frase...")
+        if not prima_frase_mostrata and anteprima_placeholder is not None and progresso and progresso["prima_frase"]:
+            # Time-to-first-audio: la prima frase si può ascoltare mentre le altre vengono sintetizzate
+            with anteprima_placeholder.container():
+                st.markdown("**Prima frase pronta:**")
+                st.audio(progresso["prima_frase"], format="audio/wav", start_time=0)
+            prima_frase_mostrata = True
+
+    stato_lavoro.empty()
+    if anteprima_placeholder is not None:
+        anteprima_placeholder.empty()
+    st.session_state.lavoro_sintesi = None
+
+    if lavoro.stato == COMPLETATO:
+        risultato = lavoro.risultato
+        imposta_audio_base(risultato["audio"])
         st.success("✔️ Testo convertito in voce con successo.")
-        return audio_bytes
+        st.caption(f"Frasi riprese dalla cache: {risultato['frasi_riusate']} · frasi sintetizzate: {risultato['frasi_sintetizzate']}")
+        st.info("Audio generato! Puoi ascoltarlo nella sezione 'Audio Base' qui sotto o applicare i filtri.")
+    elif lavoro.stato == ANNULLATO:
+        st.warning("Generazione annullata.")
+    else:
+        if isinstance(lavoro.errore, ErroreSintesi):
+            st.error(f"❌ Errore grave nel worker TTS:\n{lavoro.errore}")
+            st.warning("Verifica che il modello XTTS v2 sia scaricato e funzionante correttamente (`tts --list_models` dovrebbe mostrare 'xtts_v2').")
+        else:
+            st.error(f"❌ Errore imprevisto durante la generazione audio base: {lavoro.errore}")
+            st.warning("Assicurati che Coqui-AI TTS sia correttamente installato nel tuo ambiente conda. Potrebbe essere un problema di dipendenze (es. PyTorch).")
+        st.error("Impossibile generare la voce. Controlla i messaggi di errore sopra e le installazioni Coqui-AI TTS/ffmpeg.")
+
+
+# --- Documenti lunghi (audiolibri) ---
+def _lavoro_documento(lavoro, percorso_testo, percorso_uscita, speaker_name, pausa_ms, pitch_semitoni, velocita_fattore, volume_db,
+                      taglia_silenzi=False, loudness_lufs=None):
+    """
+    Corpo del lavoro di un documento lungo: l'audio va direttamente su disco paragrafo per
+    paragrafo (vedi documento_lungo.py), quindi la memoria resta costante e un render
+    annullato o interrotto riprende dall'ultimo paragrafo completato.
+    """
+    lavoro.progresso = {"paragrafo": 0, "totale": None}
+    with metriche.traccia("documento", lavoro=lavoro, speaker=speaker_name) as traccia:
+        def al_paragrafo(completati, totale):
+            lavoro.progresso.update(paragrafo=completati, totale=totale)
+            # L'annullamento ha effetto tra un paragrafo e l'altro e lascia il punto di ripresa
+            lavoro.verifica_annullamento()
+
+        with traccia.stadio("render"):
+            risultato = renderizza_documento(
+                percorso_testo, percorso_uscita, speaker_name, SPEAKER_DIR, ottieni_worker_condiviso(),
+                indice=ottieni_indice_condiviso(SPEAKER_DIR), cache=ottieni_cache_condivisa(), lingua="it",
+                pausa_ms=pausa_ms, pitch_semitoni=pitch_semitoni, velocita_fattore=velocita_fattore,
+                volume_db=volume_db, taglia_silenzi=taglia_silenzi, loudness_lufs=loudness_lufs,
+                al_paragrafo=al_paragrafo, cartella_lavoro=lavoro.cartella,
+            )
+        traccia.audio_s = risultato["durata_s"]
+        traccia.imposta(paragrafi=risultato["paragrafi"], paragrafi_ripresi=risultato["paragrafi_ripresi"])
+    return risultato
+
+
+def segui_documento_lungo():
+    """Segue il render del documento lungo della sessione: posizione in coda e paragrafi completati."""
+    lavoro = st.session_state.lavoro_documento
+    if lavoro is None:
+        return
+    if not lavoro.finito and st.button("⏹️ Interrompi (si potrà riprendere)", key="cancel_document_button"):
+        lavoro.annulla()
+
+    stato_lavoro = st.empty()
+    while not lavoro.attendi(timeout=0.5):
+        posizione = lavoro.posizione
+        progresso = lavoro.progresso
+        if lavoro.annullamento_richiesto:
+            stato_lavoro.info("Interruzione in corso: il paragrafo in sintesi viene completato e salvato...")
+        elif posizione:
+            stato_lavoro.info(f"⏳ In coda: posizione {posizione}. Altri utenti stanno generando audio.")
+        elif progresso and progresso["totale"]:
+            stato_lavoro.progress(
+                progresso["paragrafo"] / progresso["totale"],
+                text=f"Paragrafo {progresso['paragrafo']} di {progresso['totale']} salvato su disco",
+            )
+        else:
+            stato_lavoro.progress(0.0, text="Sintesi del primo paragrafo...")
+
+    stato_lavoro.empty()
+    st.session_state.lavoro_documento = None
+    if lavoro.stato == COMPLETATO:
+        risultato = lavoro.risultato
+        st.success(f"✔️ Documento salvato in: {risultato['percorso']} ({risultato['durata_s'] / 60:.1f} minuti di audio)")
+        if risultato["paragrafi_ripresi"]:
+            st.info(f"♻️ Ripreso da un render interrotto: {risultato['paragrafi_ripresi']} paragrafi su {risultato['paragrafi']} erano già pronti.")
+    elif lavoro.stato == ANNULLATO:
+        completati = (lavoro.progresso or {}).get("paragrafo", 0)
+        st.warning(f"Render interrotto dopo {completati} paragrafi: riavvialo con lo stesso file e lo stesso nome per riprendere da lì.")
+    else:
+        st.error(f"❌ Errore durante il render del documento: {lavoro.errore}")
+        st.info("I paragrafi già completati restano salvati: riavviando il render si riprende dal primo mancante.")
+
+
+# --- Copioni a più voci ---
+def _lavoro_copione(lavoro, copione, pausa_ms, intervallo_ms):
+    """
+    Corpo del lavoro di un copione a più voci (vedi copione.py): le frasi vengono sintetizzate
+    raggruppate per voce, le battute montate in ordine in un solo WAV che diventa l'audio base.
+    """
+    lavoro.progresso = {"battuta": 0, "totale": len(copione.battute)}
+    with metriche.traccia("copione", lavoro=lavoro, battute=len(copione.battute), voci=len(copione.voci)) as traccia:
+        def al_progresso(completate, totale):
+            lavoro.progresso.update(battuta=completate, totale=totale)
+            # L'annullamento ha effetto tra una battuta e l'altra
+            lavoro.verifica_annullamento()
+
+        percorso_copione = os.path.join(lavoro.cartella, "copione.wav")
+        with traccia.stadio("render"):
+            risultato = renderizza_copione(
+                copione, percorso_copione, SPEAKER_DIR, ottieni_worker_condiviso(),
+                indice=ottieni_indice_condiviso(SPEAKER_DIR), cache=ottieni_cache_condivisa(), lingua="it",
+                pausa_ms=pausa_ms, intervallo_ms=intervallo_ms, al_progresso=al_progresso,
+                cartella_lavoro=lavoro.cartella,
+            )
+        traccia.audio_s = risultato["durata_s"]
+        traccia.imposta(frasi=risultato["frasi"], frasi_ripetute=risultato["frasi_ripetute"])
+        with traccia.stadio("archiviazione"):
+            with open(percorso_copione, "rb") as f:
+                risultato["audio"] = ottieni_archivio_condiviso().aggiungi(f.read(), sessione=lavoro.sessione)
+    return risultato
+
+
+def segui_copione():
+    """Segue il render del copione della sessione; al termine il copione diventa l'audio base."""
+    lavoro = st.session_state.lavoro_copione
+    if lavoro is None:
+        return
+    if not lavoro.finito and st.button("⏹️ Annulla copione", key="cancel_script_button"):
+        lavoro.annulla()
+
+    stato_lavoro = st.empty()
+    while not lavoro.attendi(timeout=0.5):
+        posizione = lavoro.posizione
+        progresso = lavoro.progresso
+        if lavoro.annullamento_richiesto:
+            stato_lavoro.info("Annullamento in corso: la battuta in montaggio viene completata...")
+        elif posizione:
+            stato_lavoro.info(f"⏳ In coda: posizione {posizione}. Altri utenti stanno generando audio.")
+        elif progresso and progresso["battuta"]:
+            stato_lavoro.progress(
+                progresso["battuta"] / progresso["totale"],
+                text=f"Battuta {progresso['battuta']} di {progresso['totale']} montata",
+            )
+        else:
+            stato_lavoro.progress(0.0, text="Sintesi delle frasi, raggruppate per voce...")
+
+    stato_lavoro.empty()
+    st.session_state.lavoro_copione = None
+    if lavoro.stato == COMPLETATO:
+        risultato = lavoro.risultato
+        imposta_audio_base(risultato["audio"])
+        st.success(
+            f"✔️ Copione generato: {risultato['battute']} battute con {risultato['voci']} voci "
+            f"({risultato['durata_s']:.1f} s di audio)."
+        )
+        if risultato["frasi_ripetute"]:
+            st.caption(f"Frasi ripetute sintetizzate una sola volta: {risultato['frasi_ripetute']}")
+        st.info("Il copione è ora l'audio base: puoi ascoltarlo qui sotto, applicare i filtri e salvarlo o esportarlo.")
+    elif lavoro.stato == ANNULLATO:
+        st.warning("Generazione del copione annullata.")
+    else:
+        st.error(f"❌ Errore durante la generazione del copione: {lavoro.errore}")
+
+
+# --- Esportazione in più formati ---
+def _lavoro_esportazione(lavoro, id_ingresso, nome_base, formati, filtri, bitrate_kbps, frequenza):
+    """Corpo del lavoro di esportazione: una sola passata di filtri e tutti i formati (vedi esportazione.py)."""
+    archivio = ottieni_archivio_condiviso()
+    pitch_semitoni, velocita_fattore, volume_db, taglia_silenzi, loudness_lufs = filtri
+    with metriche.traccia("esportazione", lavoro=lavoro, formati=",".join(formati)) as traccia:
+        with archivio.mappa(id_ingresso) as dati_ingresso:
+            traccia.audio_s = durata_wav(dati_ingresso)
+            with traccia.stadio("analisi"):
+                analisi = _analisi_se_serve(id_ingresso, dati_ingresso, taglia_silenzi, loudness_lufs)
+        with traccia.stadio("codifica"):
+            return esporta_audio(
+                archivio.percorso(id_ingresso), OUTPUT_DIR, nome_base, formati, pitch_semitoni, velocita_fattore,
+                volume_db, bitrate_kbps=bitrate_kbps, frequenza=frequenza,
+                taglia_silenzi=taglia_silenzi, loudness_lufs=loudness_lufs, analisi=analisi,
+            )
+
+
+def avvia_esportazione(nome_base, formati, bitrate_kbps, frequenza):
+    """
+    Mette in coda l'esportazione dell'audio base con i valori correnti dei filtri e torna subito.
+    Se l'anteprima con gli stessi valori è già nell'archivio, si esporta quella senza rifare i filtri.
+    """
+    archivio = ottieni_archivio_condiviso()
+    filtri = filtri_correnti()
+    id_ingresso, render_riutilizzato = st.session_state.base_audio, False
+    if filtri != FILTRI_NEUTRI and archivio.contiene(id_render_filtri(id_ingresso, filtri)):
+        id_ingresso, filtri, render_riutilizzato = id_render_filtri(id_ingresso, filtri), FILTRI_NEUTRI, True
+    lavoro = ottieni_scheduler_condiviso().invia(
+        "esportazione", _lavoro_esportazione, id_ingresso, nome_base, formati, filtri, bitrate_kbps, frequenza,
+        sessione=st.session_state.session_id,
+    )
+    st.session_state.lavoro_esportazione = {"lavoro": lavoro, "render_riutilizzato": render_riutilizzato}
+
+
+def _leggi_file(percorso):
+    with open(percorso, "rb") as f:
+        return f.read()
+
+
+def pulsante_scaricamento(etichetta, percorso, mime, key):
+    """
+    Pulsante per scaricare un file su disco: il file viene letto solo al click (Streamlit recenti),
+    non a ogni rerun; con versioni precedenti si ripiega sulla lettura immediata.
+    """
+    try:
+        st.download_button(etichetta, data=lambda: _leggi_file(percorso), file_name=os.path.basename(percorso), mime=mime, key=key)
+    except StreamlitAPIException:
+        st.download_button(etichetta, data=_leggi_file(percorso), file_name=os.path.basename(percorso), mime=mime, key=key)
+
+
+@_frammento_periodico(1)
+def segui_esportazione():
+    """Stato dell'esportazione in corso, aggiornato ogni secondo senza rieseguire l'intera pagina."""
+    lavoro = st.session_state.lavoro_esportazione["lavoro"]
+    if lavoro.finito:
+        # Risultato e pulsanti di scaricamento vengono mostrati dal rerun completo
+        st.rerun()
+    posizione = lavoro.posizione
+    if posizione:
+        st.info(f"⏳ Esportazione in coda: posizione {posizione}.")
+    else:
+        st.info("⏳ Codifica in corso: puoi continuare a usare l'app, i file appariranno qui.")
+    if st.button("⏹️ Annulla esportazione", key="cancel_export_button"):
+        lavoro.annulla()
+    if not hasattr(st, "fragment"):
+        # Senza frammenti periodici lo stato si aggiorna a ogni rerun
+        st.button("🔄 Aggiorna stato", key="refresh_export_button")
+
+
+def mostra_esportazione():
+    """Esito dell'ultima esportazione della sessione, con un pulsante di scaricamento per ogni formato."""
+    stato = st.session_state.lavoro_esportazione
+    if stato is None:
+        return
+    lavoro = stato["lavoro"]
+    if not lavoro.finito:
+        segui_esportazione()
+        return
+    if lavoro.stato == COMPLETATO:
+        st.success("✔️ Audio salvato in: " + ", ".join(lavoro.risultato.values()))
+        if stato["render_riutilizzato"]:
+            st.info("♻️ Esportato il render dell'anteprima: nessuna nuova elaborazione dei filtri.")
+        colonne = st.columns(len(lavoro.risultato))
+        for colonna, (formato, percorso) in zip(colonne, lavoro.risultato.items()):
+            with colonna:
+                pulsante_scaricamento(
+                    f"Scarica {FORMATI_ESPORTAZIONE[formato]['nome']}", percorso,
+                    FORMATI_ESPORTAZIONE[formato]["mime"], key=f"download_button_{formato}",
+                )
+    elif lavoro.stato == ANNULLATO:
+        st.warning("Esportazione annullata.")
+    else:
+        st.error(f"❌ Errore durante il salvataggio: {lavoro.errore}")
 
-    except subprocess.CalledProcessError as e:
-        error_output = e.stderr if e.stderr else "Nessun output di errore specifico."
-        st.error(f"❌ Errore grave nel comando TTS (codice {e.returncode}):\n{error_output}")
-        st.warning("Verifica che il modello XTTS v2 sia scaricato e funzionante correttamente (`tts --list_models` dovrebbe mostrare 'xtts_v2').")
-        if os.path.exists(TEMP_TTS_OUTPUT_WAV): os.remove(TEMP_TTS_OUTPUT_WAV)
-        return None
-    except Exception as e:
-        st.error(f"❌ Errore imprevisto durante la generazione audio base: {e}")
-        st.warning("Assicurati che Coqui-AI TTS sia correttamente installato e nel PATH del tuo ambiente conda. Potrebbe essere un problema di dipendenze (es. PyTorch).")
-        if os.path.exists(TEMP_TTS_OUTPUT_WAV): os.remove(TEMP_TTS_OUTPUT_WAV)
-        return None
 
 # --- Interfaccia Streamlit ---
 st.set_page_config(
@@ -182,6 +869,9 @@ st.set_page_config(
     layout="wide"
 )
 
+# Cartelle, worker, indice e cache: dopo set_page_config, che deve restare il primo comando Streamlit
+metriche = inizializza_servizi()
+
 # --- Inizializzazione Session State ---
 # Variabile per tenere traccia del testo nell'area di input
 if 'tts_text_input' not in st.session_state:
@@ -192,27 +882,59 @@ if 'tts_text_input' not in st.session_state:
 if 'text_area_key_counter' not in st.session_state:
     st.session_state.text_area_key_counter = 0
 
-# Variabile per l'audio base corrente (generato da TTS o caricato)
-if 'base_audio_bytes' not in st.session_state:
-    st.session_state.base_audio_bytes = None
+# Id nell'archivio audio dell'audio base corrente (generato da TTS o caricato): la sessione
+# conserva solo l'id, i byte restano su disco (vedi archivio_audio.py)
+if 'base_audio' not in st.session_state:
+    st.session_state.base_audio = None
 
-# Variabile per l'audio filtrato più recente (per l'anteprima)
-if 'last_filtered_audio_data' not in st.session_state:
-    st.session_state.last_filtered_audio_data = None
+# Id dell'audio filtrato più recente (per l'anteprima)
+if 'last_filtered_audio' not in st.session_state:
+    st.session_state.last_filtered_audio = None
 
 # Variabile per tenere traccia dei filtri applicati all'ultima anteprima
 if 'last_applied_filters' not in st.session_state:
     st.session_state.last_applied_filters = None
 
+# Identificativo della sessione per lo scheduler dei lavori condiviso tra le sessioni
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+# Lavoro di sintesi in coda o in esecuzione per questa sessione (vedi lavori.py)
+if 'lavoro_sintesi' not in st.session_state:
+    st.session_state.lavoro_sintesi = None
+
+# La sessione è ancora aperta: i suoi audio non vanno considerati abbandonati
+ottieni_archivio_condiviso().tocca_sessione(st.session_state.session_id)
+
+# Anteprima istantanea dei filtri: valori, regione, lavori in corso e id dei render nell'archivio
+if 'anteprima_istantanea' not in st.session_state:
+    st.session_state.anteprima_istantanea = None
+
+# Ultima esportazione della sessione: lavoro e se riusa il render dell'anteprima
+if 'lavoro_esportazione' not in st.session_state:
+    st.session_state.lavoro_esportazione = None
+
+# Render del documento lungo in coda o in esecuzione per questa sessione
+if 'lavoro_documento' not in st.session_state:
+    st.session_state.lavoro_documento = None
+
+# Render del copione a più voci in coda o in esecuzione per questa sessione
+if 'lavoro_copione' not in st.session_state:
+    st.session_state.lavoro_copione = None
+
+# Analisi dell'audio base della sessione: id dell'audio e lavoro che la calcola
+if 'lavoro_analisi' not in st.session_state:
+    st.session_state.lavoro_analisi = None
+
 # --- Header e Logo ---
 col_logo, col_title = st.columns([1, 4])
 
 with col_logo:
-    logo_path = os.path.join("assets", "logo.png")
-    if os.path.exists(logo_path): 
-        st.image(logo_path, width=110) 
+    versione_logo = _versione_file(LOGO_PATH)
+    if versione_logo is not None:
+        st.image(logo_ridimensionato(LOGO_PATH, versione_logo, 110), width=110)
     else:
-        st.warning(f"Logo '{logo_path}' non trovato. Assicurati che il file sia lì.")
+        st.warning(f"Logo '{LOGO_PATH}' non trovato. Assicurati che il file sia lì.")
 
 
 with col_title:
@@ -224,14 +946,18 @@ st.markdown("---")
 # --- Selezione Voce Speaker e Generazione Audio ---
 st.header("🗣️ Generazione Vocale da Testo")
 
-speaker_list = [f.replace(".wav", "") for f in os.listdir(SPEAKER_DIR) if f.endswith(".wav")]
+# Le voci vengono lette dall'indice degli speaker (metadati e condizionamenti precalcolati),
+# una sola volta finché i file della cartella non cambiano
+catalogo_voci = catalogo_speaker(SPEAKER_DIR, _versione_cartella_speaker(SPEAKER_DIR))
 
-if not speaker_list:
+if not catalogo_voci:
     # Crea un dummy speaker se non ci sono voci per evitare errori
     dummy_speaker_path = os.path.join(SPEAKER_DIR, "dummy_speaker.wav")
     if not os.path.exists(dummy_speaker_path):
-        AudioSegment.silent(duration=1000).export(dummy_speaker_path, format="wav")
-    speaker_list.append("dummy_speaker")
+        formato_dummy = FormatoPCM(canali=1, larghezza=2, frequenza=24000)
+        with open(dummy_speaker_path, "wb") as f:
+            f.write(componi_wav(formato_dummy, [silenzio_pcm(formato_dummy, 1000)]))
+    catalogo_voci = catalogo_speaker(SPEAKER_DIR, _versione_cartella_speaker(SPEAKER_DIR))
     st.warning(f"Nessuna voce trovata nella cartella '{SPEAKER_DIR}'. Creato 'dummy_speaker.wav' di esempio. Carica i tuoi file .wav per voci reali.")
 
 col_speaker_select, col_speaker_preview = st.columns([1, 1])
@@ -239,17 +965,21 @@ col_speaker_select, col_speaker_preview = st.columns([1, 1])
 with col_speaker_select:
     selected_speaker = st.selectbox(
         "Seleziona Voce Speaker:",
-        options=speaker_list,
-        index=0 if speaker_list else 0,
+        options=list(catalogo_voci),
+        index=0,
         help="Scegli una delle voci disponibili per la sintesi vocale."
     )
 
 with col_speaker_preview:
     if selected_speaker:
         speaker_audio_path = os.path.join(SPEAKER_DIR, f"{selected_speaker}.wav")
-        if os.path.exists(speaker_audio_path):
+        versione_anteprima = _versione_file(speaker_audio_path)
+        if versione_anteprima is not None:
             st.markdown(f"**Esempio Voce '{selected_speaker}':**")
-            st.audio(speaker_audio_path, format="audio/wav", start_time=0)
+            st.audio(leggi_file_statico(speaker_audio_path, versione_anteprima), format="audio/wav", start_time=0)
+            info_voce = catalogo_voci.get(selected_speaker)
+            if info_voce:
+                st.caption(f"Durata: {info_voce['durata_s']:.1f} s · {info_voce['frequenza']} Hz · {info_voce['canali']} canale/i")
         else:
             st.error("File audio speaker non trovato nel percorso specificato.")
 
@@ -260,7 +990,9 @@ with st.expander("Altre Opzioni di Input Testo"):
         type=["txt"],
         help="Carica un file contenente il testo da convertire. Il contenuto sovrascriverà l'area di testo."
     )
-    if text_upload_file is not None:
+    # Il file resta nel widget tra un rerun e l'altro: viene applicato una sola volta
+    if text_upload_file is not None and st.session_state.get("ultimo_testo_caricato") != _id_caricamento(text_upload_file):
+        st.session_state.ultimo_testo_caricato = _id_caricamento(text_upload_file)
         string_data = text_upload_file.getvalue().decode("utf-8")
         st.session_state.tts_text_input = string_data
         # IMPT: Incrementa il contatore per assicurare che il text_area si aggiorni
@@ -293,8 +1025,9 @@ with col_text_tools[0]:
     if st.button("Pausa Liturgica (. a ...)", help="Sostituisce i punti (.) con tre puntini (...) e rimuove i caratteri speciali come virgolette (', «, »).", key="liturgical_pause_button"):
         # `st.session_state.tts_text_input` contiene già il testo corrente grazie alla riga `st.session_state.tts_text_input = user_input_text`
         modified_text = st.session_state.tts_text_input 
-        modified_text = modified_text.replace(".", "...")
-        modified_text = modified_text.replace("«", "").replace("»", "").replace('"', '').replace("'", "")
+        with metriche.traccia("testo", strumento="pausa_liturgica", caratteri=len(modified_text)):
+            modified_text = modified_text.replace(".", "...")
+            modified_text = modified_text.replace("«", "").replace("»", "").replace('"', '').replace("'", "")
         st.session_state.tts_text_input = modified_text # Aggiorna la session state con il testo modificato
         # IMPT: Aggiorna contatore e reruns per tutti gli aggiornamenti programmatici del testo
         st.session_state.text_area_key_counter += 1
@@ -303,7 +1036,8 @@ with col_text_tools[0]:
 with col_text_tools[1]:
     if st.button("Punto a Capo", help="Aggiunge un ritorno a capo dopo ogni punto (.).", key="newline_after_dot_button"):
         modified_text = st.session_state.tts_text_input # Prendi il testo attualmente nell'area di input
-        modified_text = modified_text.replace(".", ".\n")
+        with metriche.traccia("testo", strumento="punto_a_capo", caratteri=len(modified_text)):
+            modified_text = modified_text.replace(".", ".\n")
         st.session_state.tts_text_input = modified_text # Aggiorna la session state con il testo modificato
         # IMPT: Aggiorna contatore e reruns per tutti gli aggiornamenti programmatici del testo
         st.session_state.text_area_key_counter += 1
@@ -317,25 +1051,15 @@ with col_text_tools[2]:
             st.error(f"❌ File vocabolario.json non trovato: {VOCABOLARIO_JSON_PATH}")
         else:
             try:
-                with open(VOCABOLARIO_JSON_PATH, "r", encoding="utf-8") as f:
-                    vocabolario_raw = json.load(f)
-                
-                vocabolario_for_replacement = {
-                    word_key: replacements[0] 
-                    for word_key, replacements in vocabolario_raw.items() 
-                    if isinstance(replacements, list) and len(replacements) > 0
-                }
-                # Ordina le parole da sostituire dalla più lunga alla più corta per evitare sostituzioni parziali
-                sorted_words = sorted(vocabolario_for_replacement.keys(), key=len, reverse=True)
-                
-                for word_to_replace in sorted_words:
-                    replacement_word = vocabolario_for_replacement[word_to_replace]
-                    # Usa regex per la sostituzione di parole intere (\b), case-sensitive
-                    # re.escape() è importante se la parola da cercare contiene caratteri speciali regex
-                    pattern = r'\b' + re.escape(word_to_replace) + r'\b'
-                    modified_text = re.sub(pattern, replacement_word, modified_text)
+                # Vocabolario compilato una volta in un'unica regex e ricaricato solo se il file cambia
+                with metriche.traccia("testo", strumento="pronuncia", caratteri=len(modified_text)) as traccia:
+                    motore_pronuncia = ottieni_motore_pronuncia(VOCABOLARIO_JSON_PATH)
+                    modified_text, applied_entries = motore_pronuncia.correggi(modified_text)
+                    traccia.imposta(sostituzioni=sum(applied_entries.values()))
                 
                 st.session_state.tts_text_input = modified_text # Aggiorna la session state con il testo modificato
+                # Le voci applicate vengono mostrate dopo il rerun
+                st.session_state.pronunciation_report = dict(applied_entries)
                 # IMPT: Aggiorna contatore e reruns per tutti gli aggiornamenti programmatici del testo
                 st.session_state.text_area_key_counter += 1
                 st.success("✔️ Pronuncia corretta usando il vocabolario.")
@@ -350,37 +1074,145 @@ with col_text_tools[3]:
         # Questo è l'unico punto in cui resettiamo esplicitamente al testo di benvenuto
         st.session_state.tts_text_input = DEFAULT_TTS_TEXT
         st.session_state.text_area_key_counter += 1 # Incrementa il contatore per cambiare la key del text_area
-        st.session_state.base_audio_bytes = None # Resetta anche l'audio generato
-        st.session_state.last_filtered_audio_data = None # Resetta l'anteprima dei filtri
-        st.session_state.last_applied_filters = None # Resetta i valori dei filtri applicati
+        imposta_audio_base(None) # Resetta anche l'audio generato, l'anteprima e i filtri applicati
         st.rerun() # Forza un rerun per applicare il reset
 
+# Resoconto dell'ultima correzione della pronuncia (mostrato una sola volta dopo il rerun)
+pronunciation_report = st.session_state.pop("pronunciation_report", None)
+if pronunciation_report is not None:
+    if pronunciation_report:
+        dettaglio = ", ".join(f"{parola} ×{volte}" for parola, volte in sorted(pronunciation_report.items()))
+        st.success(f"✔️ Pronuncia corretta usando il vocabolario: {sum(pronunciation_report.values())} sostituzioni ({dettaglio}).")
+    else:
+        st.info("Nessuna parola del vocabolario trovata nel testo.")
+
 st.markdown("---")
 
-col_generate_button, _ = st.columns([1, 2])
+col_generate_button, col_generate_options = st.columns([1, 2])
+
+with col_generate_options:
+    pausa_tra_frasi_ms = st.slider(
+        "Pausa tra le frasi (ms)",
+        min_value=0, max_value=2000, value=PAUSA_TRA_FRASI_MS, step=50,
+        key="sentence_pause_slider",
+        help="Silenzio inserito tra una frase e l'altra quando il testo viene sintetizzato a blocchi."
+    )
+    anteprima_prima_frase = st.empty()
 
 with col_generate_button:
     if st.button("✨ Genera Audio dalla Voce Selezionata", key="generate_tts_button", type="primary"):
-        if st.session_state.tts_text_input.strip() and selected_speaker:
-            with st.spinner("Generando voce... Potrebbe volerci del tempo per la prima volta."):
-                generated_audio_bytes = genera_audio_base_xtts(st.session_state.tts_text_input, selected_speaker)
-                if generated_audio_bytes:
-                    st.session_state.base_audio_bytes = generated_audio_bytes
-                    st.session_state.last_filtered_audio_data = None
-                    st.session_state.last_applied_filters = None
-                    st.info("Audio generato! Puoi ascoltarlo nella sezione 'Audio Base' qui sotto o applicare i filtri.")
-                else:
-                    st.error("Impossibile generare la voce. Controlla i messaggi di errore sopra e le installazioni Coqui-AI TTS/ffmpeg.")
+        if st.session_state.lavoro_sintesi is not None:
+            st.warning("C'è già una generazione in corso per questa sessione: attendi o annullala.")
+        elif st.session_state.tts_text_input.strip() and selected_speaker:
+            avvia_generazione_xtts(st.session_state.tts_text_input, selected_speaker, pausa_ms=pausa_tra_frasi_ms)
         else:
             st.warning("Per favore, inserisci del testo e seleziona una voce.")
+    # Ogni sessione ha il proprio lavoro di sintesi (con la propria cartella temporanea) sullo scheduler condiviso
+    segui_generazione_xtts(anteprima_placeholder=anteprima_prima_frase)
+
+with st.expander("📚 Documento Lungo (audiolibri)"):
+    st.markdown(
+        "Per testi molto lunghi: l'audio viene scritto direttamente su disco paragrafo per paragrafo, "
+        "senza passare dall'audio base. Se il render si interrompe, rilancialo con lo stesso file e lo "
+        "stesso nome per riprendere dall'ultimo paragrafo completato."
+    )
+    documento_caricato = st.file_uploader(
+        "Carica il documento (.txt, paragrafi separati da righe vuote)", type=["txt"], key="long_document_upload"
+    )
+    nome_documento = st.text_input(
+        "Nome file di output (senza estensione .wav)",
+        value=os.path.splitext(documento_caricato.name)[0] if documento_caricato is not None else "",
+        key="long_document_output_name",
+    )
+    applica_filtri_documento = st.checkbox(
+        "Applica i valori correnti dei filtri (pitch, velocità, volume, silenzi, loudness)", key="long_document_filters"
+    )
+    if st.button("📚 Genera Documento", key="generate_document_button"):
+        if st.session_state.lavoro_documento is not None:
+            st.warning("C'è già un documento in lavorazione per questa sessione: attendi o interrompilo.")
+        elif documento_caricato is None or not nome_documento.strip() or not selected_speaker:
+            st.warning("Carica un documento, scegli un nome per il file e seleziona una voce.")
+        else:
+            nome_file = os.path.basename(nome_documento.strip())
+            if nome_file.lower().endswith(".wav"):
+                nome_file = nome_file[:-4]
+            # Il testo resta su disco: il render lo rilegge un paragrafo alla volta
+            percorso_testo = os.path.join(CARTELLA_DOCUMENTI, f"{nome_file}.txt")
+            with open(percorso_testo, "wb") as f:
+                f.write(documento_caricato.getvalue())
+            filtri_documento = filtri_correnti() if applica_filtri_documento else FILTRI_NEUTRI
+            st.session_state.lavoro_documento = ottieni_scheduler_condiviso().invia(
+                "sintesi", _lavoro_documento, percorso_testo, os.path.join(OUTPUT_DIR, f"{nome_file}.wav"),
+                selected_speaker, pausa_tra_frasi_ms, *filtri_documento, sessione=st.session_state.session_id,
+            )
+    segui_documento_lungo()
+
+with st.expander("🎭 Copione a più voci (dialoghi, salmi responsoriali)"):
+    st.markdown(
+        "Ogni battuta inizia con il nome della voce seguito da due punti (`Ana_Florence: testo`); le righe "
+        "senza voce continuano la battuta precedente. Con `@voce Alias = Speaker pitch=-1 velocita=0.95 "
+        "volume=2 loudness=-16` si dà un nome a una voce con il suo preset di filtri, con `@pausa 1500` si "
+        "cambia il silenzio prima della battuta successiva; le righe che iniziano con `#` sono commenti."
+    )
+    testo_copione = st.text_area(
+        "Copione",
+        height=200,
+        key="script_text_area",
+        placeholder=(
+            "@voce Solista = Aaron_Dreschner\n@voce Assemblea = Ana_Florence volume=-2\n"
+            "Solista: Il Signore è il mio pastore: non manco di nulla.\nAssemblea: Il Signore è il mio pastore."
+        ),
+    )
+    intervallo_battute_ms = st.slider(
+        "Pausa tra le battute (ms)",
+        min_value=0, max_value=3000, value=INTERVALLO_BATTUTE_MS, step=50,
+        key="script_gap_slider",
+        help="Silenzio tra una battuta e la successiva, se il copione non indica un @pausa. Tra le frasi di una battuta vale la pausa tra le frasi.",
+    )
+    copione = None
+    if testo_copione.strip():
+        try:
+            copione = analizza_copione(testo_copione, catalogo_voci)
+        except ErroreCopione as e:
+            st.error(f"❌ {e}")
+    if copione is not None:
+        battute_per_voce = {}
+        for battuta in copione.battute:
+            battute_per_voce[battuta.voce] = battute_per_voce.get(battuta.voce, 0) + 1
+        st.dataframe(
+            [
+                {
+                    "Voce": voce.nome, "Speaker": voce.speaker, "Battute": battute_per_voce[voce.nome],
+                    "Pitch": voce.pitch, "Velocità": voce.velocita, "Volume (dB)": voce.volume,
+                    "Loudness (LUFS)": voce.loudness,
+                }
+                for voce in copione.voci.values()
+            ],
+            hide_index=True,
+        )
+    if st.button("🎭 Genera Copione", key="generate_script_button"):
+        if st.session_state.lavoro_copione is not None:
+            st.warning("C'è già un copione in lavorazione per questa sessione: attendi o annullalo.")
+        elif copione is None:
+            st.warning("Scrivi un copione valido: ogni battuta deve iniziare con una voce disponibile.")
+        else:
+            st.session_state.lavoro_copione = ottieni_scheduler_condiviso().invia(
+                "sintesi", _lavoro_copione, copione, pausa_tra_frasi_ms, intervallo_battute_ms,
+                sessione=st.session_state.session_id,
+            )
+    segui_copione()
 
 st.markdown("---")
 
 # --- Sezione Audio Base (Originale) ---
 st.header("🎵 Audio Base (Originale)")
-if st.session_state.base_audio_bytes is not None:
+if st.session_state.base_audio is not None and percorso_audio(st.session_state.base_audio) is None:
+    st.warning("L'audio base non è più disponibile (spazio dell'archivio esaurito): generalo o caricalo di nuovo.")
+    imposta_audio_base(None)
+if st.session_state.base_audio is not None:
     st.info("Questo è l'audio generato dal testo o caricato da file, prima di qualsiasi filtro.")
-    st.audio(st.session_state.base_audio_bytes, format="audio/wav", start_time=0)
+    st.audio(percorso_audio(st.session_state.base_audio), format="audio/wav", start_time=0)
+    mostra_analisi_audio_base()
 else:
     st.info("Genera un audio dal testo qui sopra o carica un file per vederlo apparire qui come 'audio base'.")
 
@@ -388,69 +1220,113 @@ st.markdown("---")
 
 # --- Sezione Filtri Audio ---
 st.header("🎚️ Applica Filtri Audio")
-st.markdown("Regola i cursori per modificare l'audio corrente. Clicca 'Applica Filtri' per generare l'anteprima.")
-
-col_sliders, col_preview_button = st.columns([1, 1])
-
-with col_sliders:
-    pitch_semitoni = st.slider(
-        "Pitch (Semitoni)",
-        min_value=-12, max_value=12, value=0, step=1,
-        key="pitch_slider",
-        help="Modifica la tonalità dell'audio senza alterare la velocità."
-    )
-    velocita_fattore = st.slider(
-        "Velocità (Fattore)",
-        min_value=0.25, max_value=4.0, value=1.0, step=0.05,
-        key="speed_slider",
-        help="Modifica la velocità di riproduzione. Il pitch rimane invariato."
-    )
-    volume_db = st.slider(
-        "Volume (dB)",
-        min_value=-20, max_value=20, value=0, step=1,
-        key="volume_slider",
-        help="Aumenta o diminuisce il volume generale dell'audio."
-    )
+st.markdown(
+    "Regola i cursori per modificare l'audio corrente: l'anteprima della regione scelta si aggiorna subito e il "
+    "render completo viene calcolato in background. Con l'anteprima istantanea disattivata, clicca "
+    "'Genera Render Completo'."
+)
 
-with col_preview_button:
-    if st.session_state.base_audio_bytes is None:
-        st.info("Genera un audio dal testo o carica un file per iniziare ad applicare i filtri.")
-    else:
-        if st.button("▶️ Applica Filtri e Genera Anteprima", key="apply_filters_button", type="secondary"):
-            with st.spinner("Applicando i filtri..."):
-                input_bytes_copy = io.BytesIO(st.session_state.base_audio_bytes.getvalue())
-                
-                success, message = applica_filtri_audio(
-                    input_bytes_copy, 
-                    TEMP_FILTER_PREVIEW, # output to temp file
-                    pitch_semitoni, velocita_fattore, volume_db
+# Sezione in un frammento: spostare i cursori o generare l'anteprima riesegue solo questa parte
+@_frammento
+def sezione_filtri():
+    col_sliders, col_preview_button = st.columns([1, 1])
+
+    with col_sliders:
+        pitch_semitoni = st.slider(
+            "Pitch (Semitoni)",
+            min_value=-12, max_value=12, value=0, step=1,
+            key="pitch_slider",
+            help="Modifica la tonalità dell'audio senza alterare la velocità."
+        )
+        velocita_fattore = st.slider(
+            "Velocità (Fattore)",
+            min_value=0.25, max_value=4.0, value=1.0, step=0.05,
+            key="speed_slider",
+            help="Modifica la velocità di riproduzione. Il pitch rimane invariato."
+        )
+        volume_db = st.slider(
+            "Volume (dB)",
+            min_value=-20, max_value=20, value=0, step=1,
+            key="volume_slider",
+            help="Aumenta o diminuisce il volume generale dell'audio."
+        )
+        taglia_silenzi = st.checkbox(
+            "✂️ Taglia i silenzi iniziali e finali",
+            key="trim_silence_checkbox",
+            help="Rimuove il silenzio prima e dopo la voce, lasciando un breve margine."
+        )
+        loudness_lufs = st.selectbox(
+            "🔊 Normalizza loudness",
+            options=list(OBIETTIVI_LOUDNESS),
+            format_func=OBIETTIVI_LOUDNESS.get,
+            key="loudness_target_select",
+            help="Porta la loudness integrata al valore scelto, senza far saturare i picchi. "
+                 "Il cursore del volume si aggiunge come correzione."
+        )
+        filtri = (pitch_semitoni, velocita_fattore, volume_db, taglia_silenzi, loudness_lufs)
+        anteprima_istantanea = st.toggle(
+            "⚡ Anteprima istantanea",
+            value=True,
+            key="instant_preview_toggle",
+            help="Ogni movimento dei cursori renderizza subito una breve regione dell'audio; il render completo "
+                 "viene calcolato in background e la sostituisce appena pronto."
+        )
+
+    with col_preview_button:
+        if st.session_state.base_audio is None:
+            st.info("Genera un audio dal testo o carica un file per iniziare ad applicare i filtri.")
+        elif anteprima_istantanea:
+            durata_base = durata_audio(st.session_state.base_audio) or 0.0
+            if durata_base > DURATA_REGIONE_ANTEPRIMA_S:
+                regione = st.slider(
+                    "Regione dell'anteprima (secondi)",
+                    min_value=0.0, max_value=round(durata_base, 1), value=(0.0, DURATA_REGIONE_ANTEPRIMA_S), step=0.5,
+                    # La chiave dipende dall'audio base: un audio più corto non eredita una regione fuori scala
+                    key=f"preview_region_slider_{st.session_state.base_audio[:12]}",
                 )
-
-                if success:
-                    st.session_state.last_filtered_audio_data = open(TEMP_FILTER_PREVIEW, "rb").read()
-                    # Salva i valori dei filtri applicati
-                    st.session_state.last_applied_filters = {
-                        "pitch": pitch_semitoni,
-                        "speed": velocita_fattore,
-                        "volume": volume_db
-                    }
-                    st.success("Filtri applicati. Premi play per ascoltare l'anteprima.")
-                    if os.path.exists(TEMP_FILTER_PREVIEW):
-                        os.remove(TEMP_FILTER_PREVIEW)
-                else:
-                    st.error(f"❌ Errore nell'applicazione filtri: {message}")
-                    st.session_state.last_filtered_data = None # Correggi da last_filtered_audio_data
-                    st.session_state.last_applied_filters = None
-        
-        if st.session_state.last_filtered_audio_data:
-            st.markdown("#### Anteprima Audio Filtrato:")
-            if st.session_state.last_applied_filters:
-                p = st.session_state.last_applied_filters['pitch']
-                v = st.session_state.last_applied_filters['speed']
-                vol = st.session_state.last_applied_filters['volume']
-                st.markdown(f"**Valori applicati:** Pitch: {p} semitoni, Velocità: {v:.2f}x, Volume: {vol} dB")
-            st.audio(st.session_state.last_filtered_audio_data, format="audio/wav", start_time=0)
-
+            else:
+                regione = (0.0, round(durata_base, 1))
+            regione_intera = regione[0] <= 0 and regione[1] >= round(durata_base, 1)
+            stato_anteprima = aggiorna_anteprima_istantanea(filtri, regione, regione_intera)
+            mostra_anteprima_istantanea(stato_anteprima)
+        else:
+            if st.button(
+                "▶️ Genera Render Completo", key="apply_filters_button", type="secondary",
+                help="Applica i filtri all'intero audio base: è il render usato da 'Salva' ed 'Esporta'.",
+            ):
+                with st.spinner("Applicando i filtri..."):
+                    # Filtri applicati sull'audio base mappato dall'archivio: nessuna copia in memoria
+                    filtered_audio, render_reused, message = render_filtri_memoizzato(filtri)
+
+                    if filtered_audio is not None:
+                        if st.session_state.last_filtered_audio not in (filtered_audio, st.session_state.base_audio):
+                            ottieni_archivio_condiviso().rilascia(st.session_state.last_filtered_audio, st.session_state.session_id)
+                        st.session_state.last_filtered_audio = filtered_audio
+                        # Salva i valori dei filtri applicati
+                        st.session_state.last_applied_filters = {
+                            "pitch": pitch_semitoni,
+                            "speed": velocita_fattore,
+                            "volume": volume_db,
+                            "trim": taglia_silenzi,
+                            "loudness": loudness_lufs
+                        }
+                        st.success("Render completo pronto. Premi play per ascoltarlo.")
+                        if render_reused:
+                            st.info("♻️ Render già calcolato con questi valori: riutilizzato senza rielaborare l'audio.")
+                    else:
+                        st.error(f"❌ Errore nell'applicazione filtri: {message}")
+                        st.session_state.last_filtered_audio = None
+                        st.session_state.last_applied_filters = None
+
+            percorso_anteprima = percorso_audio(st.session_state.last_filtered_audio) if st.session_state.last_filtered_audio else None
+            if percorso_anteprima:
+                st.markdown("#### Anteprima Audio Filtrato:")
+                if st.session_state.last_applied_filters:
+                    st.markdown(f"**Valori applicati:** {descrizione_filtri(*st.session_state.last_applied_filters.values())}")
+                st.audio(percorso_anteprima, format="audio/wav", start_time=0)
+
+
+sezione_filtri()
 
 # --- Sezione Carica Audio Esistente (per applicare filtri a file esterni) ---
 st.markdown("---")
@@ -462,11 +1338,11 @@ uploaded_file = st.file_uploader(
     help="Questo audio diventerà l'audio base su cui applicare i filtri."
 )
 
-if uploaded_file is not None:
-    st.session_state.base_audio_bytes = io.BytesIO(uploaded_file.read())
-    st.session_state.base_audio_bytes.seek(0)
-    st.session_state.last_filtered_audio_data = None
-    st.session_state.last_applied_filters = None
+# Il file resta nel widget tra un rerun e l'altro: diventa audio base una sola volta
+if uploaded_file is not None and st.session_state.get("ultimo_audio_caricato") != _id_caricamento(uploaded_file):
+    st.session_state.ultimo_audio_caricato = _id_caricamento(uploaded_file)
+    # Il file caricato va nell'archivio direttamente dal buffer del widget
+    imposta_audio_base(ottieni_archivio_condiviso().aggiungi(uploaded_file, sessione=st.session_state.session_id))
     # IMPT: Incrementa il contatore per assicurare che il text_area si aggiorni
     st.session_state.text_area_key_counter += 1 
     st.success(f"✔️ File '{uploaded_file.name}' caricato come base.")
@@ -478,43 +1354,101 @@ st.markdown("---")
 st.header("💾 Salva il tuo Audio Finale")
 
 output_filename_input = st.text_input(
-    "Nome file di output (senza estensione .wav)",
+    "Nome file di output (senza estensione)",
     value=f"audio_nova_studio_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}",
     key="output_filename_input"
 )
 
-if st.button("✔️ Salva Audio con Filtri nel Computer", key="save_final_audio_button", type="primary"):
-    if st.session_state.base_audio_bytes is not None:
-        if not output_filename_input.strip():
-            st.error("Per favor, inserisci un nome per il file di output.")
-        else:
-            final_output_path = os.path.join(OUTPUT_DIR, output_filename_input)
-            if not final_output_path.lower().endswith(".wav"):
-                final_output_path += ".wav"
-
-            with st.spinner(f"Salvataggio in corso di {os.path.basename(final_output_path)}..."):
-                input_bytes_copy = io.BytesIO(st.session_state.base_audio_bytes.getvalue())
+col_formati, col_bitrate, col_frequenza = st.columns([2, 1, 1])
+with col_formati:
+    formati_esportazione = st.multiselect(
+        "Formati",
+        options=list(FORMATI_ESPORTAZIONE),
+        default=["wav"],
+        format_func=lambda formato: FORMATI_ESPORTAZIONE[formato]["nome"],
+        key="export_formats",
+        help="Tutti i formati scelti vengono prodotti con una sola elaborazione dei filtri."
+    )
+with col_bitrate:
+    bitrate_esportazione = st.select_slider(
+        "Bitrate MP3/Opus (kbps)",
+        options=[64, 96, 128, 160, 192, 256, 320],
+        value=BITRATE_PREDEFINITO_KBPS,
+        key="export_bitrate"
+    )
+with col_frequenza:
+    frequenza_esportazione = st.selectbox(
+        "Frequenza di campionamento",
+        options=[None, 48000, 44100, 32000, 24000, 22050, 16000],
+        format_func=lambda frequenza: "Originale" if frequenza is None else f"{frequenza} Hz",
+        key="export_sample_rate",
+        help="Opus accetta solo 48000, 24000 e 16000 Hz tra queste frequenze (con 'Originale' ricampiona da sé)."
+    )
 
-                success, message = applica_filtri_audio(
-                    input_bytes_copy, 
-                    final_output_path,  
-                    pitch_semitoni, velocita_fattore, volume_db
-                )
-                if success:
-                    st.success(f"✔️ Audio salvato in: {final_output_path}")
-                    try:
-                        with open(final_output_path, "rb") as f:
-                            download_data = f.read()
-                        st.download_button(
-                            label="Scarica il file filtrato",
-                            data=download_data,
-                            file_name=os.path.basename(final_output_path),
-                            mime="audio/wav",
-                            key="download_button"
-                        )
-                    except Exception as e:
-                        st.error(f"Impossibile leggere il file per il download: {e}")
-                else:
-                    st.error(f"❌ Errore durante il salvataggio: {message}")
+if st.button("✔️ Salva Audio con Filtri nel Computer", key="save_final_audio_button", type="primary"):
+    nome_base = os.path.basename(output_filename_input.strip())
+    if nome_base.lower().endswith(".wav"):
+        nome_base = nome_base[:-4]
+    if st.session_state.base_audio is None:
+        st.warning("Per favor, genera o carica un audio prima di salvare.")
+    elif not nome_base:
+        st.error("Per favor, inserisci un nome per il file di output.")
+    elif not formati_esportazione:
+        st.error("Scegli almeno un formato di esportazione.")
+    elif st.session_state.lavoro_esportazione is not None and not st.session_state.lavoro_esportazione["lavoro"].finito:
+        st.warning("C'è già un'esportazione in corso per questa sessione: attendi o annullala.")
     else:
-        st.warning("Per favor, genera o carica un audio prima di salvare.")
\ No newline at end of file
+        avvia_esportazione(nome_base, formati_esportazione, bitrate_esportazione, frequenza_esportazione)
+
+mostra_esportazione()
+
+
+# --- Pannello Metriche (barra laterale) ---
+# In fondo allo script, così include anche i lavori conclusi durante questo rerun
+with st.sidebar.expander("📊 Metriche e ultimi lavori", expanded=False):
+    statistiche_cache = ottieni_cache_condivisa().statistiche()
+    statistiche_archivio = ottieni_archivio_condiviso().statistiche()
+    statistiche_lavori = ottieni_scheduler_condiviso().statistiche()
+    profilo_cpu = ottieni_worker_condiviso().descrizione_profilo()
+    st.caption(
+        f"Cache frasi: {statistiche_cache['hit_ratio']:.0%} hit · "
+        f"render riutilizzati: {statistiche_archivio['hit_ratio']:.0%} · "
+        f"archivio audio: {statistiche_archivio['bytes'] / 2**20:.0f} MB ({statistiche_archivio['sessioni']} sessioni) · "
+        f"lavori in coda: {statistiche_lavori['in_coda']} · in esecuzione: {statistiche_lavori['in_esecuzione']} · "
+        f"CPU: {profilo_cpu['preset']}, {profilo_cpu['parallelismo']}×{profilo_cpu['thread_intra']} thread, "
+        f"core {profilo_cpu['affinita']}, quantizzazione {profilo_cpu['quantizzazione']}"
+    )
+    ultime_tracce = metriche.ultime_tracce(LAVORI_NEL_PANNELLO)
+    if ultime_tracce:
+        st.markdown(f"**Ultimi {len(ultime_tracce)} lavori** (tutte le sessioni):")
+        st.dataframe(
+            [
+                {
+                    "ora": traccia["ts"][11:],
+                    "lavoro": traccia.get("strumento", traccia["tipo"]),
+                    "esito": traccia["esito"],
+                    "durata (s)": traccia["durata_s"],
+                    "coda (s)": traccia["attesa_coda_s"],
+                    "RTF": traccia["rtf"],
+                    "stadi": ", ".join(f"{nome} {durata:.2f}s" for nome, durata in traccia["stadi"].items()),
+                    "sottoprocessi": traccia["sottoprocessi"],
+                    "Δ RSS (MB)": traccia["rss_delta_mb"],
+                }
+                for traccia in ultime_tracce
+            ],
+            hide_index=True,
+        )
+    else:
+        st.info("Nessun lavoro ancora concluso.")
+    st.download_button(
+        label="Scarica metriche (Prometheus)",
+        data=metriche.testo_prometheus(),
+        file_name="nova_metriche.prom",
+        mime="text/plain",
+        key="download_metrics_button"
+    )
+
+# --- Durata del rerun ---
+durata_rerun_s = time.perf_counter() - _inizio_rerun
+st.session_state.durata_ultimo_rerun_ms = durata_rerun_s * 1000
+metriche.osserva("nova_rerun_secondi", durata_rerun_s)
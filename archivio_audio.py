@@ -0,0 +1,263 @@
+import os
+import mmap
+import hashlib
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+
+# --- Archivio degli audio delle sessioni ---
+# Audio base, anteprime e render filtrati vengono scritti una volta in una cartella gestita e le
+# sessioni dell'interfaccia conservano solo un riferimento (l'impronta del contenuto): più schede
+# con lo stesso audio condividono lo stesso file e la lettura passa da una mappa in memoria, senza
+# copie. Ogni audio conta le sessioni che lo usano; oltre il limite di spazio vengono eliminati per
+# primi gli audio meno recenti non più usati da nessuna sessione, e le sessioni inattive da troppo
+# tempo (schede chiuse) rilasciano i loro audio.
+
+CARTELLA_ARCHIVIO = os.path.join(tempfile.gettempdir(), "nova_archivio_audio")
+ENV_MAX_MB_ARCHIVIO = "NOVA_ARCHIVIO_MB"
+MAX_MB_ARCHIVIO = 2048
+ENV_SCADENZA_SESSIONE = "NOVA_SCADENZA_SESSIONE_S"
+SCADENZA_SESSIONE_S = 3600
+
+
+def impronta_audio(dati):
+    """SHA-256 del contenuto di un audio in memoria (bytes, bytearray, memoryview, mmap o BytesIO)."""
+    if hasattr(dati, "getbuffer"):
+        dati = dati.getbuffer()
+    return hashlib.sha256(dati).hexdigest()
+
+
+def id_render(id_audio_base, pitch_semitoni, velocita_fattore, volume_db, formato="wav", taglia_silenzi=False,
+              loudness_lufs=None):
+    """
+    Id del render filtrato di un audio dell'archivio: dipende dall'audio base, dai parametri dei
+    filtri e dal formato di uscita, quindi anteprima e salvataggio con gli stessi valori lo condividono.
+    """
+    parametri = (id_audio_base, int(pitch_semitoni), round(float(velocita_fattore), 4), float(volume_db), formato)
+    # Taglio e normalizzazione entrano nell'id solo se attivi: gli id dei render esistenti non cambiano
+    if taglia_silenzi or loudness_lufs is not None:
+        parametri += (bool(taglia_silenzi), None if loudness_lufs is None else float(loudness_lufs))
+    return hashlib.sha256(repr(parametri).encode("utf-8")).hexdigest()
+
+
+class AudioNonDisponibile(KeyError):
+    """L'audio richiesto non è (più) nell'archivio, ad esempio perché è stato eliminato oltre il limite."""
+    pass
+
+
+class ArchivioAudio:
+    """
+    Archivio su disco di audio identificati dal loro contenuto, con conteggio dei riferimenti per
+    sessione, limite complessivo in byte ed eliminazione LRU. Gli audio già presenti nella cartella
+    all'avvio restano disponibili (in ordine di mtime), ma senza sessioni che li usano.
+    """
+
+    def __init__(self, cartella=CARTELLA_ARCHIVIO, max_bytes=MAX_MB_ARCHIVIO * 1024 * 1024,
+                 scadenza_sessione_s=SCADENZA_SESSIONE_S):
+        self.cartella = cartella
+        self.max_bytes = max_bytes
+        self.scadenza_sessione_s = scadenza_sessione_s
+        self.hit = 0
+        self.miss = 0
+        self.eliminati = 0
+        self._lock = threading.Lock()
+        self._voci = OrderedDict()  # id -> dimensione in byte, dal meno recente
+        self._riferimenti = {}  # id -> sessioni che lo usano
+        self._sessioni = {}  # sessione -> (ultimo accesso, id usati)
+        self._bytes_totali = 0
+        os.makedirs(self.cartella, exist_ok=True)
+        self._carica_indice()
+
+    def _carica_indice(self):
+        voci = []
+        for nome in os.listdir(self.cartella):
+            if not nome.endswith(".wav"):
+                continue
+            info = os.stat(os.path.join(self.cartella, nome))
+            voci.append((info.st_mtime_ns, nome[:-len(".wav")], info.st_size))
+        for _, id_audio, dimensione in sorted(voci):
+            self._voci[id_audio] = dimensione
+            self._bytes_totali += dimensione
+
+    def _percorso(self, id_audio):
+        return os.path.join(self.cartella, f"{id_audio}.wav")
+
+    def aggiungi(self, dati, sessione=None, id_audio=None):
+        """
+        Conserva `dati` (bytes, bytearray, memoryview, mmap o BytesIO) e restituisce il loro id,
+        acquisito per `sessione`. Senza `id_audio` l'id è l'impronta del contenuto: lo stesso audio
+        aggiunto da più sessioni occupa un solo file.
+        """
+        if hasattr(dati, "getbuffer"):
+            dati = dati.getbuffer()
+        id_audio = id_audio or impronta_audio(dati)
+        with self._lock:
+            presente = id_audio in self._voci
+        if not presente:
+            # Scrittura atomica fuori dal lock: chi legge vede il file completo oppure nessun file
+            descrittore, percorso_temporaneo = tempfile.mkstemp(dir=self.cartella, suffix=".tmp")
+            with os.fdopen(descrittore, "wb") as f:
+                f.write(dati)
+            os.replace(percorso_temporaneo, self._percorso(id_audio))
+            with self._lock:
+                if id_audio not in self._voci:
+                    self._voci[id_audio] = len(dati)
+                    self._bytes_totali += len(dati)
+        self.acquisisci(id_audio, sessione)
+        self.pulisci(proteggi=id_audio)
+        return id_audio
+
+    def contiene(self, id_audio):
+        """True se l'audio è nell'archivio (conta come hit o miss nelle statistiche)."""
+        with self._lock:
+            if id_audio in self._voci:
+                self._voci.move_to_end(id_audio)
+                self.hit += 1
+                return True
+            self.miss += 1
+            return False
+
+    def acquisisci(self, id_audio, sessione):
+        """Registra che `sessione` usa l'audio: finché lo usa viene eliminato solo come ultima risorsa."""
+        if sessione is None:
+            return
+        with self._lock:
+            if id_audio not in self._voci:
+                raise AudioNonDisponibile(id_audio)
+            self._voci.move_to_end(id_audio)
+            self._riferimenti.setdefault(id_audio, set()).add(sessione)
+            self._sessioni.setdefault(sessione, (0, set()))[1].add(id_audio)
+            self._tocca(sessione)
+
+    def rilascia(self, id_audio, sessione):
+        """La sessione non usa più l'audio (che resta in archivio finché c'è spazio)."""
+        if id_audio is None or sessione is None:
+            return
+        with self._lock:
+            sessioni = self._riferimenti.get(id_audio)
+            if sessioni is not None:
+                sessioni.discard(sessione)
+                if not sessioni:
+                    del self._riferimenti[id_audio]
+            if sessione in self._sessioni:
+                self._sessioni[sessione][1].discard(id_audio)
+
+    def _tocca(self, sessione):
+        _, id_usati = self._sessioni.get(sessione, (0, set()))
+        self._sessioni[sessione] = (time.monotonic(), id_usati)
+
+    def tocca_sessione(self, sessione):
+        """Segnala che la sessione è ancora attiva (da chiamare a ogni rerun)."""
+        with self._lock:
+            self._tocca(sessione)
+
+    def chiudi_sessione(self, sessione):
+        """Rilascia tutti gli audio della sessione."""
+        with self._lock:
+            _, id_usati = self._sessioni.pop(sessione, (0, set()))
+            for id_audio in id_usati:
+                sessioni = self._riferimenti.get(id_audio)
+                if sessioni is not None:
+                    sessioni.discard(sessione)
+                    if not sessioni:
+                        del self._riferimenti[id_audio]
+
+    def percorso(self, id_audio):
+        """Percorso del file dell'audio (per st.audio, copie su disco o ffmpeg)."""
+        with self._lock:
+            if id_audio not in self._voci:
+                raise AudioNonDisponibile(id_audio)
+            self._voci.move_to_end(id_audio)
+        return self._percorso(id_audio)
+
+    @contextmanager
+    def mappa(self, id_audio):
+        """Contenuto dell'audio come mmap in sola lettura, senza copiarlo in memoria."""
+        try:
+            f = open(self.percorso(id_audio), "rb")
+        except FileNotFoundError:
+            raise AudioNonDisponibile(id_audio) from None
+        # Il file può essere eliminato mentre è mappato: la mappa resta valida fino alla chiusura
+        with f:
+            mappa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield mappa
+            finally:
+                try:
+                    mappa.close()
+                except BufferError:
+                    # Restano viste sulla mappa (es. nel traceback di un'eccezione): verrà chiusa
+                    # quando saranno rilasciate
+                    pass
+
+    def pulisci(self, proteggi=None):
+        """
+        Rilascia gli audio delle sessioni scadute, poi elimina audio dal meno recente finché il
+        totale rientra nel limite: prima quelli non usati da nessuna sessione, poi, se non basta,
+        anche quelli ancora in uso (tranne `proteggi`, l'audio appena aggiunto).
+        Restituisce il numero di audio eliminati.
+        """
+        adesso = time.monotonic()
+        with self._lock:
+            scadute = [
+                sessione for sessione, (ultimo_accesso, _) in self._sessioni.items()
+                if adesso - ultimo_accesso > self.scadenza_sessione_s
+            ]
+        for sessione in scadute:
+            self.chiudi_sessione(sessione)
+
+        da_eliminare = []
+        with self._lock:
+            for solo_non_usati in (True, False):
+                for id_audio in list(self._voci):
+                    if self._bytes_totali <= self.max_bytes:
+                        break
+                    if id_audio == proteggi or (solo_non_usati and self._riferimenti.get(id_audio)):
+                        continue
+                    self._bytes_totali -= self._voci.pop(id_audio)
+                    for sessione in self._riferimenti.pop(id_audio, ()):
+                        self._sessioni.get(sessione, (0, set()))[1].discard(id_audio)
+                    da_eliminare.append(id_audio)
+            self.eliminati += len(da_eliminare)
+        for id_audio in da_eliminare:
+            try:
+                os.remove(self._percorso(id_audio))
+            except OSError:
+                pass
+        return len(da_eliminare)
+
+    def statistiche(self):
+        with self._lock:
+            totale = self.hit + self.miss
+            return {
+                "hit": self.hit,
+                "miss": self.miss,
+                "hit_ratio": self.hit / totale if totale else 0.0,
+                "voci": len(self._voci),
+                "bytes": self._bytes_totali,
+                "in_uso": len(self._riferimenti),
+                "sessioni": len(self._sessioni),
+                "eliminati": self.eliminati,
+            }
+
+
+# --- Archivio condiviso dall'applicazione ---
+_archivio_condiviso = None
+_lock_archivio_condiviso = threading.Lock()
+
+
+def ottieni_archivio_condiviso():
+    """
+    Restituisce l'archivio condiviso da tutte le sessioni del processo (limite in MB da
+    NOVA_ARCHIVIO_MB, scadenza delle sessioni inattive in secondi da NOVA_SCADENZA_SESSIONE_S).
+    """
+    global _archivio_condiviso
+    with _lock_archivio_condiviso:
+        if _archivio_condiviso is None:
+            _archivio_condiviso = ArchivioAudio(
+                max_bytes=int(os.environ.get(ENV_MAX_MB_ARCHIVIO, MAX_MB_ARCHIVIO)) * 1024 * 1024,
+                scadenza_sessione_s=float(os.environ.get(ENV_SCADENZA_SESSIONE, SCADENZA_SESSIONE_S)),
+            )
+        return _archivio_condiviso
@@ -0,0 +1,176 @@
+import os
+import struct
+from collections import namedtuple
+
+# --- Utility per WAV PCM in memoria ---
+# Lettura dell'intestazione senza copiare i campioni e composizione di WAV a partire da blocchi PCM.
+
+FormatoPCM = namedtuple("FormatoPCM", ["canali", "larghezza", "frequenza"])
+FormatoPCM.__doc__ = "Formato PCM: numero di canali, byte per campione e frequenza di campionamento."
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# Dimensione "sconosciuta" usata dai writer in streaming (es. ffmpeg su pipe)
+_DIMENSIONE_STREAMING = 0xFFFFFFFF
+# Oltre questa dimensione i campi a 32 bit del RIFF non bastano: si usa la dimensione "sconosciuta"
+_MAX_BYTES_DATI = _DIMENSIONE_STREAMING - 36 - 1
+
+
+class ErroreFormatoWav(ValueError):
+    """Il buffer non è un WAV PCM leggibile."""
+
+
+def analizza_wav(dati):
+    """
+    Analizza l'intestazione di un WAV PCM in `dati` (bytes, bytearray, memoryview o mmap).
+    Restituisce (FormatoPCM, offset_dati, lunghezza_dati) senza copiare i campioni.
+    """
+    vista = memoryview(dati)
+    if len(vista) < 12 or bytes(vista[0:4]) != b"RIFF" or bytes(vista[8:12]) != b"WAVE":
+        raise ErroreFormatoWav("Intestazione RIFF/WAVE mancante.")
+
+    formato = None
+    posizione = 12
+    while posizione + 8 <= len(vista):
+        id_chunk = bytes(vista[posizione:posizione + 4])
+        dimensione = struct.unpack_from("<I", vista, posizione + 4)[0]
+        inizio = posizione + 8
+        if id_chunk == b"fmt ":
+            tag, canali, frequenza, _, _, bit = struct.unpack_from("<HHIIHH", vista, inizio)
+            if tag == _WAVE_FORMAT_EXTENSIBLE and dimensione >= 40:
+                tag = struct.unpack_from("<H", vista, inizio + 24)[0]
+            if tag != _WAVE_FORMAT_PCM:
+                raise ErroreFormatoWav(f"Formato WAV non PCM (tag {tag:#06x}).")
+            formato = FormatoPCM(canali, bit // 8, frequenza)
+        elif id_chunk == b"data":
+            if formato is None:
+                raise ErroreFormatoWav("Chunk 'data' prima del chunk 'fmt '.")
+            disponibile = len(vista) - inizio
+            if dimensione == _DIMENSIONE_STREAMING or dimensione == 0 or dimensione > disponibile:
+                dimensione = disponibile
+            # Scarta un eventuale frame incompleto in coda
+            dimensione -= dimensione % (formato.canali * formato.larghezza)
+            return formato, inizio, dimensione
+        posizione = inizio + dimensione + (dimensione & 1)
+
+    raise ErroreFormatoWav("Chunk 'data' non trovato.")
+
+
+def leggi_pcm(dati):
+    """Restituisce (FormatoPCM, memoryview dei campioni) di un WAV, senza copie."""
+    formato, offset, lunghezza = analizza_wav(dati)
+    return formato, memoryview(dati)[offset:offset + lunghezza]
+
+
+def intestazione_wav(formato, n_bytes_dati=_DIMENSIONE_STREAMING):
+    """
+    Intestazione WAV PCM canonica di 44 byte. Senza `n_bytes_dati` le dimensioni sono
+    marcate come sconosciute, per l'invio in streaming.
+    """
+    byte_per_frame = formato.canali * formato.larghezza
+    if n_bytes_dati == _DIMENSIONE_STREAMING:
+        dimensione_riff = _DIMENSIONE_STREAMING
+    else:
+        dimensione_riff = 36 + n_bytes_dati
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", dimensione_riff, b"WAVE",
+        b"fmt ", 16, _WAVE_FORMAT_PCM, formato.canali, formato.frequenza,
+        formato.frequenza * byte_per_frame, byte_per_frame, formato.larghezza * 8,
+        b"data", n_bytes_dati,
+    )
+
+
+class ScrittoreWav:
+    """
+    Scrive un WAV PCM su file a blocchi, senza tenerlo in memoria: l'intestazione viene scritta
+    subito con dimensioni provvisorie e aggiornata da `sincronizza()` e alla chiusura.
+    Con `riprendi_da` (byte PCM già validi) riapre un file parziale, scarta quanto scritto oltre
+    quel punto e continua ad accodare da lì.
+    """
+
+    def __init__(self, percorso, formato, riprendi_da=None):
+        self.percorso = percorso
+        self.formato = formato
+        if riprendi_da is None:
+            self._file = open(percorso, "wb")
+            self._file.write(intestazione_wav(formato, 0))
+            self.n_bytes = 0
+        else:
+            self._file = open(percorso, "r+b")
+            self._file.truncate(44 + riprendi_da)
+            self._file.seek(0, os.SEEK_END)
+            self.n_bytes = riprendi_da
+
+    def scrivi(self, pcm):
+        self._file.write(pcm)
+        self.n_bytes += len(pcm)
+
+    def _aggiorna_intestazione(self):
+        n_bytes = self.n_bytes if self.n_bytes <= _MAX_BYTES_DATI else _DIMENSIONE_STREAMING
+        self._file.seek(0)
+        self._file.write(intestazione_wav(self.formato, n_bytes))
+        self._file.seek(0, os.SEEK_END)
+
+    def sincronizza(self):
+        """Aggiorna l'intestazione e porta su disco quanto scritto: il file resta un WAV valido."""
+        self._aggiorna_intestazione()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def chiudi(self):
+        if self._file.closed:
+            return
+        try:
+            self._aggiorna_intestazione()
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.chiudi()
+
+
+def silenzio_pcm(formato, durata_ms):
+    """Blocco PCM di silenzio della durata indicata."""
+    n_frame = int(formato.frequenza * max(0, durata_ms) / 1000)
+    # Per PCM a 8 bit il silenzio è 128 (unsigned), altrimenti 0
+    valore = b"\x80" if formato.larghezza == 1 else b"\x00"
+    return valore * (n_frame * formato.canali * formato.larghezza)
+
+
+def componi_wav(formato, blocchi_pcm):
+    """Compone un WAV completo a partire da una sequenza di blocchi PCM dello stesso formato."""
+    blocchi_pcm = list(blocchi_pcm)
+    n_bytes = sum(len(blocco) for blocco in blocchi_pcm)
+    buffer = bytearray(intestazione_wav(formato, n_bytes))
+    for blocco in blocchi_pcm:
+        buffer += blocco
+    return bytes(buffer)
+
+
+def regione_wav(dati, inizio_s, fine_s):
+    """WAV con i soli campioni tra `inizio_s` e `fine_s` (secondi) di un WAV PCM in memoria."""
+    formato, pcm = leggi_pcm(dati)
+    byte_per_secondo = formato.frequenza * formato.canali * formato.larghezza
+    byte_per_frame = formato.canali * formato.larghezza
+    inizio = int(max(0.0, inizio_s) * byte_per_secondo) // byte_per_frame * byte_per_frame
+    fine = int(max(0.0, fine_s) * byte_per_secondo) // byte_per_frame * byte_per_frame
+    with pcm:
+        return componi_wav(formato, [pcm[inizio:max(inizio, fine)]])
+
+
+def durata_secondi(formato, n_bytes_pcm):
+    """Durata in secondi di `n_bytes_pcm` byte di campioni nel formato indicato."""
+    return n_bytes_pcm / (formato.frequenza * formato.canali * formato.larghezza)
+
+
+def durata_wav(dati):
+    """Durata in secondi di un WAV PCM in memoria, oppure None se non è un WAV PCM."""
+    try:
+        formato, _, n_bytes = analizza_wav(dati)
+    except ErroreFormatoWav:
+        return None
+    return durata_secondi(formato, n_bytes)
@@ -0,0 +1,113 @@
+"""
+Benchmark dei filtri audio: percorso storico con file temporanei (pydub + ffmpeg su file)
+contro il motore in memoria di filtri_audio.py, su audio sintetico di 1, 10 e 60 minuti.
+
+Uso:
+    python benchmark/bench_filtri.py --minuti 1 10 60 --pitch 2 --velocita 1.25 --volume 3
+"""
+import os
+import sys
+import time
+import math
+import array
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_wav import FormatoPCM, componi_wav, leggi_pcm  # noqa: E402
+from filtri_audio import filtra_wav, catena_atempo  # noqa: E402
+
+
+def audio_sintetico(minuti, frequenza=24000):
+    """WAV mono a 16 bit con un tono modulato, della durata indicata."""
+    n_campioni = int(minuti * 60 * frequenza)
+    periodo = array.array("h", (int(6000 * math.sin(2 * math.pi * 220 * i / frequenza)) for i in range(frequenza)))
+    campioni = periodo * (n_campioni // frequenza + 1)
+    del campioni[n_campioni:]
+    return componi_wav(FormatoPCM(1, 2, frequenza), [campioni.tobytes()])
+
+
+def filtra_percorso_storico(dati_wav, cartella, pitch_semitoni, velocita_fattore, volume_db):
+    """Riproduce il vecchio applica_filtri_audio: quattro scritture su disco, due decodifiche e ffmpeg su file."""
+    from pydub import AudioSegment
+
+    ingresso = os.path.join(cartella, "temp_input_audio_for_pydub.wav")
+    per_ffmpeg = os.path.join(cartella, "temp_pydub_for_ffmpeg_streamlit.wav")
+    anteprima = os.path.join(cartella, "temp_filter_preview_streamlit.wav")
+    with open(ingresso, "wb") as f:
+        f.write(dati_wav)
+    audio = AudioSegment.from_file(ingresso)
+    if volume_db != 0:
+        audio = audio + volume_db
+    audio.export(per_ffmpeg, format="wav")
+
+    filtri = []
+    if pitch_semitoni != 0:
+        fattore_pitch = 2.0 ** (pitch_semitoni / 12.0)
+        filtri.append(f"asetrate={int(audio.frame_rate * fattore_pitch)},atempo={1 / fattore_pitch}")
+    if velocita_fattore != 1.0:
+        filtri.append(",".join(catena_atempo(velocita_fattore)))
+    if filtri:
+        subprocess.run(
+            ["ffmpeg", "-y", "-i", per_ffmpeg, "-filter:a", ",".join(filtri), anteprima],
+            capture_output=True, check=True,
+        )
+    else:
+        shutil.copy(per_ffmpeg, anteprima)
+    with open(anteprima, "rb") as f:
+        return f.read()
+
+
+def differenza_massima(wav_a, wav_b):
+    """Differenza in frame e massima differenza assoluta tra i campioni di due WAV a 16 bit."""
+    formato_a, pcm_a = leggi_pcm(wav_a)
+    formato_b, pcm_b = leggi_pcm(wav_b)
+    if formato_a != formato_b:
+        return None, f"formati diversi: {formato_a} / {formato_b}"
+    campioni_a, campioni_b = pcm_a.cast("h"), pcm_b.cast("h")
+    n = min(len(campioni_a), len(campioni_b))
+    massima = max((abs(campioni_a[i] - campioni_b[i]) for i in range(0, n, 7)), default=0)
+    return len(campioni_a) - len(campioni_b), massima
+
+
+def misura(funzione, ripetizioni):
+    tempi = []
+    risultato = None
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        risultato = funzione()
+        tempi.append(time.perf_counter() - inizio)
+    return min(tempi), risultato
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--minuti", type=float, nargs="+", default=[1, 10, 60])
+    parser.add_argument("--pitch", type=int, default=2)
+    parser.add_argument("--velocita", type=float, default=1.25)
+    parser.add_argument("--volume", type=int, default=3)
+    parser.add_argument("--ripetizioni", type=int, default=3)
+    argomenti = parser.parse_args()
+
+    print(f"Filtri: pitch={argomenti.pitch} velocità={argomenti.velocita} volume={argomenti.volume} dB")
+    print(f"{'minuti':>7} {'storico (s)':>12} {'in memoria (s)':>15} {'speedup':>8} {'Δframe':>7} {'Δmax':>6}")
+    with tempfile.TemporaryDirectory(prefix="nova_bench_") as cartella:
+        for minuti in argomenti.minuti:
+            dati = audio_sintetico(minuti)
+            parametri = (argomenti.pitch, argomenti.velocita, argomenti.volume)
+            tempo_storico, uscita_storica = misura(
+                lambda: filtra_percorso_storico(dati, cartella, *parametri), argomenti.ripetizioni
+            )
+            tempo_memoria, uscita_memoria = misura(lambda: filtra_wav(dati, *parametri), argomenti.ripetizioni)
+            delta_frame, delta_massimo = differenza_massima(uscita_storica, uscita_memoria)
+            print(
+                f"{minuti:>7g} {tempo_storico:>12.3f} {tempo_memoria:>15.3f} "
+                f"{tempo_storico / tempo_memoria:>7.2f}x {delta_frame!s:>7} {delta_massimo!s:>6}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Benchmark per stadio della pipeline genera → filtra → salva, su audio sintetico di durata
+configurabile: sintesi TTS (modello reale o motore stub deterministico), decodifica e guadagno,
+pitch/tempo con ffmpeg a più fattori di velocità (comprese le catene di atempo sotto 0.5 e
+sopra 2.0), esportazione su file e preparazione del download.
+
+Per ogni stadio riporta latenza p50/p95, throughput (secondi di audio per secondo di
+elaborazione) e picco di memoria residente. I risultati si salvano come baseline JSON e
+si confrontano con una baseline precedente: le regressioni oltre la soglia fanno uscire con codice 1.
+
+Uso:
+    python benchmark/bench_pipeline.py --secondi 60 --salva benchmark/baseline.json
+    python benchmark/bench_pipeline.py --secondi 60 --confronta benchmark/baseline.json --soglia 0.15
+    python benchmark/bench_pipeline.py --motore xtts --stadi tts --ripetizioni 3
+"""
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_wav import analizza_wav, durata_secondi, leggi_pcm  # noqa: E402
+from filtri_audio import filtra_wav, filtra_wav_su_file, applica_guadagno  # noqa: E402
+from metriche import picco_memoria_processo_mb  # noqa: E402
+from motore_tts import crea_worker  # noqa: E402
+from pipeline_sintesi import sintetizza_testo  # noqa: E402
+from bench_filtri import audio_sintetico  # noqa: E402
+
+STADI = ("tts", "decodifica", "filtri", "esportazione")
+VELOCITA_PREDEFINITE = [0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0]
+# Metriche confrontate tra baseline: più alte = peggio
+METRICHE_CONFRONTATE = ("p50_ms", "p95_ms")
+
+_FRASI_TESTO = [
+    "Benvenuti in NovaStudioVocale.",
+    "Questa è una frase di prova per misurare la sintesi vocale.",
+    "Il testo viene diviso in frasi e sintetizzato a blocchi.",
+    "Ogni blocco viene poi ricucito con una breve pausa di silenzio.",
+]
+
+
+def testo_sintetico(n_caratteri):
+    """Testo italiano di circa `n_caratteri` caratteri, con frasi di lunghezza realistica."""
+    frasi = []
+    lunghezza = 0
+    while lunghezza < n_caratteri:
+        frase = _FRASI_TESTO[len(frasi) % len(_FRASI_TESTO)]
+        frasi.append(frase)
+        lunghezza += len(frase) + 1
+    return " ".join(frasi)
+
+
+def percentile(valori, quota):
+    ordinati = sorted(valori)
+    if not ordinati:
+        return 0.0
+    posizione = (len(ordinati) - 1) * quota
+    basso = int(posizione)
+    alto = min(basso + 1, len(ordinati) - 1)
+    return ordinati[basso] + (ordinati[alto] - ordinati[basso]) * (posizione - basso)
+
+
+def misura_stadio(nome, funzione, secondi_audio, ripetizioni, riscaldamento=1):
+    """Esegue `funzione` più volte e restituisce le statistiche dello stadio."""
+    for _ in range(riscaldamento):
+        funzione()
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        funzione()
+        tempi.append(time.perf_counter() - inizio)
+    rss_processo, rss_figli = picco_memoria_processo_mb()
+    p50 = percentile(tempi, 0.5)
+    risultato = {
+        "p50_ms": round(p50 * 1000, 3),
+        "p95_ms": round(percentile(tempi, 0.95) * 1000, 3),
+        "ripetizioni": ripetizioni,
+        "secondi_audio": round(secondi_audio, 3),
+        "throughput_x": round(secondi_audio / p50, 2) if p50 > 0 else None,
+        "rss_picco_mb": rss_processo,
+        "rss_picco_figli_mb": rss_figli,
+    }
+    print(
+        f"{nome:<22} {risultato['p50_ms']:>10.1f} {risultato['p95_ms']:>10.1f} "
+        f"{risultato['throughput_x'] or 0:>11.1f}x {rss_processo:>9.1f} {rss_figli:>9.1f}",
+        flush=True,
+    )
+    return risultato
+
+
+def stadi_tts(argomenti, cartella):
+    opzioni = {"ritardo_s": argomenti.ritardo_stub} if argomenti.motore == "stub" else None
+    worker = crea_worker(motore=argomenti.motore, opzioni_motore=opzioni, parallelismo=argomenti.paralleli)
+    try:
+        worker.avvia()
+        speaker_wav = os.path.join(cartella, "speaker.wav")
+        with open(speaker_wav, "wb") as f:
+            f.write(audio_sintetico(5 / 60))
+        # Con il motore stub ~60 ms per carattere: il testo produce circa la durata richiesta
+        testo = testo_sintetico(int(argomenti.secondi * 1000 / 60))
+        wav = sintetizza_testo(testo, speaker_wav, worker)
+        formato, _, n_bytes = analizza_wav(wav)
+        secondi_audio = durata_secondi(formato, n_bytes)
+        # Senza cache delle frasi: ogni ripetizione passa davvero dal worker
+        return {
+            f"tts_{argomenti.motore}": misura_stadio(
+                f"tts ({argomenti.motore})", lambda: sintetizza_testo(testo, speaker_wav, worker),
+                secondi_audio, argomenti.ripetizioni,
+            )
+        }
+    finally:
+        worker.chiudi()
+
+
+def stadi_decodifica(argomenti, dati_wav):
+    from pydub import AudioSegment
+
+    def pydub_decodifica_guadagno():
+        audio = AudioSegment.from_wav(io.BytesIO(dati_wav))
+        return audio + argomenti.volume
+
+    def guadagno_in_memoria():
+        formato, pcm = leggi_pcm(dati_wav)
+        return applica_guadagno(formato, pcm, argomenti.volume)
+
+    return {
+        "decodifica_pydub": misura_stadio("decodifica+gain pydub", pydub_decodifica_guadagno, argomenti.secondi, argomenti.ripetizioni),
+        "guadagno_memoria": misura_stadio("gain in memoria", guadagno_in_memoria, argomenti.secondi, argomenti.ripetizioni),
+    }
+
+
+def stadi_filtri(argomenti, dati_wav):
+    risultati = {}
+    for velocita in argomenti.velocita:
+        nome = f"filtri_v{velocita:g}"
+        risultati[nome] = misura_stadio(
+            f"pitch {argomenti.pitch:+d} speed {velocita:g}x",
+            lambda: filtra_wav(dati_wav, argomenti.pitch, velocita, argomenti.volume),
+            argomenti.secondi, argomenti.ripetizioni,
+        )
+    return risultati
+
+
+def stadi_esportazione(argomenti, dati_wav, cartella):
+    percorso = os.path.join(cartella, "esportato.wav")
+    filtrato = bytes(filtra_wav(dati_wav, argomenti.pitch, 1.0, argomenti.volume))
+
+    def salva_e_prepara_download():
+        # Come "Salva Audio": scrittura del render su file, poi i bytes per il pulsante di download
+        with open(percorso, "wb") as f:
+            f.write(filtrato)
+        with open(percorso, "rb") as f:
+            return f.read()
+
+    return {
+        "esportazione_filtri_su_file": misura_stadio(
+            "filtri diretti su file",
+            lambda: filtra_wav_su_file(dati_wav, percorso, argomenti.pitch, 1.0, argomenti.volume),
+            argomenti.secondi, argomenti.ripetizioni,
+        ),
+        "salvataggio_download": misura_stadio(
+            "salvataggio+download", salva_e_prepara_download, argomenti.secondi, argomenti.ripetizioni,
+        ),
+    }
+
+
+def confronta(attuale, baseline, soglia):
+    """Elenco delle regressioni (stadio, metrica, valore baseline, valore attuale) oltre la soglia relativa."""
+    regressioni = []
+    for nome, statistiche in attuale["stadi"].items():
+        riferimento = baseline.get("stadi", {}).get(nome)
+        if riferimento is None:
+            continue
+        for metrica in METRICHE_CONFRONTATE:
+            vecchio, nuovo = riferimento.get(metrica), statistiche.get(metrica)
+            if vecchio and nuovo is not None and nuovo > vecchio * (1 + soglia):
+                regressioni.append((nome, metrica, vecchio, nuovo))
+    return regressioni
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__
+    )
+    parser.add_argument("--secondi", type=float, default=30, help="Durata dell'audio sintetico")
+    parser.add_argument("--stadi", nargs="+", choices=STADI, default=list(STADI))
+    parser.add_argument("--ripetizioni", type=int, default=7)
+    parser.add_argument("--motore", default="stub", help="Motore TTS (stub, xtts, modulo:Classe)")
+    parser.add_argument("--ritardo-stub", type=float, default=0.0, help="Ritardo simulato per frase del motore stub")
+    parser.add_argument("--paralleli", type=int, default=1, help="Parallelismo del worker TTS")
+    parser.add_argument("--pitch", type=int, default=2)
+    parser.add_argument("--volume", type=int, default=3)
+    parser.add_argument("--velocita", type=float, nargs="+", default=VELOCITA_PREDEFINITE)
+    parser.add_argument("--salva", help="Salva i risultati come baseline JSON")
+    parser.add_argument("--confronta", help="Baseline JSON con cui confrontare i risultati")
+    parser.add_argument("--soglia", type=float, default=0.10, help="Regressione relativa tollerata (0.10 = +10%%)")
+    argomenti = parser.parse_args()
+
+    dati_wav = audio_sintetico(argomenti.secondi / 60)
+    print(f"Audio sintetico: {argomenti.secondi:g} s · ripetizioni: {argomenti.ripetizioni}")
+    print(f"{'stadio':<22} {'p50 (ms)':>10} {'p95 (ms)':>10} {'throughput':>12} {'RSS (MB)':>9} {'figli':>9}")
+    # Il picco di memoria è cumulativo (ru_maxrss non si azzera): ogni stadio riporta il massimo raggiunto fin lì
+    stadi = {}
+    with tempfile.TemporaryDirectory(prefix="nova_bench_") as cartella:
+        if "tts" in argomenti.stadi:
+            stadi.update(stadi_tts(argomenti, cartella))
+        if "decodifica" in argomenti.stadi:
+            stadi.update(stadi_decodifica(argomenti, dati_wav))
+        if "filtri" in argomenti.stadi:
+            stadi.update(stadi_filtri(argomenti, dati_wav))
+        if "esportazione" in argomenti.stadi:
+            stadi.update(stadi_esportazione(argomenti, dati_wav, cartella))
+
+    risultati = {
+        "data": datetime.datetime.now().isoformat(timespec="seconds"),
+        "sistema": {"python": platform.python_version(), "piattaforma": platform.platform(), "core": os.cpu_count()},
+        "parametri": {
+            "secondi": argomenti.secondi, "ripetizioni": argomenti.ripetizioni, "motore": argomenti.motore,
+            "pitch": argomenti.pitch, "volume": argomenti.volume,
+        },
+        "stadi": stadi,
+    }
+    if argomenti.salva:
+        with open(argomenti.salva, "w", encoding="utf-8") as f:
+            json.dump(risultati, f, ensure_ascii=False, indent=2)
+        print(f"Baseline salvata in {argomenti.salva}")
+
+    if argomenti.confronta:
+        with open(argomenti.confronta, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("parametri") != risultati["parametri"]:
+            print(f"⚠️  Parametri diversi dalla baseline: {baseline.get('parametri')}")
+        regressioni = confronta(risultati, baseline, argomenti.soglia)
+        if regressioni:
+            print(f"❌ Regressioni oltre il {argomenti.soglia:.0%}:")
+            for nome, metrica, vecchio, nuovo in regressioni:
+                print(f"   {nome} {metrica}: {vecchio:.1f} → {nuovo:.1f} ({nuovo / vecchio - 1:+.0%})")
+            return 1
+        print(f"✔️ Nessuna regressione oltre il {argomenti.soglia:.0%} rispetto a {argomenti.confronta}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Benchmark della correzione della pronuncia: ciclo storico con un re.sub per voce del
+vocabolario contro il motore compilato di pronuncia.py, su vocabolari e testi sintetici.
+
+Uso:
+    python benchmark/bench_pronuncia.py --voci 32 1000 50000 --parole-testo 20000
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pronuncia import MotorePronuncia, carica_sostituzioni  # noqa: E402
+
+_SILLABE = ["ba", "ce", "di", "fo", "gu", "la", "me", "ni", "po", "ra", "se", "to", "vi", "za", "chi", "glo", "str"]
+
+
+def parola_casuale(generatore):
+    return "".join(generatore.choice(_SILLABE) for _ in range(generatore.randint(2, 5)))
+
+
+def vocabolario_sintetico(n_voci, generatore):
+    vocabolario = {}
+    while len(vocabolario) < n_voci:
+        parola = parola_casuale(generatore)
+        vocabolario[parola] = [parola[:-1] + "à", parola]
+    return vocabolario
+
+
+def testo_sintetico(n_parole, vocabolario, generatore, quota_vocabolario=0.1):
+    chiavi = list(vocabolario)
+    parole = [
+        generatore.choice(chiavi) if generatore.random() < quota_vocabolario else parola_casuale(generatore)
+        for _ in range(n_parole)
+    ]
+    return " ".join(parole) + "."
+
+
+def correggi_storico(percorso, testo):
+    """Riproduce il vecchio handler "Correggi Pronuncia": rilettura del file e un re.sub per voce."""
+    sostituzioni = carica_sostituzioni(percorso)
+    for parola in sorted(sostituzioni, key=len, reverse=True):
+        testo = re.sub(r"\b" + re.escape(parola) + r"\b", sostituzioni[parola], testo)
+    return testo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--voci", type=int, nargs="+", default=[32, 1000, 50000])
+    parser.add_argument("--parole-testo", type=int, default=20000)
+    parser.add_argument("--max-voci-storico", type=int, default=5000,
+                        help="Oltre questa dimensione il ciclo storico non viene misurato (troppo lento).")
+    parser.add_argument("--seme", type=int, default=7)
+    argomenti = parser.parse_args()
+
+    generatore = random.Random(argomenti.seme)
+    print(f"Testo: {argomenti.parole_testo} parole")
+    print(f"{'voci':>7} {'storico (s)':>12} {'compilazione (s)':>17} {'correzione (s)':>15} {'voci applicate':>15}")
+    with tempfile.TemporaryDirectory(prefix="nova_bench_") as cartella:
+        for n_voci in argomenti.voci:
+            vocabolario = vocabolario_sintetico(n_voci, generatore)
+            testo = testo_sintetico(argomenti.parole_testo, vocabolario, generatore)
+            percorso = os.path.join(cartella, f"vocabolario_{n_voci}.json")
+            with open(percorso, "w", encoding="utf-8") as f:
+                json.dump(vocabolario, f, ensure_ascii=False)
+
+            motore = MotorePronuncia(percorso)
+            inizio = time.perf_counter()
+            motore.numero_voci  # Prima lettura: compilazione del vocabolario
+            tempo_compilazione = time.perf_counter() - inizio
+            inizio = time.perf_counter()
+            corretto, applicate = motore.correggi(testo)
+            tempo_correzione = time.perf_counter() - inizio
+
+            if n_voci <= argomenti.max_voci_storico:
+                inizio = time.perf_counter()
+                corretto_storico = correggi_storico(percorso, testo)
+                tempo_storico = f"{time.perf_counter() - inizio:.3f}"
+                if corretto_storico != corretto:
+                    tempo_storico += " (≠)"
+            else:
+                tempo_storico = "-"
+
+            print(
+                f"{n_voci:>7} {tempo_storico:>12} {tempo_compilazione:>17.3f} "
+                f"{tempo_correzione:>15.3f} {sum(applicate.values()):>15}"
+            )
+
+
+if __name__ == "__main__":
+    main()
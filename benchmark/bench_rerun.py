@@ -0,0 +1,149 @@
+"""
+Budget del tempo di rerun dell'interfaccia Streamlit: esegue app.py con streamlit.testing
+(AppTest, senza browser) e misura quanto costa un rerun per le interazioni più frequenti
+(spostare un cursore dei filtri, cambiare voce, rerun senza modifiche), anche con un audio
+base caricato, quando ogni rerun esegue la sezione dei filtri. Prima delle misure ogni
+scenario esegue un giro di riscaldamento: i render dei filtri sono già nell'archivio e il
+budget misura il rerun, non il render (che gira in background, vedi bench_filtri.py).
+
+Esce con codice 1 se il p95 di uno scenario supera il budget o se lo script solleva eccezioni,
+quindi si può usare come controllo automatico.
+
+Uso:
+    python benchmark/bench_rerun.py --ripetizioni 20 --budget-ms 25
+"""
+import os
+import sys
+import time
+import argparse
+
+CARTELLA_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CARTELLA_REPO)
+
+from bench_filtri import audio_sintetico  # noqa: E402
+from bench_pipeline import percentile  # noqa: E402
+
+# p95 massimo tollerato per l'esecuzione dello script (ms) e rerun misurati per scenario
+BUDGET_MS = 25.0
+RIPETIZIONI = 20
+# Rerun non misurati prima di ogni scenario: un giro completo dei valori dei cursori
+RISCALDAMENTO = 7
+# Durata dell'audio base degli scenari con la sezione dei filtri attiva
+DURATA_AUDIO_BASE_S = 5
+# Cartelle di risorse dell'app lette (non scritte) dai rerun
+_RISORSE_APP = ("speaker_previews", "assets")
+
+
+def crea_app(percorso_app=os.path.join(CARTELLA_REPO, "app.py"), timeout=60.0, cartella_lavoro=None):
+    """
+    AppTest dell'interfaccia con il motore stub, eseguito dalla cartella del progetto oppure da
+    `cartella_lavoro`: lì finiscono indice degli speaker, cache e output, mentre voci e logo
+    restano quelli del progetto (collegamenti simbolici).
+    """
+    from streamlit.testing.v1 import AppTest
+
+    # Il motore stub evita di caricare XTTS: il rerun dell'interfaccia non deve dipendere dal modello
+    os.environ.setdefault("NOVA_TTS_MOTORE", "stub")
+    if cartella_lavoro is not None:
+        for nome in _RISORSE_APP:
+            collegamento = os.path.join(cartella_lavoro, nome)
+            if not os.path.lexists(collegamento):
+                os.symlink(os.path.join(CARTELLA_REPO, nome), collegamento, target_is_directory=True)
+    os.chdir(cartella_lavoro or CARTELLA_REPO)
+    return AppTest.from_file(percorso_app, default_timeout=timeout)
+
+
+def imposta_audio_base(app, dati_wav):
+    """Mette `dati_wav` nell'archivio come audio base della sessione di `app` (dopo il primo avvio)."""
+    from archivio_audio import ottieni_archivio_condiviso
+
+    app.session_state["base_audio"] = ottieni_archivio_condiviso().aggiungi(dati_wav, app.session_state["session_id"])
+
+
+def scenari(app):
+    """
+    Interazioni misurate, come funzioni `interazione(app, i)`; `app` deve aver già eseguito il
+    primo avvio. Gli scenari "con audio base" lo caricano al primo utilizzo: vanno eseguiti per ultimi.
+    """
+    voci = app.selectbox[0].options
+
+    def con_audio_base(interazione):
+        def esegui(app, i):
+            if app.session_state["base_audio"] is None:
+                imposta_audio_base(app, audio_sintetico(DURATA_AUDIO_BASE_S / 60))
+            interazione(app, i)
+        return esegui
+
+    return {
+        "rerun senza modifiche": lambda app, i: None,
+        "cursore pitch": lambda app, i: app.slider(key="pitch_slider").set_value(i % 5 - 2),
+        "cursore volume": lambda app, i: app.slider(key="volume_slider").set_value(i % 7 - 3),
+        "cambio voce": lambda app, i: app.selectbox[0].set_value(voci[i % len(voci)]),
+        "audio base, nessuna modifica": con_audio_base(lambda app, i: None),
+        "audio base, cursore pitch": con_audio_base(lambda app, i: app.slider(key="pitch_slider").set_value(i % 5 - 2)),
+    }
+
+
+def misura_reruns(app, interazione, ripetizioni, riscaldamento=0):
+    """
+    Tempi (in ms) di `ripetizioni` rerun, ognuno preceduto da `interazione(app, i)`: la durata
+    dello script misurata da app.py stesso e il tempo totale visto da AppTest (che aggiunge
+    la sua attesa a intervalli fissi). I primi `riscaldamento` rerun non vengono misurati.
+    """
+    tempi_script, tempi_totali = [], []
+    for i in range(riscaldamento + ripetizioni):
+        interazione(app, i)
+        inizio = time.perf_counter()
+        app.run()
+        totale_ms = (time.perf_counter() - inizio) * 1000
+        if app.exception:
+            raise RuntimeError(f"Eccezione nello script: {app.exception}")
+        if i >= riscaldamento:
+            tempi_totali.append(totale_ms)
+            tempi_script.append(app.session_state["durata_ultimo_rerun_ms"])
+    return tempi_script, tempi_totali
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__
+    )
+    parser.add_argument("--ripetizioni", type=int, default=RIPETIZIONI)
+    parser.add_argument("--riscaldamento", type=int, default=RISCALDAMENTO, help="Rerun non misurati prima di ogni scenario")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS, help="p95 massimo tollerato per l'esecuzione dello script")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Timeout di un singolo rerun (s)")
+    parser.add_argument("--app", default="app.py", help="Script Streamlit da misurare, relativo alla cartella del progetto")
+    argomenti = parser.parse_args()
+
+    app = crea_app(os.path.join(CARTELLA_REPO, argomenti.app), argomenti.timeout)
+
+    inizio = time.perf_counter()
+    app.run()
+    primo_avvio_ms = (time.perf_counter() - inizio) * 1000
+    if app.exception:
+        print(f"❌ Eccezione al primo avvio: {app.exception}")
+        return 1
+    print(f"Primo avvio (cache fredde): {primo_avvio_ms:.0f} ms")
+
+    fuori_budget = []
+    print(f"{'scenario':<30} {'p50 (ms)':>10} {'p95 (ms)':>10} {'max (ms)':>10} {'con AppTest':>12}")
+    for nome, interazione in scenari(app).items():
+        tempi, tempi_totali = misura_reruns(app, interazione, argomenti.ripetizioni, argomenti.riscaldamento)
+        p95 = percentile(tempi, 0.95)
+        print(
+            f"{nome:<30} {percentile(tempi, 0.5):>10.1f} {p95:>10.1f} {max(tempi):>10.1f} "
+            f"{percentile(tempi_totali, 0.5):>12.1f}"
+        )
+        if p95 > argomenti.budget_ms:
+            fuori_budget.append((nome, p95))
+
+    if fuori_budget:
+        for nome, p95 in fuori_budget:
+            print(f"❌ {nome}: p95 {p95:.1f} ms oltre il budget di {argomenti.budget_ms:.0f} ms")
+        return 1
+    print(f"✔️ Tutti i rerun entro il budget di {argomenti.budget_ms:.0f} ms (p95)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
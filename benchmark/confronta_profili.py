@@ -0,0 +1,200 @@
+"""
+Confronto dei profili CPU del worker TTS (vedi profilo_cpu.py): per ogni profilo avvia un
+worker, sintetizza le stesse frasi e misura
+  - latenza per frase (p50/p95), con una frase alla volta;
+  - throughput (secondi di audio per secondo), con tante frasi in parallelo quanti i lavori
+    paralleli del profilo;
+  - impatto sulla qualità rispetto al primo profilo (riferimento): differenza di durata e di
+    loudness e distanza tra gli spettri medi delle stesse frasi, in dB.
+
+XTTS campiona i token con temperatura, quindi anche due esecuzioni dello stesso profilo non
+producono lo stesso audio: per leggere l'impatto della quantizzazione conviene includere il
+riferimento due volte (es. "latenza latenza latenza+int8") e confrontare le distanze.
+
+Un profilo si scrive "preset[+int8][:chiave=valore,...]", con le chiavi thread_intra,
+thread_inter, parallelismo e affinita; nell'affinità i gruppi di core si separano con "+"
+(es. "throughput+int8:parallelismo=2,affinita=0-7+16-23").
+
+Uso:
+    python benchmark/confronta_profili.py --profili latenza latenza+int8 throughput throughput+int8
+    python benchmark/confronta_profili.py --motore stub --profili latenza throughput:parallelismo=2 --json profili.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+CARTELLA_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CARTELLA_REPO)
+
+from audio_wav import durata_wav, leggi_pcm  # noqa: E402
+from analisi_audio import analizza_audio, campioni_float  # noqa: E402
+from motore_tts import crea_worker, ENV_MOTORE  # noqa: E402
+from profilo_cpu import analizza_affinita, crea_profilo, descrizione_profilo  # noqa: E402
+from bench_pipeline import percentile  # noqa: E402
+from bench_filtri import audio_sintetico  # noqa: E402
+
+FRASI = [
+    "Benvenuti in NovaStudioVocale.",
+    "Questa è una frase di prova per misurare la sintesi vocale.",
+    "Il testo viene diviso in frasi e sintetizzato a blocchi.",
+    "Ogni blocco viene poi ricucito con una breve pausa di silenzio.",
+    "La voce deve restare naturale anche con la quantizzazione dei pesi.",
+]
+CAMPIONI_FINESTRA_SPETTRO = 2048
+
+
+def analizza_specifica(specifica):
+    """Profilo da una specifica "preset[+int8][:chiave=valore,...]"."""
+    base, _, opzioni = specifica.partition(":")
+    preset, _, quantizzazione = base.partition("+")
+    valori = {"preset": preset, "quantizzazione": quantizzazione or None}
+    for opzione in filter(None, opzioni.split(",")):
+        chiave, _, valore = opzione.partition("=")
+        if chiave == "affinita":
+            valori["affinita"] = analizza_affinita(valore.replace("+", ","))
+        elif chiave in ("thread_intra", "thread_inter", "parallelismo"):
+            valori[chiave] = int(valore)
+        else:
+            raise ValueError(f"Opzione di profilo sconosciuta: {chiave}")
+    return crea_profilo(**valori)
+
+
+def spettro_medio_db(dati_wav):
+    """Spettro di ampiezza medio (dB) su finestre di Hann, dal canale medio del WAV."""
+    formato, pcm = leggi_pcm(dati_wav)
+    with pcm:
+        campioni = campioni_float(formato, pcm).mean(axis=1)
+    n_finestre = max(1, len(campioni) // CAMPIONI_FINESTRA_SPETTRO)
+    campioni = np.resize(campioni, n_finestre * CAMPIONI_FINESTRA_SPETTRO).reshape(n_finestre, -1)
+    spettro = np.abs(np.fft.rfft(campioni * np.hanning(CAMPIONI_FINESTRA_SPETTRO), axis=1)).mean(axis=0)
+    return 20 * np.log10(spettro + 1e-9)
+
+
+def confronta_audio(riferimento, audio):
+    """Differenze tra due sintesi della stessa frase: durata (%), loudness (LU), spettro medio (dB RMS)."""
+    analisi_rif, analisi = analizza_audio(riferimento), analizza_audio(audio)
+    delta_loudness = None
+    if analisi_rif["loudness_lufs"] is not None and analisi["loudness_lufs"] is not None:
+        delta_loudness = analisi["loudness_lufs"] - analisi_rif["loudness_lufs"]
+    distanza = float(np.sqrt(np.mean((spettro_medio_db(audio) - spettro_medio_db(riferimento)) ** 2)))
+    return {
+        "delta_durata_pct": (analisi["durata_s"] / analisi_rif["durata_s"] - 1) * 100 if analisi_rif["durata_s"] else None,
+        "delta_loudness_lu": delta_loudness,
+        "distanza_spettrale_db": distanza,
+    }
+
+
+def misura_profilo(specifica, profilo, argomenti, speaker_wav, cartella):
+    """Avvia un worker con il profilo e misura latenza, throughput e audio prodotto per frase."""
+    worker = crea_worker(motore=argomenti.motore, parallelismo=profilo.parallelismo, profilo=profilo)
+    cartella_profilo = tempfile.mkdtemp(dir=cartella)
+    contatore = itertools.count()
+
+    def sintetizza(frase):
+        percorso = os.path.join(cartella_profilo, f"{next(contatore)}.wav")
+        inizio = time.perf_counter()
+        worker.sintetizza(frase, speaker_wav, percorso, lingua=argomenti.lingua)
+        durata = time.perf_counter() - inizio
+        with open(percorso, "rb") as f:
+            return durata, f.read()
+
+    try:
+        inizio = time.perf_counter()
+        worker.avvia()
+        avvio_s = time.perf_counter() - inizio
+        # Riscaldamento: la prima inferenza alloca i buffer del modello
+        sintetizza(FRASI[0])
+
+        latenze, audio_per_frase = [], {}
+        for _ in range(argomenti.ripetizioni):
+            for frase in FRASI:
+                durata, audio = sintetizza(frase)
+                latenze.append(durata)
+                audio_per_frase.setdefault(frase, audio)
+
+        lavori = FRASI * argomenti.ripetizioni
+        inizio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=profilo.parallelismo) as pool:
+            risultati = list(pool.map(sintetizza, lavori))
+        durata_totale = time.perf_counter() - inizio
+        secondi_audio = sum(durata_wav(audio) for _, audio in risultati)
+    finally:
+        worker.chiudi()
+
+    return {
+        "profilo": specifica,
+        "applicato": worker.descrizione_profilo() or descrizione_profilo(profilo),
+        "avvio_s": round(avvio_s, 2),
+        "p50_ms": round(percentile(latenze, 0.5) * 1000, 1),
+        "p95_ms": round(percentile(latenze, 0.95) * 1000, 1),
+        "throughput_x": round(secondi_audio / durata_totale, 2) if durata_totale else None,
+    }, audio_per_frase
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__
+    )
+    parser.add_argument("--profili", nargs="+", default=["latenza", "latenza+int8", "throughput", "throughput+int8"])
+    parser.add_argument("--motore", default=os.environ.get(ENV_MOTORE, "xtts"), help="Motore TTS (xtts, stub, modulo:Classe)")
+    parser.add_argument("--speaker", help="WAV di riferimento della voce (predefinito: la prima voce di speaker_previews)")
+    parser.add_argument("--lingua", default="it")
+    parser.add_argument("--ripetizioni", type=int, default=2, help="Passate sulle frasi di prova per profilo")
+    parser.add_argument("--json", help="Salva i risultati in questo file JSON")
+    argomenti = parser.parse_args()
+
+    try:
+        profili = [(specifica, analizza_specifica(specifica)) for specifica in argomenti.profili]
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    with tempfile.TemporaryDirectory(prefix="nova_profili_") as cartella:
+        speaker_wav = argomenti.speaker
+        if speaker_wav is None:
+            cartella_speaker = os.path.join(CARTELLA_REPO, "speaker_previews")
+            voci = sorted(nome for nome in os.listdir(cartella_speaker) if nome.endswith(".wav")) if os.path.isdir(cartella_speaker) else []
+            if voci:
+                speaker_wav = os.path.join(cartella_speaker, voci[0])
+            else:
+                speaker_wav = os.path.join(cartella, "speaker.wav")
+                with open(speaker_wav, "wb") as f:
+                    f.write(audio_sintetico(5 / 60))
+
+        print(f"{'profilo':<28} {'thread':>8} {'avvio (s)':>9} {'p50 (ms)':>9} {'p95 (ms)':>9} {'throughput':>11} "
+              f"{'Δdurata':>8} {'Δloudness':>10} {'Δspettro':>9}")
+        risultati, riferimento = [], None
+        for specifica, profilo in profili:
+            risultato, audio_per_frase = misura_profilo(specifica, profilo, argomenti, speaker_wav, cartella)
+            if riferimento is None:
+                riferimento = audio_per_frase
+            confronti = [confronta_audio(riferimento[frase], audio) for frase, audio in audio_per_frase.items()]
+            for chiave in ("delta_durata_pct", "delta_loudness_lu", "distanza_spettrale_db"):
+                valori = [confronto[chiave] for confronto in confronti if confronto[chiave] is not None]
+                risultato[chiave] = round(float(np.mean(np.abs(valori))), 2) if valori else None
+            risultati.append(risultato)
+            applicato = risultato["applicato"]
+            print(
+                f"{specifica:<28} {applicato['parallelismo']}×{applicato['thread_intra']:<6} {risultato['avvio_s']:>9.1f} "
+                f"{risultato['p50_ms']:>9.1f} {risultato['p95_ms']:>9.1f} {risultato['throughput_x'] or 0:>10.2f}x "
+                f"{risultato['delta_durata_pct'] or 0:>7.1f}% {risultato['delta_loudness_lu'] or 0:>7.2f} LU "
+                f"{risultato['distanza_spettrale_db'] or 0:>6.2f} dB",
+                flush=True,
+            )
+
+    if argomenti.json:
+        with open(argomenti.json, "w", encoding="utf-8") as f:
+            json.dump({"motore": argomenti.motore, "profili": risultati}, f, indent=2, ensure_ascii=False)
+        print(f"Risultati salvati in {argomenti.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
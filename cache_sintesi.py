@@ -0,0 +1,159 @@
+import os
+import re
+import hashlib
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# --- Cache su disco dei segmenti sintetizzati ---
+# Ogni frase sintetizzata viene salvata con una chiave che dipende dal testo normalizzato,
+# dal contenuto del file della voce, dalla lingua e dal modello: rigenerando un testo
+# corretto vengono risintetizzate solo le frasi cambiate.
+
+CARTELLA_CACHE_SINTESI = "cache_sintesi"
+ENV_MAX_MB_CACHE_SINTESI = "NOVA_CACHE_SINTESI_MB"
+MAX_MB_CACHE_SINTESI = 2048
+
+_SPAZI = re.compile(r"\s+")
+
+# Impronte dei file già calcolate, indicizzate per (percorso, dimensione, mtime)
+_impronte_file = {}
+_lock_impronte = threading.Lock()
+
+
+def impronta_file(percorso):
+    """SHA-256 del contenuto di un file, ricalcolato solo se dimensione o mtime cambiano."""
+    info = os.stat(percorso)
+    chiave = (os.path.abspath(percorso), info.st_size, info.st_mtime_ns)
+    with _lock_impronte:
+        if chiave in _impronte_file:
+            return _impronte_file[chiave]
+    sha = hashlib.sha256()
+    with open(percorso, "rb") as f:
+        for blocco in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(blocco)
+    with _lock_impronte:
+        _impronte_file[chiave] = sha.hexdigest()
+    return _impronte_file[chiave]
+
+
+def normalizza_testo(testo):
+    """Normalizzazione usata per la chiave: Unicode NFC e spazi compattati (maiuscole e accenti contano)."""
+    return _SPAZI.sub(" ", unicodedata.normalize("NFC", testo)).strip()
+
+
+class CacheSintesi:
+    """
+    Cache LRU su disco, limitata in dimensione, dei WAV sintetizzati per frase.
+    Le scritture sono atomiche (file temporaneo + rename) e l'ordine LRU sopravvive ai
+    riavvii tramite l'mtime dei file.
+    """
+
+    def __init__(self, cartella=CARTELLA_CACHE_SINTESI, max_bytes=MAX_MB_CACHE_SINTESI * 1024 * 1024):
+        self.cartella = cartella
+        self.max_bytes = max_bytes
+        self.hit = 0
+        self.miss = 0
+        self._lock = threading.Lock()
+        self._voci = OrderedDict()  # chiave -> dimensione in byte, dalla meno recente
+        self._bytes_totali = 0
+        os.makedirs(cartella, exist_ok=True)
+        self._carica_indice()
+
+    def _carica_indice(self):
+        voci = []
+        for nome in os.listdir(self.cartella):
+            if not nome.endswith(".wav"):
+                continue
+            info = os.stat(os.path.join(self.cartella, nome))
+            voci.append((info.st_mtime_ns, nome[:-len(".wav")], info.st_size))
+        for _, chiave, dimensione in sorted(voci):
+            self._voci[chiave] = dimensione
+            self._bytes_totali += dimensione
+
+    def _percorso(self, chiave):
+        return os.path.join(self.cartella, f"{chiave}.wav")
+
+    @staticmethod
+    def chiave(testo, impronta_speaker, lingua, modello):
+        """Chiave content-addressed di una frase."""
+        materiale = "\x1f".join([normalizza_testo(testo), impronta_speaker, lingua, modello])
+        return hashlib.sha256(materiale.encode("utf-8")).hexdigest()
+
+    def leggi(self, chiave):
+        """Restituisce i bytes del WAV in cache, oppure None."""
+        with self._lock:
+            presente = chiave in self._voci
+            if presente:
+                self._voci.move_to_end(chiave)
+                self.hit += 1
+            else:
+                self.miss += 1
+        if not presente:
+            return None
+        percorso = self._percorso(chiave)
+        try:
+            with open(percorso, "rb") as f:
+                dati = f.read()
+            os.utime(percorso)
+            return dati
+        except FileNotFoundError:
+            # Rimosso dall'esterno: conta come miss
+            with self._lock:
+                self._bytes_totali -= self._voci.pop(chiave, 0)
+                self.hit -= 1
+                self.miss += 1
+            return None
+
+    def scrivi(self, chiave, dati):
+        """Salva un WAV in cache in modo atomico ed elimina le voci meno recenti oltre il limite."""
+        descrittore, percorso_temporaneo = tempfile.mkstemp(dir=self.cartella, suffix=".tmp")
+        try:
+            with os.fdopen(descrittore, "wb") as f:
+                f.write(dati)
+            os.replace(percorso_temporaneo, self._percorso(chiave))
+        except BaseException:
+            if os.path.exists(percorso_temporaneo):
+                os.remove(percorso_temporaneo)
+            raise
+
+        da_eliminare = []
+        with self._lock:
+            self._bytes_totali += len(dati) - self._voci.pop(chiave, 0)
+            self._voci[chiave] = len(dati)
+            while self._bytes_totali > self.max_bytes and len(self._voci) > 1:
+                vecchia, dimensione = self._voci.popitem(last=False)
+                self._bytes_totali -= dimensione
+                da_eliminare.append(vecchia)
+        for vecchia in da_eliminare:
+            try:
+                os.remove(self._percorso(vecchia))
+            except FileNotFoundError:
+                pass
+
+    def statistiche(self):
+        with self._lock:
+            totale = self.hit + self.miss
+            return {
+                "hit": self.hit,
+                "miss": self.miss,
+                "hit_ratio": self.hit / totale if totale else 0.0,
+                "voci": len(self._voci),
+                "bytes": self._bytes_totali,
+            }
+
+
+# --- Cache condivisa dall'applicazione ---
+_cache_condivisa = None
+_lock_cache_condivisa = threading.Lock()
+
+
+def ottieni_cache_condivisa():
+    """Restituisce la cache di sintesi condivisa dal processo (limite in MB da NOVA_CACHE_SINTESI_MB)."""
+    global _cache_condivisa
+    with _lock_cache_condivisa:
+        if _cache_condivisa is None:
+            max_mb = int(os.environ.get(ENV_MAX_MB_CACHE_SINTESI, MAX_MB_CACHE_SINTESI))
+            _cache_condivisa = CacheSintesi(max_bytes=max_mb * 1024 * 1024)
+        return _cache_condivisa
@@ -0,0 +1,254 @@
+import os
+import re
+import shutil
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_wav import ScrittoreWav, componi_wav, leggi_pcm, silenzio_pcm, durata_secondi
+from cache_sintesi import impronta_file
+from filtri_audio import filtra_wav
+from motore_tts import LINGUA_PREDEFINITA, ErroreSintesi
+from pipeline_sintesi import PAUSA_TRA_FRASI_MS, dividi_in_frasi, risolutore_pigro, risolvi_voce, sintetizza_frase
+
+# --- Copioni a più voci ---
+# Dialoghi e salmi responsoriali: ogni battuta del copione è assegnata a una voce di
+# SPEAKER_DIR. Le frasi vengono raggruppate per voce e inviate al worker una voce alla volta,
+# così il condizionamento di ogni voce è calcolato una sola volta e le sue frasi vengono
+# sintetizzate in parallelo (le frasi ripetute dalla stessa voce, come un ritornello, una
+# sola volta). Le battute vengono poi montate in ordine di copione su un unico WAV, con il
+# preset di filtri di ogni voce e le pause tra una battuta e l'altra.
+#
+# Formato del copione:
+#   # commento
+#   @voce Solista = Aaron_Dreschner pitch=-1 velocita=0.95 volume=2 loudness=-16
+#   @pausa 1500                      (silenzio prima della battuta successiva, in ms)
+#   Solista: Il Signore è il mio pastore:
+#   non manco di nulla.              (le righe senza voce continuano la battuta precedente)
+#   Ana_Florence: Rit. ...           (una voce di SPEAKER_DIR si può usare senza @voce)
+
+# Silenzio predefinito tra una battuta e la successiva
+INTERVALLO_BATTUTE_MS = 600
+# Chiavi del preset di una voce e loro conversione (sono accettati anche i nomi del manifest batch)
+_CHIAVI_PRESET = {
+    "pitch": ("pitch", int),
+    "velocita": ("velocita", float),
+    "velocità": ("velocita", float),
+    "speed": ("velocita", float),
+    "volume": ("volume", float),
+    "loudness": ("loudness", float),
+}
+
+_DIRETTIVA_VOCE = re.compile(r"@voce\s+(?P<nome>[\w.-]+)\s*=\s*(?P<speaker>[^\s=]+)(?P<preset>(?:\s+\S+=\S+)*)\s*$")
+_DIRETTIVA_PAUSA = re.compile(r"@pausa\s+(?P<ms>\d+)\s*(?:ms)?\s*$")
+_INIZIO_BATTUTA = re.compile(r"(?P<nome>[\w.-]+)\s*:\s*(?P<testo>.*)$")
+
+Voce = namedtuple("Voce", ["nome", "speaker", "pitch", "velocita", "volume", "loudness"])
+Voce.__doc__ = "Voce del copione: nome usato nelle battute, speaker di SPEAKER_DIR e preset dei filtri."
+Battuta = namedtuple("Battuta", ["voce", "testo", "pausa_prima_ms", "riga"])
+Battuta.__doc__ = (
+    "Battuta del copione: nome della voce, testo, silenzio prima della battuta (None: l'intervallo "
+    "predefinito) e riga del copione in cui inizia."
+)
+Copione = namedtuple("Copione", ["voci", "battute"])
+
+
+class ErroreCopione(ValueError):
+    """Copione non valido: il messaggio indica la riga."""
+
+
+def _voce_predefinita(speaker):
+    return Voce(speaker, speaker, 0, 1.0, 0.0, None)
+
+
+def _analizza_preset(testo, numero_riga):
+    valori = {}
+    for assegnazione in testo.split():
+        chiave, _, valore = assegnazione.partition("=")
+        if chiave.lower() not in _CHIAVI_PRESET:
+            raise ErroreCopione(
+                f"Riga {numero_riga}: opzione di voce sconosciuta '{chiave}' "
+                f"(disponibili: pitch, velocita, volume, loudness)."
+            )
+        campo, conversione = _CHIAVI_PRESET[chiave.lower()]
+        try:
+            valori[campo] = conversione(valore.replace(",", "."))
+        except ValueError:
+            raise ErroreCopione(f"Riga {numero_riga}: valore non valido per {chiave}: {valore!r}.") from None
+    if valori.get("velocita", 1.0) <= 0:
+        raise ErroreCopione(f"Riga {numero_riga}: la velocità deve essere maggiore di zero.")
+    return valori
+
+
+def analizza_copione(testo, speaker_disponibili):
+    """
+    Copione (voci usate e battute in ordine) dal testo. `speaker_disponibili` sono i nomi delle
+    voci di SPEAKER_DIR: si possono usare direttamente nelle battute o tramite un alias `@voce`.
+    Solleva ErroreCopione con il numero della riga per voci sconosciute e direttive non valide.
+    """
+    speaker_disponibili = set(speaker_disponibili)
+    alias = {}
+    battute = []
+    righe_battuta = None
+    pausa_prima_ms = None
+
+    def chiudi_battuta():
+        if righe_battuta is not None:
+            voce, riga, pausa, righe = righe_battuta
+            testo_battuta = "\n".join(righe).strip()
+            if testo_battuta:
+                battute.append(Battuta(voce, testo_battuta, pausa, riga))
+
+    for numero_riga, riga in enumerate(testo.splitlines(), start=1):
+        riga = riga.strip()
+        if not riga or riga.startswith("#"):
+            continue
+
+        if riga.startswith("@"):
+            voce = _DIRETTIVA_VOCE.match(riga)
+            pausa = _DIRETTIVA_PAUSA.match(riga)
+            if voce:
+                if voce["speaker"] not in speaker_disponibili:
+                    raise ErroreCopione(f"Riga {numero_riga}: voce '{voce['speaker']}' non trovata tra gli speaker.")
+                preset = _analizza_preset(voce["preset"], numero_riga)
+                alias[voce["nome"]] = _voce_predefinita(voce["speaker"])._replace(nome=voce["nome"], **preset)
+            elif pausa:
+                pausa_prima_ms = int(pausa["ms"])
+            else:
+                raise ErroreCopione(
+                    f"Riga {numero_riga}: direttiva non valida (usa '@voce Nome = Speaker [pitch=.. velocita=.. "
+                    f"volume=.. loudness=..]' oppure '@pausa <ms>')."
+                )
+            continue
+
+        inizio = _INIZIO_BATTUTA.match(riga)
+        if inizio and (inizio["nome"] in alias or inizio["nome"] in speaker_disponibili):
+            chiudi_battuta()
+            righe_battuta = (inizio["nome"], numero_riga, pausa_prima_ms, [inizio["testo"]])
+            pausa_prima_ms = None
+        elif inizio and righe_battuta is None:
+            raise ErroreCopione(f"Riga {numero_riga}: voce '{inizio['nome']}' sconosciuta (definiscila con @voce).")
+        elif righe_battuta is None:
+            raise ErroreCopione(f"Riga {numero_riga}: testo senza voce (inizia la battuta con 'Voce: testo').")
+        else:
+            righe_battuta[3].append(riga)
+    chiudi_battuta()
+
+    if not battute:
+        raise ErroreCopione("Il copione non contiene battute.")
+    voci = {}
+    for battuta in battute:
+        if battuta.voce not in voci:
+            voci[battuta.voce] = alias.get(battuta.voce) or _voce_predefinita(battuta.voce)
+    return Copione(voci, battute)
+
+
+def renderizza_copione(copione, percorso_uscita, cartella_speaker, worker, indice=None, cache=None,
+                       lingua=LINGUA_PREDEFINITA, pausa_ms=PAUSA_TRA_FRASI_MS, intervallo_ms=INTERVALLO_BATTUTE_MS,
+                       max_paralleli=None, al_progresso=None, cartella_lavoro=None):
+    """
+    Sintetizza il copione e scrive in `percorso_uscita` un solo WAV con le battute in ordine,
+    `pausa_ms` tra le frasi di una battuta e `intervallo_ms` tra le battute (o la `@pausa` del
+    copione). Le frasi vengono inviate al worker raggruppate per speaker, con al massimo
+    `max_paralleli` sintesi in corso (predefinito: il parallelismo del worker).
+    `al_progresso(completate, totale)` viene chiamata dopo ogni battuta montata; un'eccezione
+    sollevata da `al_progresso` interrompe il render.
+    Restituisce un dizionario con percorso, battute, voci, frasi, frasi_ripetute e durata_s.
+    """
+    battute = [(battuta, dividi_in_frasi(battuta.testo)) for battuta in copione.battute]
+    # Le battute di sola punteggiatura non producono audio
+    battute = [(battuta, frasi) for battuta, frasi in battute if frasi]
+    if not battute:
+        raise ErroreSintesi("Copione vuoto per la generazione vocale.")
+
+    # Ogni speaker viene risolto una volta (anche se è usato da più alias con preset diversi)
+    speaker_usati = []
+    for battuta, _ in battute:
+        speaker = copione.voci[battuta.voce].speaker
+        if speaker not in speaker_usati:
+            speaker_usati.append(speaker)
+    argomenti_voce = {}
+    for speaker in speaker_usati:
+        argomenti = risolvi_voce(speaker, cartella_speaker, worker, indice)
+        if cache is not None and argomenti["impronta_speaker"] is None:
+            argomenti["impronta_speaker"] = impronta_file(argomenti["speaker_wav"])
+        argomenti["condizionamento"] = risolutore_pigro(argomenti["condizionamento"])
+        argomenti_voce[speaker] = argomenti
+
+    cartella = cartella_lavoro or tempfile.mkdtemp(prefix="nova_copione_")
+    max_paralleli = max_paralleli or getattr(worker, "parallelismo", 1)
+    percorso_parziale = percorso_uscita + ".part"
+    scrittore = None
+    pool = ThreadPoolExecutor(max_workers=max_paralleli, thread_name_prefix="nova-copione")
+    try:
+        # Invio raggruppato per speaker, nell'ordine in cui compaiono: le frasi uguali della stessa
+        # voce (es. il ritornello di un salmo) vengono sintetizzate una sola volta
+        futures = {}
+        for speaker in speaker_usati:
+            for battuta, frasi in battute:
+                if copione.voci[battuta.voce].speaker != speaker:
+                    continue
+                for frase in frasi:
+                    if (speaker, frase) not in futures:
+                        out_path = os.path.join(cartella, f"copione_{len(futures):05d}.wav")
+                        futures[(speaker, frase)] = pool.submit(
+                            sintetizza_frase, frase, worker=worker, out_path=out_path, lingua=lingua, cache=cache,
+                            **argomenti_voce[speaker],
+                        )
+
+        # Montaggio in ordine di copione
+        for numero, (battuta, frasi) in enumerate(battute):
+            voce = copione.voci[battuta.voce]
+            try:
+                blocchi, formato = [], None
+                for frase in frasi:
+                    formato_frase, pcm = futures[(voce.speaker, frase)].result()
+                    if formato is None:
+                        formato = formato_frase
+                    elif formato_frase != formato:
+                        raise ErroreSintesi(f"Formato audio incoerente tra le frasi: {formato_frase} invece di {formato}.")
+                    if blocchi:
+                        blocchi.append(silenzio_pcm(formato, pausa_ms))
+                    blocchi.append(pcm)
+                wav = componi_wav(formato, blocchi)
+                # Il preset della voce; la frequenza resta quella della linea temporale anche con il pitch
+                wav = filtra_wav(
+                    wav, voce.pitch, voce.velocita, voce.volume, loudness_lufs=voce.loudness,
+                    frequenza=scrittore.formato.frequenza if scrittore else None,
+                )
+                formato, pcm = leggi_pcm(wav)
+                if scrittore is None:
+                    scrittore = ScrittoreWav(percorso_parziale, formato)
+                elif formato != scrittore.formato:
+                    raise ErroreSintesi(f"Formato audio incoerente: {formato} invece di {scrittore.formato}.")
+            except ErroreSintesi as e:
+                raise ErroreSintesi(f"Battuta {numero + 1} (riga {battuta.riga}, {battuta.voce}): {e}") from e
+
+            if scrittore.n_bytes:
+                pausa = battuta.pausa_prima_ms if battuta.pausa_prima_ms is not None else intervallo_ms
+                scrittore.scrivi(silenzio_pcm(formato, pausa))
+            with pcm:
+                scrittore.scrivi(pcm)
+            if al_progresso is not None:
+                al_progresso(numero + 1, len(battute))
+
+        scrittore.chiudi()
+        os.replace(percorso_parziale, percorso_uscita)
+    finally:
+        # Se il render si interrompe, le frasi non ancora avviate vengono annullate
+        pool.shutdown(wait=True, cancel_futures=True)
+        if scrittore is not None:
+            scrittore.chiudi()
+        if os.path.exists(percorso_parziale):
+            os.remove(percorso_parziale)
+        if cartella_lavoro is None:
+            shutil.rmtree(cartella, ignore_errors=True)
+
+    return {
+        "percorso": percorso_uscita,
+        "battute": len(battute),
+        "voci": len(speaker_usati),
+        "frasi": len(futures),
+        "frasi_ripetute": sum(len(frasi) for _, frasi in battute) - len(futures),
+        "durata_s": durata_secondi(scrittore.formato, scrittore.n_bytes),
+    }
@@ -0,0 +1,188 @@
+import os
+import json
+import mmap
+import tempfile
+from contextlib import closing
+
+from audio_wav import FormatoPCM, ScrittoreWav, analizza_wav, silenzio_pcm, durata_secondi
+from cache_sintesi import impronta_file
+from filtri_audio import filtra_file_wav
+from motore_tts import LINGUA_PREDEFINITA, ErroreSintesi
+from pipeline_sintesi import PAUSA_TRA_FRASI_MS, dividi_in_frasi, genera_blocchi, risolvi_voce
+
+# --- Documenti lunghi ---
+# Un documento (es. un libro) viene letto e sintetizzato un paragrafo alla volta: le frasi
+# vengono accodate direttamente a un WAV su disco, senza tenere l'audio in memoria. Dopo ogni
+# paragrafo un file di ripresa registra quanti paragrafi e quanti byte di audio sono completi,
+# così un render interrotto (errore, annullamento, riavvio) riprende dal paragrafo successivo.
+# I filtri vengono applicati alla fine, da file a file e a blocchi (vedi filtri_audio.filtra_file_wav).
+
+CARTELLA_DOCUMENTI = "documenti_lunghi"
+# Silenzio tra un paragrafo e il successivo (tra le frasi vale la pausa normale)
+PAUSA_TRA_PARAGRAFI_MS = 700
+# Un "paragrafo" senza righe vuote viene comunque chiuso oltre questa lunghezza, a fine riga,
+# perché la ripresa lavora a paragrafi
+MAX_CARATTERI_PARAGRAFO = 2000
+VERSIONE_RIPRESA = 1
+
+
+def leggi_paragrafi(percorso, max_caratteri=MAX_CARATTERI_PARAGRAFO):
+    """
+    Legge il documento una riga alla volta e produce tuple (testo, nuovo_paragrafo): i paragrafi
+    sono separati da righe vuote; quelli troppo lunghi vengono divisi a fine riga e le parti
+    successive hanno `nuovo_paragrafo` False.
+    """
+    righe, lunghezza, nuovo_paragrafo = [], 0, True
+    with open(percorso, "r", encoding="utf-8") as f:
+        for riga in f:
+            riga = riga.strip()
+            if riga:
+                righe.append(riga)
+                lunghezza += len(riga) + 1
+            if righe and (not riga or lunghezza >= max_caratteri):
+                yield "\n".join(righe), nuovo_paragrafo
+                # Dopo una riga vuota il blocco successivo è un nuovo paragrafo
+                righe, lunghezza, nuovo_paragrafo = [], 0, not riga
+            elif not riga:
+                nuovo_paragrafo = True
+    if righe:
+        yield "\n".join(righe), nuovo_paragrafo
+
+
+def percorsi_render(percorso_uscita):
+    """Percorsi del WAV sintetizzato (prima dei filtri) e del file di ripresa di un render."""
+    return percorso_uscita + ".sintesi.wav", percorso_uscita + ".ripresa.json"
+
+
+def _carica_ripresa(percorso_ripresa, percorso_grezzo, documento, parametri):
+    """Stato di ripresa valido per questo documento e questi parametri, altrimenti None."""
+    try:
+        with open(percorso_ripresa, "r", encoding="utf-8") as f:
+            stato = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if (
+        stato.get("versione") != VERSIONE_RIPRESA
+        or stato.get("documento") != documento
+        or stato.get("parametri") != parametri
+    ):
+        return None
+    # Il WAV parziale deve contenere almeno l'audio dei paragrafi registrati come completi
+    try:
+        if os.path.getsize(percorso_grezzo) < 44 + stato["bytes_pcm"]:
+            return None
+    except OSError:
+        return None
+    return stato
+
+
+def _salva_ripresa(percorso_ripresa, stato):
+    cartella = os.path.dirname(os.path.abspath(percorso_ripresa))
+    descrittore, percorso_temporaneo = tempfile.mkstemp(dir=cartella, suffix=".tmp")
+    with os.fdopen(descrittore, "w", encoding="utf-8") as f:
+        json.dump(stato, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(percorso_temporaneo, percorso_ripresa)
+
+
+def renderizza_documento(percorso_testo, percorso_uscita, nome_speaker, cartella_speaker, worker, indice=None,
+                         cache=None, lingua=LINGUA_PREDEFINITA, pausa_ms=PAUSA_TRA_FRASI_MS,
+                         pausa_paragrafi_ms=PAUSA_TRA_PARAGRAFI_MS, pitch_semitoni=0, velocita_fattore=1.0,
+                         volume_db=0, taglia_silenzi=False, loudness_lufs=None, max_paralleli=None, al_paragrafo=None,
+                         cartella_lavoro=None):
+    """
+    Sintetizza il documento `percorso_testo` in `percorso_uscita` con memoria costante, qualunque
+    sia la lunghezza del documento. Se esiste un render interrotto dello stesso documento con gli
+    stessi parametri di sintesi, riprende dal primo paragrafo non completato (i filtri non
+    fanno parte della ripresa: vengono applicati solo alla fine, compresi taglio dei silenzi e
+    normalizzazione della loudness, la cui analisi legge il file grezzo a blocchi).
+    `al_paragrafo(completati, totale)` viene chiamata dopo ogni paragrafo salvato; un'eccezione
+    sollevata da `al_paragrafo` interrompe il render lasciando il file di ripresa.
+    Restituisce un dizionario con percorso, paragrafi, paragrafi_ripresi e durata_s.
+    """
+    voce = risolvi_voce(nome_speaker, cartella_speaker, worker, indice)
+    if voce["impronta_speaker"] is None:
+        voce["impronta_speaker"] = impronta_file(voce["speaker_wav"])
+    parametri = {
+        "speaker": voce["impronta_speaker"], "lingua": lingua, "modello": worker.id_modello,
+        "pausa_ms": pausa_ms, "pausa_paragrafi_ms": pausa_paragrafi_ms,
+    }
+    documento = impronta_file(percorso_testo)
+    percorso_grezzo, percorso_ripresa = percorsi_render(percorso_uscita)
+
+    totale = sum(1 for _ in leggi_paragrafi(percorso_testo))
+    if totale == 0:
+        raise ErroreSintesi("Documento vuoto per la generazione vocale.")
+
+    stato = _carica_ripresa(percorso_ripresa, percorso_grezzo, documento, parametri)
+    ripresi = stato["paragrafi"] if stato else 0
+    scrittore = None
+    if stato and stato["formato"]:
+        scrittore = ScrittoreWav(percorso_grezzo, FormatoPCM(*stato["formato"]), riprendi_da=stato["bytes_pcm"])
+
+    try:
+        for numero, (paragrafo, nuovo_paragrafo) in enumerate(leggi_paragrafi(percorso_testo)):
+            # I paragrafi di sola punteggiatura (es. separatori "***") non producono audio
+            if numero < ripresi or not dividi_in_frasi(paragrafo):
+                continue
+            try:
+                generatore = genera_blocchi(
+                    paragrafo, worker=worker, lingua=lingua, max_paralleli=max_paralleli,
+                    cartella_lavoro=cartella_lavoro, cache=cache, **voce,
+                )
+                with closing(generatore):
+                    for indice_frase, _, formato, pcm in generatore:
+                        if scrittore is None:
+                            scrittore = ScrittoreWav(percorso_grezzo, formato)
+                        elif formato != scrittore.formato:
+                            raise ErroreSintesi(
+                                f"Formato audio incoerente nel paragrafo {numero + 1}: {formato} invece di {scrittore.formato}."
+                            )
+                        if scrittore.n_bytes:
+                            pausa = pausa_paragrafi_ms if indice_frase == 0 and nuovo_paragrafo else pausa_ms
+                            scrittore.scrivi(silenzio_pcm(formato, pausa))
+                        scrittore.scrivi(pcm)
+            except ErroreSintesi as e:
+                raise ErroreSintesi(f"Paragrafo {numero + 1} di {totale}: {e}") from e
+
+            # Prima l'audio su disco, poi il file di ripresa che lo dichiara completo
+            if scrittore is not None:
+                scrittore.sincronizza()
+            _salva_ripresa(percorso_ripresa, {
+                "versione": VERSIONE_RIPRESA, "documento": documento, "parametri": parametri,
+                "paragrafi": numero + 1, "bytes_pcm": scrittore.n_bytes if scrittore else 0,
+                "formato": list(scrittore.formato) if scrittore else None,
+            })
+            if al_paragrafo is not None:
+                al_paragrafo(numero + 1, totale)
+    finally:
+        if scrittore is not None:
+            scrittore.chiudi()
+
+    if scrittore is None:
+        raise ErroreSintesi("Il worker TTS non ha prodotto audio per il documento.")
+
+    formato, n_bytes = scrittore.formato, scrittore.n_bytes
+    if (pitch_semitoni, velocita_fattore, volume_db, taglia_silenzi, loudness_lufs) == (0, 1.0, 0, False, None):
+        os.replace(percorso_grezzo, percorso_uscita)
+    else:
+        # Se i filtri si interrompono, la ripresa trova tutti i paragrafi completi e rifà solo questo passo
+        percorso_filtrato = percorso_uscita + ".filtri.wav"
+        filtra_file_wav(
+            percorso_grezzo, percorso_filtrato, pitch_semitoni, velocita_fattore, volume_db,
+            taglia_silenzi=taglia_silenzi, loudness_lufs=loudness_lufs,
+        )
+        os.replace(percorso_filtrato, percorso_uscita)
+        os.remove(percorso_grezzo)
+        # Velocità e taglio cambiano la durata: fa fede l'intestazione del file filtrato
+        with open(percorso_uscita, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mappa:
+            formato, _, n_bytes = analizza_wav(mappa)
+    os.remove(percorso_ripresa)
+
+    return {
+        "percorso": percorso_uscita,
+        "paragrafi": totale,
+        "paragrafi_ripresi": ripresi,
+        "durata_s": durata_secondi(formato, n_bytes),
+    }
@@ -0,0 +1,78 @@
+import os
+
+from filtri_audio import filtra_file_in_formati, ErroreFiltri
+
+# --- Esportazione in più formati ---
+# L'audio viene decodificato e filtrato una sola volta: un unico processo ffmpeg divide il
+# risultato dei filtri (asplit) tra gli encoder dei formati richiesti, invece di ripetere la
+# catena dei filtri per ogni formato.
+
+FORMATI_ESPORTAZIONE = {
+    "wav": {"nome": "WAV (PCM 16 bit)", "estensione": "wav", "mime": "audio/wav", "opzioni": ["-c:a", "pcm_s16le"], "bitrate": False},
+    "mp3": {"nome": "MP3", "estensione": "mp3", "mime": "audio/mpeg", "opzioni": ["-c:a", "libmp3lame"], "bitrate": True},
+    "opus": {"nome": "Opus (OGG)", "estensione": "ogg", "mime": "audio/ogg", "opzioni": ["-c:a", "libopus"], "bitrate": True},
+    "flac": {"nome": "FLAC", "estensione": "flac", "mime": "audio/flac", "opzioni": ["-c:a", "flac"], "bitrate": False},
+}
+BITRATE_PREDEFINITO_KBPS = 192
+# Frequenze di campionamento accettate dall'encoder Opus
+FREQUENZE_OPUS = (8000, 12000, 16000, 24000, 48000)
+
+
+class ErroreEsportazione(Exception):
+    """Formato o opzioni di esportazione non validi, oppure codifica fallita."""
+    pass
+
+
+def opzioni_uscita(formato, bitrate_kbps=None, frequenza=None):
+    """Opzioni ffmpeg dell'uscita di un formato: encoder, bitrate (solo formati compressi) e frequenza."""
+    if formato not in FORMATI_ESPORTAZIONE:
+        raise ErroreEsportazione(f"Formato di esportazione sconosciuto: {formato}. Disponibili: {', '.join(FORMATI_ESPORTAZIONE)}")
+    info = FORMATI_ESPORTAZIONE[formato]
+    opzioni = list(info["opzioni"])
+    if info["bitrate"] and bitrate_kbps:
+        opzioni += ["-b:a", f"{int(bitrate_kbps)}k"]
+    if frequenza:
+        if formato == "opus" and int(frequenza) not in FREQUENZE_OPUS:
+            raise ErroreEsportazione(
+                f"Opus non supporta {frequenza} Hz. Frequenze disponibili: {', '.join(map(str, FREQUENZE_OPUS))}"
+            )
+        opzioni += ["-ar", str(int(frequenza))]
+    return opzioni
+
+
+def esporta_audio(input_path, cartella, nome_base, formati, pitch_semitoni=0, velocita_fattore=1.0, volume_db=0,
+                  bitrate_kbps=BITRATE_PREDEFINITO_KBPS, frequenza=None, taglia_silenzi=False, loudness_lufs=None,
+                  analisi=None):
+    """
+    Esporta il WAV `input_path` con i filtri indicati in `cartella`/`nome_base`.<estensione> per
+    ogni formato di `formati` (chiavi di FORMATI_ESPORTAZIONE), con una sola passata di ffmpeg.
+    `frequenza` None mantiene la frequenza dell'audio filtrato; taglio dei silenzi, loudness e
+    analisi come in filtri_audio.filtra_wav. Restituisce {formato: percorso}.
+    I file vengono scritti con un nome temporaneo e rinominati solo se la codifica riesce.
+    """
+    formati = list(dict.fromkeys(formati))
+    if not formati:
+        raise ErroreEsportazione("Nessun formato di esportazione selezionato.")
+    percorsi, uscite = {}, []
+    for formato in formati:
+        opzioni = opzioni_uscita(formato, bitrate_kbps, frequenza)
+        estensione = FORMATI_ESPORTAZIONE[formato]["estensione"]
+        percorsi[formato] = os.path.join(cartella, f"{nome_base}.{estensione}")
+        # ffmpeg sceglie il contenitore dall'estensione: il suffisso temporaneo va prima
+        uscite.append((os.path.join(cartella, f"{nome_base}.parziale.{estensione}"), opzioni))
+
+    try:
+        filtra_file_in_formati(
+            input_path, uscite, pitch_semitoni, velocita_fattore, volume_db,
+            taglia_silenzi=taglia_silenzi, loudness_lufs=loudness_lufs, analisi=analisi,
+        )
+    except BaseException as e:
+        for percorso_parziale, _ in uscite:
+            if os.path.exists(percorso_parziale):
+                os.remove(percorso_parziale)
+        if isinstance(e, ErroreFiltri):
+            raise ErroreEsportazione(f"Codifica fallita: {e}") from e
+        raise
+    for formato, (percorso_parziale, _) in zip(formati, uscite):
+        os.replace(percorso_parziale, percorsi[formato])
+    return percorsi
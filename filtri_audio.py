@@ -0,0 +1,329 @@
+import io
+import mmap
+import subprocess
+import threading
+
+from audio_wav import FormatoPCM, ErroreFormatoWav, ScrittoreWav, analizza_wav, intestazione_wav
+from metriche import conta_sottoprocesso
+
+# --- Motore filtri in memoria ---
+# Volume, pitch (asetrate/atempo) e velocità vengono applicati in un solo passaggio:
+# il guadagno è calcolato in memoria con numpy (come audioop.mul di pydub), poi i campioni PCM arrivano
+# a ffmpeg su stdin e tornano su stdout, senza file intermedi. Con il solo volume non serve ffmpeg.
+# Taglio dei silenzi iniziali/finali e normalizzazione della loudness usano l'analisi dei campioni
+# già decodificati (vedi analisi_audio.py): il taglio riduce i campioni da filtrare, la
+# normalizzazione diventa un guadagno in più.
+
+# Ogni quanto un render che si può annullare controlla se è ancora richiesto
+_INTERVALLO_CONTROLLO_ANNULLAMENTO_S = 0.1
+# ffmpeg scrive sempre PCM a 16 bit, come il suo encoder WAV predefinito usato finora
+_FORMATO_USCITA_FFMPEG = ("s16le", 2)
+_CODEC_INGRESSO = {1: "u8", 2: "s16le", 3: "s24le", 4: "s32le"}
+_DIMENSIONE_LETTURA = 1024 * 1024
+
+
+class ErroreFiltri(Exception):
+    """Errore nell'applicazione dei filtri audio (es. ffmpeg terminato con errore)."""
+
+
+class FiltriAnnullati(ErroreFiltri):
+    """Il render è stato interrotto su richiesta (vedi il parametro `annullato` di filtra_wav)."""
+
+
+def catena_atempo(velocita_fattore):
+    """Filtri atempo per un fattore qualsiasi: ffmpeg accetta solo fattori tra 0.5 e 2.0 per filtro."""
+    fattore = velocita_fattore
+    filtri = []
+    while fattore > 2.0:
+        filtri.append("atempo=2.0")
+        fattore /= 2.0
+    while fattore < 0.5:
+        filtri.append("atempo=0.5")
+        fattore /= 0.5
+    if fattore != 1.0:  # Aggiungi l'ultimo fattore rimanente
+        filtri.append(f"atempo={fattore}")
+    return filtri
+
+
+def costruisci_catena_filtri(frequenza, pitch_semitoni=0, velocita_fattore=1.0):
+    """
+    Catena di filtri ffmpeg per pitch e velocità (None se non c'è nulla da applicare).
+    Restituisce anche la frequenza di campionamento dell'uscita, che cambia con asetrate.
+    """
+    filtri = []
+    frequenza_uscita = frequenza
+    if pitch_semitoni != 0:
+        fattore_pitch = 2.0 ** (pitch_semitoni / 12.0)
+        frequenza_uscita = int(frequenza * fattore_pitch)
+        filtri.append(f"asetrate={frequenza_uscita},atempo={1 / fattore_pitch}")
+    if velocita_fattore != 1.0:
+        filtri.extend(catena_atempo(velocita_fattore))
+    return (",".join(filtri) if filtri else None), frequenza_uscita
+
+
+def _decodifica_con_pydub(dati_wav):
+    """Ripiego per WAV non PCM (es. float): decodifica con pydub e restituisce formato e campioni."""
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_file(io.BytesIO(dati_wav))
+    formato = FormatoPCM(audio.channels, audio.sample_width, audio.frame_rate)
+    return formato, memoryview(audio.raw_data)
+
+
+def _campioni(dati_wav):
+    """Formato e vista sui campioni del WAV in ingresso (senza copie per i WAV PCM)."""
+    try:
+        formato, offset, lunghezza = analizza_wav(dati_wav)
+    except ErroreFormatoWav:
+        return _decodifica_con_pydub(bytes(dati_wav))
+    return formato, memoryview(dati_wav)[offset:offset + lunghezza]
+
+
+def _esegui_ffmpeg(comando, ingresso, uscita=None, annullato=None):
+    """
+    Esegue ffmpeg passando `ingresso` su stdin (un buffer oppure un iterabile di blocchi).
+    Se `uscita` è un bytearray, lo stdout viene accodato lì; altrimenti ffmpeg scrive su file e
+    lo stdout viene ignorato. Se `annullato()` diventa vero, ffmpeg viene terminato e viene
+    sollevata FiltriAnnullati.
+    """
+    conta_sottoprocesso("ffmpeg")
+    processo = subprocess.Popen(
+        comando,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE if uscita is not None else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    errori = []
+
+    def scrivi_ingresso():
+        try:
+            if isinstance(ingresso, (bytes, bytearray, memoryview, mmap.mmap)):
+                processo.stdin.write(ingresso)
+            else:
+                for blocco in ingresso:
+                    processo.stdin.write(blocco)
+            processo.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass  # ffmpeg ha chiuso l'ingresso: l'errore arriva dallo stderr
+
+    def leggi_errori():
+        errori.append(processo.stderr.read())
+
+    fine = threading.Event()
+    interrotto = []
+
+    def sorveglia_annullamento():
+        while not fine.wait(_INTERVALLO_CONTROLLO_ANNULLAMENTO_S):
+            if annullato():
+                interrotto.append(True)
+                processo.kill()
+                return
+
+    thread_scrittura = threading.Thread(target=scrivi_ingresso, daemon=True)
+    thread_errori = threading.Thread(target=leggi_errori, daemon=True)
+    thread_scrittura.start()
+    thread_errori.start()
+    if annullato is not None:
+        threading.Thread(target=sorveglia_annullamento, daemon=True).start()
+    if uscita is not None:
+        while True:
+            blocco = processo.stdout.read1(_DIMENSIONE_LETTURA)
+            if not blocco:
+                break
+            uscita += blocco
+    thread_scrittura.join()
+    thread_errori.join()
+    codice = processo.wait()
+    fine.set()
+    if interrotto:
+        raise FiltriAnnullati("Render dei filtri annullato.")
+    if codice != 0:
+        stderr = errori[0].decode("utf-8", errors="replace") if errori else ""
+        raise ErroreFiltri(f"FFmpeg ha fallito con codice {codice}: {stderr}")
+
+
+def applica_guadagno(formato, pcm, volume_db):
+    """
+    Guadagno in dB sui campioni PCM, con lo stesso calcolo di audioop.mul usato da pydub
+    (arrotondamento per difetto e saturazione); audioop non esiste più da Python 3.13.
+    """
+    if volume_db == 0:
+        return pcm
+    # numpy viene caricato solo quando c'è davvero un guadagno da applicare
+    import numpy as np
+
+    larghezza = formato.larghezza
+    massimo = 2 ** (8 * larghezza - 1)
+    if larghezza == 3:
+        # 24 bit: i tre byte di ogni campione diventano i byte alti di un int32, poi tornano giù
+        grezzi = np.frombuffer(pcm, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        campioni = ((grezzi[:, 0] << 8) | (grezzi[:, 1] << 16) | (grezzi[:, 2] << 24)) >> 8
+    elif larghezza == 1:
+        # PCM a 8 bit è senza segno, con lo zero a 128
+        campioni = np.frombuffer(pcm, dtype=np.uint8).astype(np.int16) - 128
+    else:
+        campioni = np.frombuffer(pcm, dtype=f"<i{larghezza}")
+    scalati = np.clip(np.floor(campioni * 10 ** (volume_db / 20.0)), -massimo, massimo - 1)
+
+    if larghezza == 3:
+        return scalati.astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    if larghezza == 1:
+        return (scalati + 128).astype(np.uint8).tobytes()
+    return scalati.astype(f"<i{larghezza}").tobytes()
+
+
+def _taglio_e_guadagno(formato, pcm, n_bytes, volume_db, taglia_silenzi, loudness_lufs, analisi):
+    """
+    Intervallo in byte dei campioni da tenere e guadagno complessivo in dB. L'analisi viene
+    calcolata sui campioni `pcm` solo se serve e non è già stata fornita (es. dalla cache).
+    """
+    if not taglia_silenzi and loudness_lufs is None:
+        return 0, n_bytes, volume_db
+    # L'analisi (e numpy) viene caricata solo da chi taglia i silenzi o normalizza la loudness
+    from analisi_audio import analizza_pcm, byte_taglio, guadagno_normalizzazione
+
+    if analisi is None:
+        analisi = analizza_pcm(formato, pcm)
+    inizio, fine = byte_taglio(formato, analisi, n_bytes) if taglia_silenzi else (0, n_bytes)
+    if loudness_lufs is not None:
+        volume_db += guadagno_normalizzazione(analisi, loudness_lufs)
+    return inizio, fine, volume_db
+
+
+def _comando_ffmpeg(formato, catena):
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", _CODEC_INGRESSO[formato.larghezza], "-ar", str(formato.frequenza), "-ac", str(formato.canali),
+        "-i", "pipe:0",
+        "-filter:a", catena,
+    ]
+
+
+def filtra_wav(dati_wav, pitch_semitoni=0, velocita_fattore=1.0, volume_db=0, taglia_silenzi=False,
+               loudness_lufs=None, analisi=None, frequenza=None, annullato=None):
+    """
+    Applica volume, pitch e velocità a un WAV in memoria (bytes, bytearray, memoryview o mmap)
+    e restituisce il WAV filtrato. Senza filtri restituisce l'ingresso così com'è.
+    `taglia_silenzi` toglie il silenzio prima e dopo la voce; `loudness_lufs` normalizza la
+    loudness a quel valore (il volume si somma). `analisi` è l'analisi già calcolata dell'ingresso.
+    `frequenza` ricampiona l'uscita a quella frequenza (predefinita: quella prodotta dai filtri).
+    `annullato` è una funzione senza argomenti: se diventa vera durante il render, ffmpeg viene
+    terminato e viene sollevata FiltriAnnullati.
+    """
+    formato, pcm = _campioni(dati_wav)
+    catena, frequenza_uscita = costruisci_catena_filtri(formato.frequenza, pitch_semitoni, velocita_fattore)
+    if frequenza and frequenza != frequenza_uscita:
+        # Es. per accodare audio con pitch diversi nello stesso WAV (asetrate cambia la frequenza)
+        catena = ",".join(filter(None, [catena, f"aresample={frequenza}"]))
+        frequenza_uscita = frequenza
+    inizio, fine, volume_db = _taglio_e_guadagno(formato, pcm, len(pcm), volume_db, taglia_silenzi, loudness_lufs, analisi)
+    tagliato = (inizio, fine) != (0, len(pcm))
+    pcm = pcm[inizio:fine]
+
+    if catena is None and volume_db == 0 and not tagliato:
+        return dati_wav
+    pcm = applica_guadagno(formato, pcm, volume_db)
+    if catena is None:
+        # Solo volume (ed eventuale taglio): nessun processo ffmpeg
+        uscita = bytearray(intestazione_wav(formato, len(pcm)))
+        uscita += pcm
+        return uscita
+
+    codec_uscita, larghezza_uscita = _FORMATO_USCITA_FFMPEG
+    formato_uscita = FormatoPCM(formato.canali, larghezza_uscita, frequenza_uscita)
+    # L'intestazione viene riservata in testa al buffer e compilata quando la lunghezza è nota
+    uscita = bytearray(44)
+    _esegui_ffmpeg(_comando_ffmpeg(formato, catena) + ["-f", codec_uscita, "pipe:1"], pcm, uscita, annullato)
+    uscita[:44] = intestazione_wav(formato_uscita, len(uscita) - 44)
+    return uscita
+
+
+def filtra_wav_su_file(dati_wav, output_path, pitch_semitoni=0, velocita_fattore=1.0, volume_db=0, taglia_silenzi=False,
+                       loudness_lufs=None, analisi=None):
+    """Come filtra_wav, ma scrive direttamente il WAV filtrato in `output_path`."""
+    formato, pcm = _campioni(dati_wav)
+    catena, _ = costruisci_catena_filtri(formato.frequenza, pitch_semitoni, velocita_fattore)
+
+    if catena is None:
+        with open(output_path, "wb") as f:
+            f.write(filtra_wav(dati_wav, pitch_semitoni, velocita_fattore, volume_db, taglia_silenzi, loudness_lufs, analisi))
+        return output_path
+
+    inizio, fine, volume_db = _taglio_e_guadagno(formato, pcm, len(pcm), volume_db, taglia_silenzi, loudness_lufs, analisi)
+    pcm = applica_guadagno(formato, pcm[inizio:fine], volume_db)
+    _esegui_ffmpeg(_comando_ffmpeg(formato, catena) + ["-f", "wav", output_path], pcm)
+    return output_path
+
+
+def _blocchi_da_file(f, formato, offset, lunghezza, volume_db, dimensione=_DIMENSIONE_LETTURA):
+    """Campioni letti dal file a blocchi allineati ai frame, con il guadagno applicato blocco per blocco."""
+    byte_per_frame = formato.canali * formato.larghezza
+    dimensione -= dimensione % byte_per_frame
+    f.seek(offset)
+    while lunghezza > 0:
+        blocco = f.read(min(dimensione, lunghezza))
+        if not blocco:
+            break
+        lunghezza -= len(blocco)
+        yield applica_guadagno(formato, blocco, volume_db)
+
+
+def _intervallo_file(f, volume_db, taglia_silenzi, loudness_lufs, analisi):
+    """Formato, offset e lunghezza dei campioni da filtrare in un file WAV aperto, e guadagno complessivo."""
+    # La mappa serve a leggere l'intestazione e, solo se l'analisi manca, i campioni da analizzare
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mappa:
+        formato, offset, lunghezza = analizza_wav(mappa)
+        with memoryview(mappa) as vista:
+            inizio, fine, volume_db = _taglio_e_guadagno(
+                formato, vista[offset:offset + lunghezza], lunghezza, volume_db, taglia_silenzi, loudness_lufs, analisi
+            )
+    return formato, offset + inizio, fine - inizio, volume_db
+
+
+def filtra_file_wav(input_path, output_path, pitch_semitoni=0, velocita_fattore=1.0, volume_db=0, taglia_silenzi=False,
+                    loudness_lufs=None, analisi=None):
+    """
+    Come filtra_wav_su_file, ma legge il WAV PCM da `input_path` in streaming: i campioni
+    passano a blocchi (guadagno compreso) da un file all'altro, quindi la memoria usata non
+    dipende dalla durata dell'audio. Adatto ai render lunghi (vedi documento_lungo.py).
+    """
+    with open(input_path, "rb") as f:
+        formato, offset, lunghezza, volume_db = _intervallo_file(f, volume_db, taglia_silenzi, loudness_lufs, analisi)
+        catena, _ = costruisci_catena_filtri(formato.frequenza, pitch_semitoni, velocita_fattore)
+        blocchi = _blocchi_da_file(f, formato, offset, lunghezza, volume_db)
+        if catena is None:
+            with ScrittoreWav(output_path, formato) as scrittore:
+                for blocco in blocchi:
+                    scrittore.scrivi(blocco)
+        else:
+            _esegui_ffmpeg(_comando_ffmpeg(formato, catena) + ["-f", "wav", output_path], blocchi)
+    return output_path
+
+
+def filtra_file_in_formati(input_path, uscite, pitch_semitoni=0, velocita_fattore=1.0, volume_db=0, taglia_silenzi=False,
+                           loudness_lufs=None, analisi=None):
+    """
+    Applica i filtri al WAV PCM `input_path` una sola volta e codifica il risultato in più file con
+    un unico processo ffmpeg: la catena dei filtri termina in `asplit` e ogni ramo va al proprio
+    encoder. `uscite` è una lista di (output_path, opzioni ffmpeg dell'uscita), ad esempio
+    [("voce.mp3", ["-c:a", "libmp3lame", "-b:a", "192k"]), ("voce.flac", ["-c:a", "flac"])].
+    I campioni arrivano a ffmpeg a blocchi, come in filtra_file_wav.
+    """
+    if not uscite:
+        raise ValueError("Nessuna uscita richiesta.")
+    with open(input_path, "rb") as f:
+        formato, offset, lunghezza, volume_db = _intervallo_file(f, volume_db, taglia_silenzi, loudness_lufs, analisi)
+        catena, _ = costruisci_catena_filtri(formato.frequenza, pitch_semitoni, velocita_fattore)
+
+        rami = "".join(f"[u{indice}]" for indice in range(len(uscite)))
+        grafo = f"[0:a]{catena + ',' if catena else ''}asplit={len(uscite)}{rami}"
+        comando = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+            "-f", _CODEC_INGRESSO[formato.larghezza], "-ar", str(formato.frequenza), "-ac", str(formato.canali),
+            "-i", "pipe:0",
+            "-filter_complex", grafo,
+        ]
+        for indice, (output_path, opzioni) in enumerate(uscite):
+            comando += ["-map", f"[u{indice}]", *opzioni, output_path]
+        _esegui_ffmpeg(comando, _blocchi_da_file(f, formato, offset, lunghezza, volume_db))
+    return [output_path for output_path, _ in uscite]
@@ -0,0 +1,194 @@
+import os
+import json
+import wave
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_sintesi import impronta_file
+from motore_tts import ErroreSintesi
+
+# --- Indice delle voci in speaker_previews/ ---
+# Per ogni WAV di riferimento l'indice conserva impronta del contenuto, durata, frequenza di
+# campionamento e canali, più il condizionamento XTTS precalcolato (latenti + embedding),
+# così la sintesi non rianalizza la voce a ogni generazione.
+
+CARTELLA_INDICE_SPEAKER = ".indice_speaker"
+FILE_INDICE = "indice.json"
+VERSIONE_INDICE = 1
+
+
+def _leggi_metadati_wav(percorso):
+    """Durata, frequenza di campionamento e canali di un WAV, letti dall'intestazione."""
+    with wave.open(percorso, "rb") as wav_file:
+        frequenza = wav_file.getframerate()
+        return {
+            "durata_s": wav_file.getnframes() / frequenza if frequenza else 0.0,
+            "frequenza": frequenza,
+            "canali": wav_file.getnchannels(),
+        }
+
+
+class IndiceSpeaker:
+    """
+    Indice persistente delle voci di `cartella_speaker`. Le voci vengono invalidate quando
+    cambiano dimensione o mtime del file e il contenuto (impronta SHA-256) è diverso.
+    """
+
+    def __init__(self, cartella_speaker, cartella_indice=CARTELLA_INDICE_SPEAKER, max_paralleli=4):
+        self.cartella_speaker = cartella_speaker
+        self.cartella_indice = cartella_indice
+        self.max_paralleli = max_paralleli
+        self._lock = threading.RLock()
+        self._lock_condizionamenti = {}
+        self._voci = {}
+        os.makedirs(cartella_indice, exist_ok=True)
+        self._carica()
+
+    def _percorso_indice(self):
+        return os.path.join(self.cartella_indice, FILE_INDICE)
+
+    def _carica(self):
+        try:
+            with open(self._percorso_indice(), "r", encoding="utf-8") as f:
+                dati = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if dati.get("versione") == VERSIONE_INDICE:
+            self._voci = dati.get("voci", {})
+
+    def _salva(self):
+        with self._lock:
+            contenuto = json.dumps({"versione": VERSIONE_INDICE, "voci": self._voci}, ensure_ascii=False, indent=1)
+        descrittore, percorso_temporaneo = tempfile.mkstemp(dir=self.cartella_indice, suffix=".tmp")
+        with os.fdopen(descrittore, "w", encoding="utf-8") as f:
+            f.write(contenuto)
+        os.replace(percorso_temporaneo, self._percorso_indice())
+
+    def _analizza_voce(self, nome, percorso, info, precedente):
+        voce = {"file": os.path.basename(percorso), "dimensione": info.st_size, "mtime_ns": info.st_mtime_ns}
+        voce["impronta"] = impronta_file(percorso)
+        voce.update(_leggi_metadati_wav(percorso))
+        # Se il contenuto non è cambiato (es. solo touch) i condizionamenti restano validi
+        if precedente and precedente.get("impronta") == voce["impronta"]:
+            voce["condizionamenti"] = precedente.get("condizionamenti", {})
+        else:
+            voce["condizionamenti"] = {}
+        return nome, voce
+
+    def aggiorna(self):
+        """
+        Allinea l'indice al contenuto della cartella: analizza in parallelo le voci nuove o
+        modificate e rimuove quelle cancellate. Restituisce il numero di voci rianalizzate.
+        """
+        presenti = {}
+        for nome_file in os.listdir(self.cartella_speaker):
+            if nome_file.endswith(".wav"):
+                percorso = os.path.join(self.cartella_speaker, nome_file)
+                presenti[nome_file[:-len(".wav")]] = (percorso, os.stat(percorso))
+
+        with self._lock:
+            da_analizzare = [
+                (nome, percorso, info, self._voci.get(nome))
+                for nome, (percorso, info) in presenti.items()
+                if nome not in self._voci
+                or self._voci[nome]["dimensione"] != info.st_size
+                or self._voci[nome]["mtime_ns"] != info.st_mtime_ns
+            ]
+            rimosse = [nome for nome in self._voci if nome not in presenti]
+
+        if not da_analizzare and not rimosse:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=self.max_paralleli) as pool:
+            analizzate = list(pool.map(lambda argomenti: self._analizza_voce(*argomenti), da_analizzare))
+        with self._lock:
+            for nome in rimosse:
+                del self._voci[nome]
+            self._voci.update(analizzate)
+        self._salva()
+        return len(analizzate)
+
+    def elenco(self):
+        """Nomi delle voci indicizzate, in ordine alfabetico."""
+        with self._lock:
+            return sorted(self._voci)
+
+    def info(self, nome):
+        """Metadati indicizzati di una voce (impronta, durata_s, frequenza, canali), oppure None."""
+        with self._lock:
+            voce = self._voci.get(nome)
+            return dict(voce) if voce else None
+
+    @staticmethod
+    def _chiave_modello(id_modello):
+        return hashlib.sha256(id_modello.encode("utf-8")).hexdigest()[:12]
+
+    def condizionamento(self, nome, worker):
+        """
+        Percorso del condizionamento precalcolato della voce per il modello del worker,
+        calcolato nel worker al primo utilizzo.
+        """
+        voce = self.info(nome)
+        if voce is None:
+            raise ErroreSintesi(f"Voce non presente nell'indice: {nome}")
+
+        chiave_modello = self._chiave_modello(worker.id_modello)
+        with self._lock:
+            lock_voce = self._lock_condizionamenti.setdefault((nome, chiave_modello), threading.Lock())
+        with lock_voce:
+            voce = self.info(nome)
+            nome_file = voce["condizionamenti"].get(chiave_modello)
+            if nome_file and os.path.exists(os.path.join(self.cartella_indice, nome_file)):
+                return os.path.join(self.cartella_indice, nome_file)
+
+            nome_file = f"{voce['impronta'][:16]}_{chiave_modello}.cond"
+            percorso = os.path.join(self.cartella_indice, nome_file)
+            worker.calcola_condizionamento(os.path.join(self.cartella_speaker, voce["file"]), percorso)
+            with self._lock:
+                if self._voci.get(nome, {}).get("impronta") == voce["impronta"]:
+                    self._voci[nome]["condizionamenti"][chiave_modello] = nome_file
+            self._salva()
+            return percorso
+
+    def precalcola(self, worker):
+        """Calcola in parallelo i condizionamenti mancanti di tutte le voci (es. all'avvio)."""
+        nomi = self.elenco()
+        with ThreadPoolExecutor(max_workers=max(1, getattr(worker, "parallelismo", 1))) as pool:
+            list(pool.map(lambda nome: self.condizionamento(nome, worker), nomi))
+        return len(nomi)
+
+
+# --- Indice condiviso dall'applicazione ---
+_indici_condivisi = {}
+_lock_indici_condivisi = threading.Lock()
+
+
+def ottieni_indice_condiviso(cartella_speaker):
+    """Restituisce l'indice condiviso dal processo per `cartella_speaker`, allineato alla cartella."""
+    with _lock_indici_condivisi:
+        if cartella_speaker not in _indici_condivisi:
+            _indici_condivisi[cartella_speaker] = IndiceSpeaker(cartella_speaker)
+        indice = _indici_condivisi[cartella_speaker]
+    indice.aggiorna()
+    return indice
+
+
+_precalcoli_avviati = set()
+
+
+def avvia_precalcolo_in_background(indice, worker):
+    """Avvia una sola volta per processo il precalcolo dei condizionamenti in un thread di background."""
+    with _lock_indici_condivisi:
+        if id(indice) in _precalcoli_avviati:
+            return
+        _precalcoli_avviati.add(id(indice))
+
+    def precalcola():
+        try:
+            indice.precalcola(worker)
+        except ErroreSintesi:
+            pass  # Le voci mancanti verranno calcolate al primo utilizzo
+
+    threading.Thread(target=precalcola, name="nova-indice-speaker", daemon=True).start()
@@ -0,0 +1,239 @@
+import os
+import time
+import shutil
+import itertools
+import tempfile
+import threading
+from collections import deque
+
+# --- Lavori e scheduler ---
+# Ogni sintesi o render dei filtri è un lavoro con la propria cartella di lavoro temporanea,
+# eliminata al termine. I lavori attendono in una coda FIFO e vengono eseguiti da un numero
+# limitato di thread, con un limite separato per tipo (es. sintesi e filtri), così più sessioni
+# dell'interfaccia possono condividere lo stesso processo senza interferire tra loro.
+
+ENV_MAX_LAVORI = "NOVA_LAVORI_MAX"
+ENV_MAX_LAVORI_SINTESI = "NOVA_LAVORI_SINTESI"
+ENV_MAX_LAVORI_FILTRI = "NOVA_LAVORI_FILTRI"
+CARTELLA_LAVORI = os.path.join(tempfile.gettempdir(), "nova_lavori")
+
+IN_CODA = "in_coda"
+IN_ESECUZIONE = "in_esecuzione"
+COMPLETATO = "completato"
+ERRORE = "errore"
+ANNULLATO = "annullato"
+STATI_FINALI = (COMPLETATO, ERRORE, ANNULLATO)
+
+
+class LavoroAnnullato(Exception):
+    """Sollevata dentro un lavoro quando ne è stato chiesto l'annullamento."""
+    pass
+
+
+class Lavoro:
+    """
+    Un lavoro in coda o in esecuzione. La funzione del lavoro riceve il lavoro stesso come primo
+    argomento: può usare `cartella` per i file temporanei, aggiornare `progresso` e chiamare
+    `verifica_annullamento()` tra un passo e l'altro per interrompersi su richiesta.
+    """
+
+    _contatore = itertools.count(1)
+
+    def __init__(self, tipo, funzione, args=(), kwargs=None, sessione=None):
+        self.id = next(self._contatore)
+        self.tipo = tipo
+        self.sessione = sessione
+        self.funzione = funzione
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.stato = IN_CODA
+        self.risultato = None
+        self.errore = None
+        self.progresso = None
+        self.cartella = None
+        self.creato = time.monotonic()
+        self.avviato = None
+        self.terminato = None
+        self._annullamento = threading.Event()
+        self._fine = threading.Event()
+        self._scheduler = None
+
+    @property
+    def finito(self):
+        return self._fine.is_set()
+
+    @property
+    def annullamento_richiesto(self):
+        return self._annullamento.is_set()
+
+    @property
+    def posizione(self):
+        """Posizione nella coda (1 = il prossimo ad essere eseguito), 0 se non è in coda."""
+        return self._scheduler.posizione(self) if self._scheduler is not None else 0
+
+    def verifica_annullamento(self):
+        if self._annullamento.is_set():
+            raise LavoroAnnullato(f"Lavoro {self.id} annullato.")
+
+    def annulla(self):
+        """Annulla il lavoro: se è in coda viene tolto subito, altrimenti si ferma al prossimo controllo."""
+        self._annullamento.set()
+        if self._scheduler is not None:
+            self._scheduler.togli_dalla_coda(self)
+
+    def attendi(self, timeout=None):
+        """Attende la fine del lavoro; restituisce True se è finito entro `timeout`."""
+        return self._fine.wait(timeout)
+
+    def _termina(self, stato, risultato=None, errore=None):
+        self.stato, self.risultato, self.errore = stato, risultato, errore
+        self.terminato = time.monotonic()
+        self._fine.set()
+
+
+class SchedulerLavori:
+    """
+    Coda FIFO di lavori eseguiti da al massimo `max_lavori` thread. `limiti_per_tipo` limita i
+    lavori contemporanei di un tipo (es. {"sintesi": 2}): un lavoro il cui tipo è al limite
+    lascia passare quelli successivi di altri tipi, senza perdere il suo posto in coda.
+    """
+
+    def __init__(self, max_lavori=None, limiti_per_tipo=None, cartella_lavori=CARTELLA_LAVORI):
+        self.max_lavori = max_lavori or os.cpu_count() or 1
+        self.limiti_per_tipo = dict(limiti_per_tipo or {})
+        self.cartella_lavori = cartella_lavori
+        self._condizione = threading.Condition()
+        self._coda = deque()
+        self._in_esecuzione = {}
+        self._thread = []
+        self._chiuso = False
+        os.makedirs(self.cartella_lavori, exist_ok=True)
+
+    def invia(self, tipo, funzione, *args, sessione=None, **kwargs):
+        """Mette in coda `funzione(lavoro, *args, **kwargs)` e restituisce il Lavoro."""
+        lavoro = Lavoro(tipo, funzione, args, kwargs, sessione=sessione)
+        lavoro._scheduler = self
+        with self._condizione:
+            if self._chiuso:
+                raise RuntimeError("Scheduler dei lavori chiuso.")
+            self._coda.append(lavoro)
+            # I thread vengono creati al primo lavoro e restano in attesa sulla coda
+            while len(self._thread) < self.max_lavori:
+                thread = threading.Thread(target=self._ciclo, name=f"nova-lavori-{len(self._thread) + 1}", daemon=True)
+                self._thread.append(thread)
+                thread.start()
+            self._condizione.notify()
+        return lavoro
+
+    def posizione(self, lavoro):
+        with self._condizione:
+            try:
+                return self._coda.index(lavoro) + 1
+            except ValueError:
+                return 0
+
+    def togli_dalla_coda(self, lavoro):
+        with self._condizione:
+            try:
+                self._coda.remove(lavoro)
+            except ValueError:
+                return False
+        lavoro._termina(ANNULLATO)
+        return True
+
+    def annulla_sessione(self, sessione):
+        """Annulla tutti i lavori (in coda o in esecuzione) di una sessione."""
+        with self._condizione:
+            lavori = [lavoro for lavoro in self._coda if lavoro.sessione == sessione]
+            lavori += [lavoro for lavoro in self._in_esecuzione if lavoro.sessione == sessione]
+        for lavoro in lavori:
+            lavoro.annulla()
+
+    def _in_esecuzione_per_tipo(self, tipo):
+        return sum(1 for lavoro in self._in_esecuzione if lavoro.tipo == tipo)
+
+    def _prossimo(self):
+        """Primo lavoro in coda il cui tipo non è al limite (da chiamare con il lock)."""
+        for lavoro in self._coda:
+            limite = self.limiti_per_tipo.get(lavoro.tipo)
+            if limite is None or self._in_esecuzione_per_tipo(lavoro.tipo) < limite:
+                self._coda.remove(lavoro)
+                return lavoro
+        return None
+
+    def _ciclo(self):
+        while True:
+            with self._condizione:
+                lavoro = self._prossimo()
+                while lavoro is None:
+                    if self._chiuso:
+                        return
+                    self._condizione.wait()
+                    lavoro = self._prossimo()
+                self._in_esecuzione[lavoro] = threading.current_thread()
+            try:
+                self._esegui(lavoro)
+            finally:
+                with self._condizione:
+                    del self._in_esecuzione[lavoro]
+                    # Un posto libero per il tipo può sbloccare lavori in attesa
+                    self._condizione.notify_all()
+
+    def _esegui(self, lavoro):
+        lavoro.stato = IN_ESECUZIONE
+        lavoro.avviato = time.monotonic()
+        lavoro.cartella = tempfile.mkdtemp(prefix=f"{lavoro.tipo}_{lavoro.id}_", dir=self.cartella_lavori)
+        stato, risultato, errore = COMPLETATO, None, None
+        try:
+            lavoro.verifica_annullamento()
+            risultato = lavoro.funzione(lavoro, *lavoro.args, **lavoro.kwargs)
+        except LavoroAnnullato:
+            stato = ANNULLATO
+        except Exception as e:
+            stato, errore = ERRORE, e
+        finally:
+            # La cartella di lavoro sparisce prima che il lavoro risulti finito
+            shutil.rmtree(lavoro.cartella, ignore_errors=True)
+        lavoro._termina(stato, risultato, errore)
+
+    def statistiche(self):
+        with self._condizione:
+            return {
+                "in_coda": len(self._coda),
+                "in_esecuzione": len(self._in_esecuzione),
+                "thread": len(self._thread),
+                "max_lavori": self.max_lavori,
+            }
+
+    def chiudi(self, annulla_in_coda=True):
+        with self._condizione:
+            self._chiuso = True
+            in_coda = list(self._coda) if annulla_in_coda else []
+            self._condizione.notify_all()
+        for lavoro in in_coda:
+            lavoro.annulla()
+
+
+# --- Scheduler condiviso dall'applicazione ---
+_scheduler_condiviso = None
+_lock_scheduler_condiviso = threading.Lock()
+
+
+def ottieni_scheduler_condiviso():
+    """
+    Restituisce lo scheduler condiviso da tutte le sessioni del processo. Limiti da
+    NOVA_LAVORI_MAX (predefinito: numero di core), NOVA_LAVORI_SINTESI (predefinito: 2) e
+    NOVA_LAVORI_FILTRI (predefinito: numero di core).
+    """
+    global _scheduler_condiviso
+    with _lock_scheduler_condiviso:
+        if _scheduler_condiviso is None:
+            core = os.cpu_count() or 1
+            _scheduler_condiviso = SchedulerLavori(
+                max_lavori=int(os.environ.get(ENV_MAX_LAVORI, core)),
+                limiti_per_tipo={
+                    "sintesi": int(os.environ.get(ENV_MAX_LAVORI_SINTESI, 2)),
+                    "filtri": int(os.environ.get(ENV_MAX_LAVORI_FILTRI, core)),
+                },
+            )
+        return _scheduler_condiviso
@@ -0,0 +1,389 @@
+import os
+import json
+import time
+import logging
+import platform
+import resource
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from lavori import LavoroAnnullato
+
+# --- Metriche e tracce dei lavori ---
+# Ogni sintesi, render dei filtri o strumento di testo apre una traccia: tempi per stadio,
+# attesa in coda, secondi di audio prodotti (fattore di tempo reale), sottoprocessi avviati e
+# memoria (variazione durante il lavoro e picco del processo). Le tracce alimentano contatori e istogrammi in formato Prometheus, un log
+# JSON (una riga per lavoro) e l'elenco degli ultimi lavori mostrato nell'interfaccia.
+
+ENV_LOG_METRICHE = "NOVA_METRICHE_LOG"
+ENV_FILE_PROMETHEUS = "NOVA_METRICHE_PROM"
+ULTIME_TRACCE = 50
+LIMITI_ISTOGRAMMA_S = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_DESCRIZIONI = {
+    "nova_lavori_total": ("counter", "Lavori conclusi per tipo ed esito."),
+    "nova_durata_lavoro_secondi": ("histogram", "Durata dei lavori, esclusa l'attesa in coda."),
+    "nova_durata_stadio_secondi": ("histogram", "Durata degli stadi dei lavori."),
+    "nova_attesa_coda_secondi": ("histogram", "Attesa in coda prima dell'esecuzione."),
+    "nova_audio_prodotto_secondi_total": ("counter", "Secondi di audio prodotti."),
+    "nova_elaborazione_secondi_total": ("counter", "Secondi di elaborazione dei lavori che producono audio."),
+    "nova_fattore_tempo_reale": ("gauge", "Secondi di audio per secondo di elaborazione dell'ultimo lavoro."),
+    "nova_sottoprocessi_total": ("counter", "Sottoprocessi avviati (es. ffmpeg)."),
+    "nova_memoria_picco_processo_mb": ("gauge", "Picco di memoria residente dall'avvio del processo e dei figli terminati."),
+    "nova_rerun_secondi": ("histogram", "Durata dei rerun completi dell'interfaccia Streamlit."),
+    "nova_cache_hit_ratio": ("gauge", "Quota di letture trovate in cache."),
+    "nova_cache_voci": ("gauge", "Voci conservate in cache."),
+    "nova_cache_bytes": ("gauge", "Byte conservati in cache."),
+    "nova_lavori_in_coda": ("gauge", "Lavori in attesa nello scheduler."),
+    "nova_lavori_in_esecuzione": ("gauge", "Lavori in esecuzione nello scheduler."),
+    "nova_worker_riavvii_total": ("counter", "Riavvii del processo worker TTS dopo una caduta."),
+    "nova_worker_attivo": ("gauge", "1 se il processo worker TTS è attivo."),
+    "nova_worker_profilo_cpu": ("gauge", "Profilo CPU del worker TTS (preset, affinità, quantizzazione nelle etichette)."),
+    "nova_worker_thread": ("gauge", "Thread intra-op e inter-op per sintesi del worker TTS."),
+    "nova_worker_parallelismo": ("gauge", "Sintesi eseguite in parallelo dal worker TTS."),
+}
+
+_logger = logging.getLogger("nova.metriche")
+_locale = threading.local()
+
+
+def memoria_residente_mb():
+    """Memoria residente attuale del processo in MB (None dove /proc non è disponibile)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            pagine = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pagine * resource.getpagesize() / (1024 * 1024), 1)
+
+
+def picco_memoria_processo_mb():
+    """
+    Picco di memoria residente dall'avvio (processo, figli terminati) in MB: non scende mai,
+    quindi non misura il singolo lavoro (vedi Traccia per la variazione durante un lavoro).
+    """
+    # ru_maxrss è in KB su Linux e in byte su macOS
+    divisore = 1024 * 1024 if platform.system() == "Darwin" else 1024
+    return (
+        round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisore, 1),
+        round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisore, 1),
+    )
+
+
+def _etichette_testo(etichette):
+    if not etichette:
+        return ""
+    coppie = ",".join(
+        '{}="{}"'.format(nome, str(valore).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for nome, valore in etichette
+    )
+    return "{" + coppie + "}"
+
+
+class Traccia:
+    """Misure di un singolo lavoro: aperta con RegistroMetriche.traccia(tipo)."""
+
+    def __init__(self, tipo, attributi):
+        self.tipo = tipo
+        self.attributi = dict(attributi)
+        self.stadi = {}
+        self.audio_s = None
+        self.attesa_coda_s = None
+        self.sottoprocessi = 0
+        self.esito = "ok"
+        self.errore = None
+        self.inizio = time.perf_counter()
+        self.durata_s = None
+        self._rss_iniziale = memoria_residente_mb()
+        self._picco_iniziale = picco_memoria_processo_mb()[0]
+        self.rss_delta_mb = None
+        self.picco_incremento_mb = None
+
+    def termina(self):
+        """
+        Chiude le misure del lavoro: durata, variazione della memoria residente e di quanto il
+        lavoro ha alzato il picco del processo (0 se è rimasto sotto il picco precedente).
+        Con più lavori in parallelo la memoria è quella dell'intero processo.
+        """
+        self.durata_s = time.perf_counter() - self.inizio
+        rss_finale = memoria_residente_mb()
+        if rss_finale is not None and self._rss_iniziale is not None:
+            self.rss_delta_mb = round(rss_finale - self._rss_iniziale, 1)
+        self.picco_incremento_mb = round(picco_memoria_processo_mb()[0] - self._picco_iniziale, 1)
+
+    @contextmanager
+    def stadio(self, nome):
+        """Misura la durata di uno stadio (più esecuzioni dello stesso stadio si sommano)."""
+        inizio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stadi[nome] = self.stadi.get(nome, 0.0) + time.perf_counter() - inizio
+
+    def imposta(self, **attributi):
+        self.attributi.update(attributi)
+
+    @property
+    def fattore_tempo_reale(self):
+        if not self.audio_s or not self.durata_s:
+            return None
+        return self.audio_s / self.durata_s
+
+    def come_dizionario(self):
+        rss, rss_figli = picco_memoria_processo_mb()
+        voce = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "tipo": self.tipo,
+            "esito": self.esito,
+            "durata_s": round(self.durata_s or 0.0, 4),
+            "attesa_coda_s": round(self.attesa_coda_s, 4) if self.attesa_coda_s is not None else None,
+            "stadi": {nome: round(durata, 4) for nome, durata in self.stadi.items()},
+            "audio_s": round(self.audio_s, 3) if self.audio_s is not None else None,
+            "rtf": round(self.fattore_tempo_reale, 2) if self.fattore_tempo_reale else None,
+            "sottoprocessi": self.sottoprocessi,
+            "rss_delta_mb": self.rss_delta_mb,
+            "rss_picco_incremento_mb": self.picco_incremento_mb,
+            "rss_picco_processo_mb": rss,
+            "rss_picco_processo_figli_mb": rss_figli,
+        }
+        voce.update(self.attributi)
+        if self.errore:
+            voce["errore"] = self.errore
+        return voce
+
+
+class RegistroMetriche:
+    """Contatori, istogrammi e ultime tracce, esportabili in formato Prometheus e come log JSON."""
+
+    def __init__(self, ultime_tracce=ULTIME_TRACCE, percorso_log=None, percorso_prometheus=None):
+        self.percorso_log = percorso_log
+        self.percorso_prometheus = percorso_prometheus
+        self._lock = threading.Lock()
+        self._contatori = {}
+        self._valori = {}
+        self._istogrammi = {}
+        self._sorgenti = {}
+        self._tracce = deque(maxlen=ultime_tracce)
+
+    # --- Primitive ---
+    def incrementa(self, nome, valore=1, **etichette):
+        chiave = (nome, tuple(sorted(etichette.items())))
+        with self._lock:
+            self._contatori[chiave] = self._contatori.get(chiave, 0) + valore
+
+    def imposta_valore(self, nome, valore, **etichette):
+        with self._lock:
+            self._valori[(nome, tuple(sorted(etichette.items())))] = valore
+
+    def osserva(self, nome, valore, **etichette):
+        chiave = (nome, tuple(sorted(etichette.items())))
+        with self._lock:
+            istogramma = self._istogrammi.get(chiave)
+            if istogramma is None:
+                istogramma = self._istogrammi[chiave] = [[0] * len(LIMITI_ISTOGRAMMA_S), 0, 0.0]
+            for posizione, limite in enumerate(LIMITI_ISTOGRAMMA_S):
+                if valore <= limite:
+                    istogramma[0][posizione] += 1
+            istogramma[1] += 1
+            istogramma[2] += valore
+
+    def registra_sorgente(self, nome, funzione):
+        """
+        Registra (o sostituisce) una sorgente di valori letta a ogni esportazione:
+        `funzione()` restituisce un elenco di (nome_metrica, {etichette}, valore).
+        """
+        with self._lock:
+            self._sorgenti[nome] = funzione
+
+    # --- Tracce ---
+    @contextmanager
+    def traccia(self, tipo, lavoro=None, **attributi):
+        """
+        Traccia un lavoro di tipo `tipo`. Con un `lavoro` dello scheduler (vedi lavori.py)
+        viene registrata anche l'attesa in coda. I sottoprocessi avviati dal thread corrente
+        durante la traccia vengono contati (vedi conta_sottoprocesso).
+        """
+        traccia = Traccia(tipo, attributi)
+        if lavoro is not None and lavoro.avviato is not None:
+            traccia.attesa_coda_s = lavoro.avviato - lavoro.creato
+        precedente = getattr(_locale, "traccia", None)
+        _locale.traccia = traccia
+        try:
+            yield traccia
+        except LavoroAnnullato:
+            traccia.esito = "annullato"
+            raise
+        except GeneratorExit:
+            # Risposta in streaming chiusa dal client prima della fine
+            traccia.esito = "interrotto"
+            raise
+        except Exception as e:
+            traccia.esito = "errore"
+            traccia.errore = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _locale.traccia = precedente
+            traccia.termina()
+            self._concludi(traccia)
+
+    def _concludi(self, traccia):
+        tipo = traccia.tipo
+        self.incrementa("nova_lavori_total", tipo=tipo, esito=traccia.esito)
+        self.osserva("nova_durata_lavoro_secondi", traccia.durata_s, tipo=tipo)
+        for stadio, durata in traccia.stadi.items():
+            self.osserva("nova_durata_stadio_secondi", durata, tipo=tipo, stadio=stadio)
+        if traccia.attesa_coda_s is not None:
+            self.osserva("nova_attesa_coda_secondi", traccia.attesa_coda_s, tipo=tipo)
+        if traccia.audio_s and traccia.esito == "ok":
+            self.incrementa("nova_audio_prodotto_secondi_total", traccia.audio_s, tipo=tipo)
+            self.incrementa("nova_elaborazione_secondi_total", traccia.durata_s, tipo=tipo)
+            self.imposta_valore("nova_fattore_tempo_reale", traccia.fattore_tempo_reale, tipo=tipo)
+
+        voce = traccia.come_dizionario()
+        self.imposta_valore("nova_memoria_picco_processo_mb", voce["rss_picco_processo_mb"], processo="principale")
+        self.imposta_valore("nova_memoria_picco_processo_mb", voce["rss_picco_processo_figli_mb"], processo="figli")
+        with self._lock:
+            self._tracce.append(voce)
+        self._scrivi_log(voce)
+        if self.percorso_prometheus:
+            self.scrivi_file_prometheus(self.percorso_prometheus)
+
+    def _scrivi_log(self, voce):
+        riga = json.dumps(voce, ensure_ascii=False, default=str)
+        _logger.info(riga)
+        if self.percorso_log:
+            try:
+                with self._lock, open(self.percorso_log, "a", encoding="utf-8") as f:
+                    f.write(riga + "\n")
+            except OSError as e:
+                _logger.warning("Impossibile scrivere il log delle metriche %s: %s", self.percorso_log, e)
+
+    def ultime_tracce(self, n=None):
+        """Le ultime tracce concluse, dalla più recente."""
+        with self._lock:
+            tracce = list(self._tracce)
+        tracce.reverse()
+        return tracce[:n] if n else tracce
+
+    # --- Esportazione ---
+    def testo_prometheus(self):
+        """Tutte le metriche nel formato di esposizione testuale di Prometheus."""
+        with self._lock:
+            contatori = dict(self._contatori)
+            valori = dict(self._valori)
+            istogrammi = {chiave: (list(b), n, somma) for chiave, (b, n, somma) in self._istogrammi.items()}
+            sorgenti = list(self._sorgenti.values())
+        for sorgente in sorgenti:
+            try:
+                for nome, etichette, valore in sorgente():
+                    valori[(nome, tuple(sorted(etichette.items())))] = valore
+            except Exception as e:
+                _logger.warning("Sorgente di metriche non disponibile: %s", e)
+
+        righe_per_nome = {}
+        for (nome, etichette), valore in list(contatori.items()) + list(valori.items()):
+            if valore is not None:
+                righe_per_nome.setdefault(nome, []).append(f"{nome}{_etichette_testo(etichette)} {valore:g}")
+        for (nome, etichette), (conteggi, n, somma) in istogrammi.items():
+            righe = righe_per_nome.setdefault(nome, [])
+            for limite, conteggio in zip(LIMITI_ISTOGRAMMA_S, conteggi):
+                righe.append(f"{nome}_bucket{_etichette_testo(etichette + (('le', f'{limite:g}'),))} {conteggio}")
+            righe.append(f"{nome}_bucket{_etichette_testo(etichette + (('le', '+Inf'),))} {n}")
+            righe.append(f"{nome}_sum{_etichette_testo(etichette)} {somma:g}")
+            righe.append(f"{nome}_count{_etichette_testo(etichette)} {n}")
+
+        testo = []
+        for nome in sorted(righe_per_nome):
+            tipo, descrizione = _DESCRIZIONI.get(nome, ("gauge", nome))
+            testo.append(f"# HELP {nome} {descrizione}")
+            testo.append(f"# TYPE {nome} {tipo}")
+            testo.extend(sorted(righe_per_nome[nome]))
+        return "\n".join(testo) + "\n"
+
+    def scrivi_file_prometheus(self, percorso):
+        """Scrive le metriche per il textfile collector di node_exporter (scrittura atomica)."""
+        cartella = os.path.dirname(os.path.abspath(percorso))
+        descrittore, percorso_temporaneo = tempfile.mkstemp(dir=cartella, suffix=".tmp")
+        try:
+            with os.fdopen(descrittore, "w", encoding="utf-8") as f:
+                f.write(self.testo_prometheus())
+            os.replace(percorso_temporaneo, percorso)
+        except OSError as e:
+            _logger.warning("Impossibile scrivere %s: %s", percorso, e)
+            if os.path.exists(percorso_temporaneo):
+                os.remove(percorso_temporaneo)
+
+
+# --- Registro condiviso dal processo ---
+_metriche_condivise = None
+_lock_metriche_condivise = threading.Lock()
+
+
+def ottieni_metriche_condivise():
+    """
+    Restituisce il registro delle metriche condiviso dal processo. Con NOVA_METRICHE_LOG le
+    tracce vengono accodate in JSON a quel file; con NOVA_METRICHE_PROM le metriche vengono
+    riscritte in quel file (formato Prometheus) dopo ogni lavoro.
+    """
+    global _metriche_condivise
+    with _lock_metriche_condivise:
+        if _metriche_condivise is None:
+            _metriche_condivise = RegistroMetriche(
+                percorso_log=os.environ.get(ENV_LOG_METRICHE),
+                percorso_prometheus=os.environ.get(ENV_FILE_PROMETHEUS),
+            )
+        return _metriche_condivise
+
+
+def registra_sorgenti_predefinite(registro, cache=None, scheduler=None, worker=None):
+    """
+    Registra come sorgenti del registro le statistiche delle cache ({"sintesi": CacheSintesi, ...}),
+    dello scheduler dei lavori e del worker TTS, lette a ogni esportazione.
+    """
+    for nome_cache, oggetto_cache in (cache or {}).items():
+        def valori_cache(nome_cache=nome_cache, oggetto_cache=oggetto_cache):
+            statistiche = oggetto_cache.statistiche()
+            return [
+                ("nova_cache_hit_ratio", {"cache": nome_cache}, statistiche["hit_ratio"]),
+                ("nova_cache_voci", {"cache": nome_cache}, statistiche["voci"]),
+                ("nova_cache_bytes", {"cache": nome_cache}, statistiche["bytes"]),
+            ]
+        registro.registra_sorgente(f"cache_{nome_cache}", valori_cache)
+
+    if scheduler is not None:
+        def valori_scheduler():
+            statistiche = scheduler.statistiche()
+            return [
+                ("nova_lavori_in_coda", {}, statistiche["in_coda"]),
+                ("nova_lavori_in_esecuzione", {}, statistiche["in_esecuzione"]),
+            ]
+        registro.registra_sorgente("scheduler", valori_scheduler)
+
+    if worker is not None:
+        def valori_worker():
+            valori = [
+                ("nova_worker_riavvii_total", {}, worker.riavvii),
+                ("nova_worker_attivo", {}, int(worker.attivo)),
+                ("nova_worker_parallelismo", {}, worker.parallelismo),
+            ]
+            # Profilo effettivo dopo l'avvio del worker, altrimenti quello configurato
+            profilo = worker.descrizione_profilo()
+            if profilo is not None:
+                etichette = {chiave: profilo[chiave] for chiave in ("preset", "affinita", "quantizzazione")}
+                valori += [
+                    ("nova_worker_profilo_cpu", etichette, 1),
+                    ("nova_worker_thread", {"tipo": "intra"}, profilo["thread_intra"]),
+                    ("nova_worker_thread", {"tipo": "inter"}, profilo["thread_inter"]),
+                ]
+            return valori
+        registro.registra_sorgente("worker", valori_worker)
+
+
+def conta_sottoprocesso(programma):
+    """Conta l'avvio di un sottoprocesso, nel totale e nella traccia del thread corrente."""
+    ottieni_metriche_condivise().incrementa("nova_sottoprocessi_total", programma=programma)
+    traccia = getattr(_locale, "traccia", None)
+    if traccia is not None:
+        traccia.sottoprocessi += 1
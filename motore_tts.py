@@ -0,0 +1,523 @@
+import os
+import json
+import math
+import wave
+import array
+import zlib
+import itertools
+import threading
+import traceback
+import importlib
+import contextlib
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from profilo_cpu import applica_al_processo, applica_a_torch, descrizione_profilo, profilo_da_ambiente
+
+# --- Worker di sintesi XTTS v2 persistente ---
+# Il modello viene caricato una sola volta in un processo dedicato, che riceve i lavori
+# su una pipe locale e risponde con l'esito. Se il processo cade viene riavviato.
+# Un motore che non dichiara `thread_safe = True` esegue una operazione alla volta: per
+# sintesi in parallelo crea_worker avvia più processi, ognuno con il proprio modello.
+# Thread, affinità ai core e quantizzazione del processo seguono il profilo CPU (vedi profilo_cpu.py).
+
+MODELLO_XTTS = "tts_models/multilingual/multi-dataset/xtts_v2"
+LINGUA_PREDEFINITA = "it"
+
+# Variabile d'ambiente per scegliere il motore del worker condiviso (es. "stub" per i test);
+# il parallelismo (NOVA_TTS_PARALLELISMO) fa parte del profilo CPU
+ENV_MOTORE = "NOVA_TTS_MOTORE"
+
+
+class ErroreSintesi(Exception):
+    """Errore sollevato quando il worker non riesce a completare un lavoro di sintesi."""
+
+
+class ErroreWorkerCaduto(ErroreSintesi):
+    """Il processo worker è terminato mentre il lavoro era in corso."""
+
+
+# --- Motori di sintesi ---
+class MotoreXTTS:
+    """
+    Motore reale basato su Coqui-AI TTS. Va istanziato solo nel processo worker:
+    l'import di torch e il caricamento del modello avvengono una volta sola.
+    """
+    nome = "xtts"
+    # Il GPT di XTTS conserva nel modello il prefisso del condizionamento della richiesta in
+    # corso e la cache dei condizionamenti non è protetta: niente inferenze concorrenti
+    thread_safe = False
+
+    def __init__(self, model_name=MODELLO_XTTS):
+        import torch
+        from TTS.api import TTS
+
+        self._torch = torch
+        self.model_name = model_name
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.tts = TTS(model_name).to(device)
+        self._device = device
+        # Condizionamenti già caricati, indicizzati per (percorso, mtime)
+        self._condizionamenti = {}
+
+    def applica_profilo_cpu(self, profilo):
+        """Thread di torch e quantizzazione int8 del modello (solo su CPU: quantize_dynamic non supporta CUDA)."""
+        if self._device != "cpu" and profilo.quantizzazione:
+            profilo = profilo._replace(quantizzazione=None)
+        return applica_a_torch(self._torch, profilo, self.tts.synthesizer.tts_model)
+
+    def calcola_condizionamento(self, speaker_wav, out_path):
+        """Calcola i latenti GPT e l'embedding dello speaker dal WAV di riferimento e li salva in `out_path`."""
+        modello = self.tts.synthesizer.tts_model
+        gpt_cond_latent, speaker_embedding = modello.get_conditioning_latents(audio_path=[speaker_wav])
+        self._torch.save({"gpt_cond_latent": gpt_cond_latent, "speaker_embedding": speaker_embedding}, out_path)
+        return out_path
+
+    def _carica_condizionamento(self, percorso):
+        chiave = (percorso, os.path.getmtime(percorso))
+        if chiave not in self._condizionamenti:
+            self._condizionamenti[chiave] = self._torch.load(percorso, map_location=self.tts.synthesizer.tts_model.device)
+        return self._condizionamenti[chiave]
+
+    def sintetizza(self, testo, speaker_wav, out_path, lingua=LINGUA_PREDEFINITA, condizionamento=None):
+        if condizionamento is None:
+            self.tts.tts_to_file(text=testo, speaker_wav=speaker_wav, language=lingua, file_path=out_path)
+            return
+        # Condizionamento precalcolato dall'indice degli speaker: niente analisi del WAV di riferimento
+        latenti = self._carica_condizionamento(condizionamento)
+        risultato = self.tts.synthesizer.tts_model.inference(
+            testo, lingua, latenti["gpt_cond_latent"], latenti["speaker_embedding"]
+        )
+        self.tts.synthesizer.save_wav(wav=risultato["wav"], path=out_path)
+
+
+class MotoreStub:
+    """
+    Motore deterministico senza modello, per provare il percorso di sintesi su macchine
+    senza XTTS. Produce un tono la cui frequenza dipende dal testo e la cui durata è
+    proporzionale alla sua lunghezza.
+    """
+    nome = "stub"
+    model_name = "stub"
+    # Nessuno stato condiviso tra le sintesi
+    thread_safe = True
+
+    def __init__(self, frequenza_campionamento=24000, ms_per_carattere=60, ritardo_s=0.0):
+        self.frequenza_campionamento = int(frequenza_campionamento)
+        self.ms_per_carattere = float(ms_per_carattere)
+        self.ritardo_s = float(ritardo_s)
+
+    def calcola_condizionamento(self, speaker_wav, out_path):
+        with open(speaker_wav, "rb") as f:
+            impronta = zlib.crc32(f.read())
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump({"speaker_embedding": [(impronta >> i) & 0xFF for i in range(0, 32, 8)]}, f)
+        return out_path
+
+    def sintetizza(self, testo, speaker_wav, out_path, lingua=LINGUA_PREDEFINITA, condizionamento=None):
+        riferimento = condizionamento or speaker_wav
+        if not os.path.exists(riferimento):
+            raise FileNotFoundError(f"Voce dello speaker non trovata: {riferimento}")
+        if self.ritardo_s:
+            threading.Event().wait(self.ritardo_s)
+
+        n_campioni = max(1, int(len(testo) * self.ms_per_carattere * self.frequenza_campionamento / 1000))
+        frequenza_tono = 180 + zlib.crc32(f"{lingua}|{testo}".encode("utf-8")) % 220
+        passo = 2 * math.pi * frequenza_tono / self.frequenza_campionamento
+        campioni = array.array("h", (int(8000 * math.sin(passo * i)) for i in range(n_campioni)))
+
+        with wave.open(out_path, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.frequenza_campionamento)
+            wav_file.writeframes(campioni.tobytes())
+
+
+MOTORI = {
+    "xtts": MotoreXTTS,
+    "stub": MotoreStub,
+}
+
+
+def classe_motore(nome):
+    """
+    Classe di un motore di sintesi. `nome` può essere una chiave di MOTORI oppure
+    un riferimento "modulo:Classe" per motori esterni.
+    """
+    if nome in MOTORI:
+        return MOTORI[nome]
+    if ":" in nome:
+        nome_modulo, nome_classe = nome.split(":", 1)
+        return getattr(importlib.import_module(nome_modulo), nome_classe)
+    raise ValueError(f"Motore TTS sconosciuto: {nome}. Disponibili: {', '.join(MOTORI)}")
+
+
+def crea_motore(nome, **opzioni):
+    """Istanzia un motore di sintesi (vedi classe_motore per `nome`)."""
+    return classe_motore(nome)(**opzioni)
+
+
+def motore_thread_safe(nome):
+    """True se il motore dichiara di poter eseguire più operazioni in contemporanea sullo stesso modello."""
+    return bool(getattr(classe_motore(nome), "thread_safe", False))
+
+
+# --- Processo worker ---
+# Operazioni che il processo worker accetta dal client
+OPERAZIONI_CONSENTITE = {"sintetizza", "calcola_condizionamento"}
+
+
+def _ciclo_worker(conn, nome_motore, opzioni_motore, parallelismo, profilo=None):
+    """
+    Punto di ingresso del processo worker: applica il profilo CPU, carica il motore e serve i
+    lavori dalla pipe. Con "pronto" comunica il modello e il profilo effettivamente applicato.
+    """
+    try:
+        # Prima del motore: le librerie di calcolo leggono il numero di thread al caricamento
+        profilo_applicato = applica_al_processo(profilo) if profilo is not None else None
+        motore = crea_motore(nome_motore, **opzioni_motore)
+        if profilo is not None and hasattr(motore, "applica_profilo_cpu"):
+            profilo_applicato.update(motore.applica_profilo_cpu(profilo))
+    except Exception as e:
+        conn.send(("avvio_fallito", None, f"{type(e).__name__}: {e}\n{traceback.format_exc()}"))
+        conn.close()
+        return
+    conn.send(("pronto", None, (getattr(motore, "model_name", nome_motore), profilo_applicato)))
+
+    lock_invio = threading.Lock()
+    # Con un motore non thread-safe il pool serve solo la pipe: le operazioni restano in fila
+    lock_motore = contextlib.nullcontext() if getattr(motore, "thread_safe", False) else threading.Lock()
+
+    def esegui(id_lavoro, operazione, argomenti):
+        try:
+            with lock_motore:
+                risultato = getattr(motore, operazione)(**argomenti)
+            risposta = ("ok", id_lavoro, risultato)
+        except Exception as e:
+            risposta = ("errore", id_lavoro, f"{type(e).__name__}: {e}")
+        with lock_invio:
+            conn.send(risposta)
+
+    with ThreadPoolExecutor(max_workers=parallelismo, thread_name_prefix="nova-tts") as pool:
+        while True:
+            try:
+                messaggio = conn.recv()
+            except (EOFError, OSError):
+                break
+            if messaggio is None:  # Richiesta di chiusura ordinata
+                break
+            id_lavoro, operazione, argomenti = messaggio
+            if operazione not in OPERAZIONI_CONSENTITE:
+                with lock_invio:
+                    conn.send(("errore", id_lavoro, f"Operazione non supportata: {operazione}"))
+                continue
+            pool.submit(esegui, id_lavoro, operazione, argomenti)
+
+
+# --- Client del worker ---
+class WorkerTTS:
+    """
+    Client di un processo worker di sintesi a lunga vita.
+    I lavori vengono inviati su una pipe e risolti tramite Future; fino a `parallelismo`
+    lavori vengono eseguiti in contemporanea condividendo lo stesso modello caricato, se il
+    motore è thread-safe (altrimenti uno alla volta: vedi crea_worker e GruppoWorkerTTS).
+    Se il processo cade, i lavori in corso falliscono con ErroreWorkerCaduto e il worker
+    viene riavviato in background. `profilo` (profilo_cpu.ProfiloCPU) viene applicato al
+    processo worker; il profilo effettivo è in `profilo_applicato` dopo l'avvio.
+    """
+
+    def __init__(self, motore="xtts", opzioni_motore=None, parallelismo=1, timeout_avvio=900, max_riavvii=3,
+                 profilo=None):
+        self.motore = motore
+        self.opzioni_motore = dict(opzioni_motore or {})
+        self.parallelismo = max(1, int(parallelismo))
+        self.profilo = profilo
+        self.profilo_applicato = None
+        self.timeout_avvio = timeout_avvio
+        self.max_riavvii = max_riavvii
+        self.model_name = None
+        self.riavvii = 0
+        # Identifica il modello senza doverlo caricare (usato ad esempio come chiave di cache)
+        self.id_modello = self.opzioni_motore.get("model_name", MODELLO_XTTS if motore == "xtts" else motore)
+
+        self._lock = threading.RLock()
+        self._contatore = itertools.count(1)
+        self._in_corso = {}
+        self._processo = None
+        self._conn = None
+        self._chiuso = False
+        self._avvii_falliti = 0
+
+    @property
+    def attivo(self):
+        return self._processo is not None and self._processo.is_alive()
+
+    def avvia(self):
+        """Avvia il processo worker (se non è già attivo) e attende che il modello sia caricato."""
+        with self._lock:
+            if self._chiuso:
+                raise ErroreSintesi("Il worker TTS è stato chiuso.")
+            if self.attivo:
+                return
+            if self._avvii_falliti >= self.max_riavvii:
+                raise ErroreSintesi(f"Il worker TTS non si avvia dopo {self._avvii_falliti} tentativi.")
+
+            contesto = multiprocessing.get_context("spawn")
+            conn_client, conn_worker = contesto.Pipe()
+            processo = contesto.Process(
+                target=_ciclo_worker,
+                args=(conn_worker, self.motore, self.opzioni_motore, self.parallelismo, self.profilo),
+                name=f"nova-tts-{self.motore}",
+                daemon=True,
+            )
+            processo.start()
+            conn_worker.close()
+
+            if not conn_client.poll(self.timeout_avvio):
+                processo.kill()
+                # Raccoglie il processo terminato: i riavvii non lasciano processi zombie
+                processo.join()
+                self._avvii_falliti += 1
+                raise ErroreSintesi(f"Il worker TTS non ha caricato il modello entro {self.timeout_avvio} secondi.")
+            try:
+                stato, _, dettaglio = conn_client.recv()
+            except (EOFError, OSError):
+                stato, dettaglio = "avvio_fallito", f"processo terminato con codice {processo.exitcode}"
+            if stato != "pronto":
+                processo.join(timeout=5)
+                if processo.is_alive():
+                    processo.kill()
+                    processo.join()
+                self._avvii_falliti += 1
+                raise ErroreSintesi(f"Avvio del worker TTS fallito: {dettaglio}")
+
+            self._avvii_falliti = 0
+            self.model_name, self.profilo_applicato = dettaglio
+            self._processo = processo
+            self._conn = conn_client
+            threading.Thread(
+                target=self._leggi_risposte, args=(conn_client, processo),
+                name="nova-tts-lettore", daemon=True,
+            ).start()
+
+    def _leggi_risposte(self, conn, processo):
+        """Thread lettore: smista le risposte del worker ai Future corrispondenti."""
+        while True:
+            try:
+                stato, id_lavoro, dettaglio = conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._in_corso.pop(id_lavoro, None)
+            if future is None:
+                continue
+            if stato == "ok":
+                future.set_result(dettaglio)
+            else:
+                future.set_exception(ErroreSintesi(dettaglio))
+
+        # Il processo è caduto (o è stato chiuso): fallisci i lavori pendenti
+        processo.join(timeout=5)
+        with self._lock:
+            if self._processo is not processo:
+                return
+            pendenti = list(self._in_corso.values())
+            self._in_corso.clear()
+            self._processo = None
+            self._conn = None
+            riavvia = not self._chiuso
+        for future in pendenti:
+            future.set_exception(ErroreWorkerCaduto(f"Il worker TTS è terminato (codice {processo.exitcode})."))
+        if riavvia:
+            self.riavvii += 1
+            threading.Thread(target=self._riavvia_in_background, name="nova-tts-riavvio", daemon=True).start()
+
+    def _riavvia_in_background(self):
+        try:
+            self.avvia()
+        except ErroreSintesi:
+            pass  # Verrà ritentato al prossimo lavoro inviato
+
+    def invia(self, operazione, **argomenti):
+        """Invia un lavoro al worker e restituisce un Future con il risultato."""
+        return self._invia(operazione, argomenti)[1]
+
+    def _invia(self, operazione, argomenti):
+        with self._lock:
+            self.avvia()
+            id_lavoro = next(self._contatore)
+            future = Future()
+            self._in_corso[id_lavoro] = future
+            try:
+                self._conn.send((id_lavoro, operazione, argomenti))
+            except (OSError, ValueError) as e:
+                self._in_corso.pop(id_lavoro, None)
+                raise ErroreWorkerCaduto(f"Impossibile inviare il lavoro al worker TTS: {e}")
+        return id_lavoro, future
+
+    def _esegui_con_riprova(self, operazione, timeout, **argomenti):
+        # Se il worker cade durante il lavoro, il lavoro viene ritentato una volta sul worker riavviato
+        for tentativo in range(2):
+            id_lavoro, future = self._invia(operazione, argomenti)
+            try:
+                return future.result(timeout=timeout)
+            except ErroreWorkerCaduto:
+                if tentativo:
+                    raise
+            finally:
+                # Dopo un timeout (o un errore) il lavoro non è più atteso: una risposta in ritardo
+                # viene scartata dal lettore invece di risolvere un Future abbandonato
+                with self._lock:
+                    self._in_corso.pop(id_lavoro, None)
+
+    def sintetizza(self, testo, speaker_wav, out_path, lingua=LINGUA_PREDEFINITA, condizionamento=None, timeout=None):
+        """
+        Sintetizza `testo` con la voce `speaker_wav` e scrive il WAV in `out_path`.
+        Con `condizionamento` (file prodotto da calcola_condizionamento) il motore non
+        rianalizza il WAV di riferimento.
+        """
+        argomenti = {"testo": testo, "speaker_wav": speaker_wav, "out_path": out_path, "lingua": lingua}
+        if condizionamento is not None:
+            argomenti["condizionamento"] = condizionamento
+        self._esegui_con_riprova("sintetizza", timeout, **argomenti)
+        return out_path
+
+    def calcola_condizionamento(self, speaker_wav, out_path, timeout=None):
+        """Precalcola nel worker il condizionamento della voce `speaker_wav` e lo salva in `out_path`."""
+        return self._esegui_con_riprova("calcola_condizionamento", timeout, speaker_wav=speaker_wav, out_path=out_path)
+
+    def descrizione_profilo(self):
+        """Profilo CPU applicato (dopo l'avvio) o configurato, come dizionario; None senza profilo."""
+        if self.profilo_applicato is not None:
+            return dict(self.profilo_applicato)
+        return descrizione_profilo(self.profilo) if self.profilo is not None else None
+
+    def chiudi(self):
+        """Chiude il worker in modo ordinato."""
+        with self._lock:
+            self._chiuso = True
+            processo, conn = self._processo, self._conn
+        if conn is not None:
+            try:
+                conn.send(None)
+            except (OSError, ValueError):
+                pass
+        if processo is not None:
+            processo.join(timeout=10)
+            if processo.is_alive():
+                processo.kill()
+                processo.join()
+
+
+class GruppoWorkerTTS:
+    """
+    Più processi worker (WorkerTTS) con un modello ciascuno, per i motori che non possono
+    sintetizzare in parallelo sullo stesso modello. Ogni lavoro va al worker con meno lavori
+    in corso; l'interfaccia è quella di WorkerTTS.
+    """
+
+    def __init__(self, worker):
+        self.worker = list(worker)
+        primo = self.worker[0]
+        self.motore = primo.motore
+        self.id_modello = primo.id_modello
+        self.profilo = primo.profilo
+        self.parallelismo = sum(worker.parallelismo for worker in self.worker)
+        self._lock = threading.Lock()
+        self._carico = [0] * len(self.worker)
+
+    @property
+    def attivo(self):
+        return all(worker.attivo for worker in self.worker)
+
+    @property
+    def riavvii(self):
+        return sum(worker.riavvii for worker in self.worker)
+
+    @property
+    def model_name(self):
+        return self.worker[0].model_name
+
+    @property
+    def profilo_applicato(self):
+        return self.worker[0].profilo_applicato
+
+    def avvia(self):
+        """Avvia tutti i processi del gruppo (uno alla volta: il caricamento del modello ha già il suo picco di memoria)."""
+        for worker in self.worker:
+            worker.avvia()
+
+    def _prendi(self):
+        with self._lock:
+            posizione = min(range(len(self.worker)), key=self._carico.__getitem__)
+            self._carico[posizione] += 1
+        return posizione
+
+    def _rilascia(self, posizione):
+        with self._lock:
+            self._carico[posizione] -= 1
+
+    def invia(self, operazione, **argomenti):
+        posizione = self._prendi()
+        try:
+            future = self.worker[posizione].invia(operazione, **argomenti)
+        except BaseException:
+            self._rilascia(posizione)
+            raise
+        future.add_done_callback(lambda _: self._rilascia(posizione))
+        return future
+
+    def _esegui(self, operazione, *args, **kwargs):
+        posizione = self._prendi()
+        try:
+            return getattr(self.worker[posizione], operazione)(*args, **kwargs)
+        finally:
+            self._rilascia(posizione)
+
+    def sintetizza(self, *args, **kwargs):
+        return self._esegui("sintetizza", *args, **kwargs)
+
+    def calcola_condizionamento(self, *args, **kwargs):
+        return self._esegui("calcola_condizionamento", *args, **kwargs)
+
+    def descrizione_profilo(self):
+        return self.worker[0].descrizione_profilo()
+
+    def chiudi(self):
+        for worker in self.worker:
+            worker.chiudi()
+
+
+def crea_worker(motore="xtts", opzioni_motore=None, parallelismo=1, profilo=None, **opzioni):
+    """
+    Worker TTS per `parallelismo` sintesi in contemporanea: un solo processo se il motore è
+    thread-safe, altrimenti un GruppoWorkerTTS con un processo (e un modello in memoria) per
+    ogni sintesi parallela. `opzioni` vanno a WorkerTTS.
+    """
+    parallelismo = max(1, int(parallelismo))
+    if parallelismo == 1 or motore_thread_safe(motore):
+        return WorkerTTS(motore, opzioni_motore, parallelismo, profilo=profilo, **opzioni)
+    return GruppoWorkerTTS(
+        WorkerTTS(motore, opzioni_motore, 1, profilo=profilo, **opzioni) for _ in range(parallelismo)
+    )
+
+
+# --- Worker condiviso dall'applicazione ---
+_worker_condiviso = None
+_lock_worker_condiviso = threading.Lock()
+
+
+def ottieni_worker_condiviso():
+    """
+    Restituisce il worker TTS condiviso dal processo (creato al primo utilizzo).
+    Il motore si sceglie con NOVA_TTS_MOTORE ("xtts" predefinito, "stub" per i test), il
+    profilo CPU con le variabili NOVA_CPU_* e NOVA_TTS_PARALLELISMO (vedi profilo_cpu.py).
+    """
+    global _worker_condiviso
+    with _lock_worker_condiviso:
+        if _worker_condiviso is None:
+            profilo = profilo_da_ambiente()
+            _worker_condiviso = crea_worker(
+                motore=os.environ.get(ENV_MOTORE, "xtts"), parallelismo=profilo.parallelismo, profilo=profilo,
+            )
+        return _worker_condiviso
@@ -0,0 +1,214 @@
+"""
+Rendering in batch senza interfaccia: sintesi XTTS + filtri per una cartella di file .txt
+o per un manifest JSONL, con più lavori in parallelo serviti dal worker TTS persistente (un
+solo modello caricato, oppure uno per lavoro parallelo se il motore non è thread-safe).
+
+Esempi:
+    python nova_batch.py letture/ --speaker Ana_Florence --uscita filtered_output_audio
+    python nova_batch.py manifest.jsonl --paralleli 4
+
+Ogni riga del manifest è un oggetto JSON con i campi:
+    text (oppure file: percorso di un .txt), speaker, pitch, speed, volume, output
+I campi mancanti prendono i valori passati da riga di comando.
+
+Gli output già presenti vengono saltati, quindi rilanciare lo stesso comando dopo
+un'interruzione riprende dal punto in cui si era fermato. Al termine viene scritto un
+report JSON con i tempi di ogni elemento.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from audio_wav import analizza_wav, durata_secondi
+from cache_sintesi import ottieni_cache_condivisa
+from filtri_audio import filtra_wav_su_file, ErroreFiltri
+from indice_speaker import ottieni_indice_condiviso
+from motore_tts import crea_worker, ErroreSintesi, ENV_MOTORE, LINGUA_PREDEFINITA
+from pipeline_sintesi import sintetizza_voce, PAUSA_TRA_FRASI_MS
+from profilo_cpu import profilo_da_ambiente
+
+SPEAKER_DIR = "speaker_previews"
+OUTPUT_DIR = "filtered_output_audio"
+NOME_REPORT = "report_batch.json"
+
+
+def _elementi_da_cartella(cartella, predefiniti):
+    for nome_file in sorted(os.listdir(cartella)):
+        if nome_file.endswith(".txt"):
+            yield dict(predefiniti, id=nome_file, file=os.path.join(cartella, nome_file),
+                       output=os.path.splitext(nome_file)[0])
+
+
+def _elementi_da_manifest(percorso, predefiniti):
+    cartella_manifest = os.path.dirname(os.path.abspath(percorso))
+    with open(percorso, "r", encoding="utf-8") as f:
+        for numero_riga, riga in enumerate(f, start=1):
+            if not riga.strip():
+                continue
+            try:
+                voce = json.loads(riga)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{percorso}:{numero_riga}: JSON non valido ({e})")
+            elemento = dict(predefiniti, id=f"riga {numero_riga}", **voce)
+            if "file" in voce and not os.path.isabs(voce["file"]):
+                elemento["file"] = os.path.join(cartella_manifest, voce["file"])
+            if "output" not in voce:
+                nome_base = os.path.splitext(os.path.basename(voce["file"]))[0] if "file" in voce else f"riga_{numero_riga:05d}"
+                elemento["output"] = nome_base
+            yield elemento
+
+
+def carica_elementi(ingresso, predefiniti):
+    """Elenco degli elementi da renderizzare da una cartella di .txt o da un manifest JSONL."""
+    if os.path.isdir(ingresso):
+        elementi = list(_elementi_da_cartella(ingresso, predefiniti))
+    else:
+        elementi = list(_elementi_da_manifest(ingresso, predefiniti))
+    for elemento in elementi:
+        if not elemento["output"].lower().endswith(".wav"):
+            elemento["output"] += ".wav"
+    return elementi
+
+
+def renderizza_elemento(elemento, cartella_uscita, worker, indice, cache, argomenti):
+    """Sintetizza e filtra un elemento, scrivendo l'output in modo atomico. Restituisce la voce del report."""
+    percorso_uscita = os.path.join(cartella_uscita, elemento["output"])
+    voce_report = {"id": elemento["id"], "output": percorso_uscita, "speaker": elemento["speaker"]}
+    if os.path.exists(percorso_uscita):
+        voce_report["stato"] = "saltato"
+        return voce_report
+
+    inizio = time.perf_counter()
+    try:
+        if "file" in elemento:
+            with open(elemento["file"], "r", encoding="utf-8") as f:
+                testo = f.read()
+        else:
+            testo = elemento.get("text", "")
+        if not testo.strip():
+            raise ValueError("testo vuoto")
+
+        wav = sintetizza_voce(
+            testo, elemento["speaker"], argomenti.speaker_dir, worker, indice=indice, cache=cache,
+            lingua=argomenti.lingua, pausa_ms=argomenti.pausa_ms,
+        )
+        fine_sintesi = time.perf_counter()
+
+        # Scrittura su file parziale + rename: un'interruzione non lascia output incompleti
+        percorso_parziale = percorso_uscita + ".part"
+        filtra_wav_su_file(
+            wav, percorso_parziale,
+            int(elemento["pitch"]), float(elemento["speed"]), float(elemento["volume"]),
+        )
+        os.replace(percorso_parziale, percorso_uscita)
+        fine = time.perf_counter()
+
+        formato, _, n_bytes = analizza_wav(wav)
+        voce_report.update(
+            stato="ok",
+            secondi_sintesi=round(fine_sintesi - inizio, 3),
+            secondi_filtri=round(fine - fine_sintesi, 3),
+            secondi_totali=round(fine - inizio, 3),
+            durata_audio_s=round(durata_secondi(formato, n_bytes), 3),
+        )
+    except (ErroreSintesi, ErroreFiltri, OSError, ValueError) as e:
+        voce_report.update(stato="errore", errore=str(e), secondi_totali=round(time.perf_counter() - inizio, 3))
+    return voce_report
+
+
+def scrivi_report(percorso, voci, inizio_batch, ordine_id):
+    conteggi = {}
+    for voce in voci:
+        conteggi[voce["stato"]] = conteggi.get(voce["stato"], 0) + 1
+    report = {
+        "data": datetime.datetime.now().isoformat(timespec="seconds"),
+        "secondi_totali": round(time.perf_counter() - inizio_batch, 3),
+        "conteggi": conteggi,
+        "elementi": sorted(voci, key=lambda voce: ordine_id[voce["id"]]),
+    }
+    percorso_temporaneo = percorso + ".tmp"
+    with open(percorso_temporaneo, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(percorso_temporaneo, percorso)
+    return report
+
+
+def crea_parser():
+    parser = argparse.ArgumentParser(
+        description="Rendering in batch di NovaStudioVocale (cartella di .txt o manifest JSONL).",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("ingresso", help="Cartella di file .txt oppure manifest .jsonl")
+    parser.add_argument("--uscita", default=OUTPUT_DIR, help=f"Cartella di output (predefinita: {OUTPUT_DIR})")
+    parser.add_argument("--speaker", help="Voce predefinita (nome del file in speaker_previews, senza .wav)")
+    parser.add_argument("--pitch", type=int, default=0, help="Pitch predefinito in semitoni")
+    parser.add_argument("--speed", type=float, default=1.0, help="Fattore di velocità predefinito")
+    parser.add_argument("--volume", type=float, default=0, help="Volume predefinito in dB")
+    parser.add_argument("--pausa-ms", type=int, default=PAUSA_TRA_FRASI_MS, help="Pausa tra le frasi in millisecondi")
+    parser.add_argument("--lingua", default=LINGUA_PREDEFINITA)
+    parser.add_argument("--paralleli", type=int, default=2, help="Elementi renderizzati in parallelo")
+    parser.add_argument("--speaker-dir", default=SPEAKER_DIR)
+    parser.add_argument("--motore", default=os.environ.get(ENV_MOTORE, "xtts"), help="Motore TTS (xtts, stub, modulo:Classe)")
+    parser.add_argument("--report", help=f"Percorso del report JSON (predefinito: <uscita>/{NOME_REPORT})")
+    return parser
+
+
+def main(argv=None):
+    argomenti = crea_parser().parse_args(argv)
+    predefiniti = {"speaker": argomenti.speaker, "pitch": argomenti.pitch, "speed": argomenti.speed, "volume": argomenti.volume}
+    try:
+        elementi = carica_elementi(argomenti.ingresso, predefiniti)
+    except (OSError, ValueError) as e:
+        print(f"❌ Impossibile leggere l'ingresso: {e}", file=sys.stderr)
+        return 2
+    senza_voce = [elemento["id"] for elemento in elementi if not elemento.get("speaker")]
+    if senza_voce:
+        print(f"❌ Nessuna voce per: {', '.join(senza_voce)} (usa --speaker o il campo 'speaker').", file=sys.stderr)
+        return 2
+
+    os.makedirs(argomenti.uscita, exist_ok=True)
+    percorso_report = argomenti.report or os.path.join(argomenti.uscita, NOME_REPORT)
+    # Processo worker con il modello caricato, condiviso dai lavori paralleli (uno per lavoro
+    # parallelo se il motore non è thread-safe, vedi motore_tts.crea_worker)
+    # Thread per sintesi ripartiti tra gli elementi paralleli (variabili NOVA_CPU_*, vedi profilo_cpu.py)
+    profilo = profilo_da_ambiente(parallelismo=argomenti.paralleli)
+    worker = crea_worker(motore=argomenti.motore, parallelismo=profilo.parallelismo, profilo=profilo)
+    indice = ottieni_indice_condiviso(argomenti.speaker_dir)
+    cache = ottieni_cache_condivisa()
+
+    inizio_batch = time.perf_counter()
+    voci_report = []
+    lock_stampa = threading.Lock()
+    pool = ThreadPoolExecutor(max_workers=argomenti.paralleli)
+    try:
+        futures = {
+            pool.submit(renderizza_elemento, elemento, argomenti.uscita, worker, indice, cache, argomenti): elemento
+            for elemento in elementi
+        }
+        for completati, future in enumerate(as_completed(futures), start=1):
+            voce = future.result()
+            voci_report.append(voce)
+            with lock_stampa:
+                dettaglio = voce.get("errore") or (f"{voce['secondi_totali']:.1f} s" if "secondi_totali" in voce else "")
+                print(f"[{completati}/{len(elementi)}] {voce['stato']:>8} {voce['id']} {dettaglio}", flush=True)
+    except KeyboardInterrupt:
+        print("Interrotto: gli output completati restano, rilancia lo stesso comando per riprendere.", file=sys.stderr)
+        pool.shutdown(wait=False, cancel_futures=True)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        ordine_id = {elemento["id"]: posizione for posizione, elemento in enumerate(elementi)}
+        report = scrivi_report(percorso_report, voci_report, inizio_batch, ordine_id)
+        worker.chiudi()
+
+    print(f"Report: {percorso_report} {report['conteggi']}")
+    return 1 if report["conteggi"].get("errore") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
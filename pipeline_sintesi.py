@@ -0,0 +1,209 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_wav import leggi_pcm, componi_wav, silenzio_pcm
+from cache_sintesi import impronta_file
+from motore_tts import LINGUA_PREDEFINITA, ErroreSintesi
+
+# --- Pipeline di sintesi a blocchi ---
+# Il testo viene diviso in frasi, le frasi vengono sintetizzate su un pool limitato di lavori
+# paralleli e ricucite in ordine con una pausa configurabile. Il primo blocco è disponibile
+# appena pronto, senza aspettare il resto del testo.
+
+# Silenzio predefinito inserito tra una frase e la successiva
+PAUSA_TRA_FRASI_MS = 250
+# XTTS avvisa oltre ~213 caratteri per l'italiano: le frasi più lunghe vengono spezzate
+MAX_CARATTERI_BLOCCO = 220
+
+# Fine frase (. ! ? … ;) seguita da spazi, oppure un ritorno a capo ("Punto a Capo")
+_CONFINE_FRASE = re.compile(r"(?<=[.!?…;])\s+|\s*\n\s*")
+_CONFINE_CLAUSOLA = re.compile(r"(?<=,)\s+")
+_CARATTERE_PAROLA = re.compile(r"\w")
+
+
+def _spezza_frase_lunga(frase, max_caratteri):
+    """Divide una frase troppo lunga alle virgole e, se serve, tra le parole."""
+    if len(frase) <= max_caratteri:
+        return [frase]
+    blocchi = []
+    for clausola in _CONFINE_CLAUSOLA.split(frase):
+        parti = clausola.split() if len(clausola) > max_caratteri else [clausola]
+        for parte in parti:
+            if blocchi and len(blocchi[-1]) + 1 + len(parte) <= max_caratteri:
+                blocchi[-1] += " " + parte
+            else:
+                blocchi.append(parte)
+    return blocchi
+
+
+def dividi_in_frasi(testo, max_caratteri=MAX_CARATTERI_BLOCCO):
+    """
+    Divide il testo in blocchi da sintetizzare ai confini di frase e di pausa.
+    I frammenti di sola punteggiatura (es. i "..." della Pausa Liturgica) restano attaccati
+    alla frase precedente.
+    """
+    frasi = []
+    for frammento in _CONFINE_FRASE.split(testo):
+        frammento = frammento.strip()
+        if not frammento:
+            continue
+        if not _CARATTERE_PAROLA.search(frammento):
+            if frasi:
+                frasi[-1] += frammento
+            continue
+        frasi.extend(_spezza_frase_lunga(frammento, max_caratteri))
+    return frasi
+
+
+def risolutore_pigro(valore):
+    """Funzione che restituisce `valore` oppure, se è una funzione, lo calcola una sola volta."""
+    if not callable(valore):
+        return lambda: valore
+    lock = threading.Lock()
+    risultato = []
+
+    def risolvi():
+        with lock:
+            if not risultato:
+                risultato.append(valore())
+        return risultato[0]
+    return risolvi
+
+
+def sintetizza_frase(frase, speaker_wav, worker, out_path, lingua=LINGUA_PREDEFINITA, cache=None, condizionamento=None,
+                     impronta_speaker=None):
+    """
+    Sintetizza una sola frase e restituisce (FormatoPCM, pcm). Il worker scrive `out_path`, che
+    viene eliminato dopo la lettura. Con una `cache` la frase già sintetizzata con la stessa voce
+    (`impronta_speaker`) non torna al worker; `condizionamento` può essere una funzione, chiamata
+    solo se la frase va davvero sintetizzata.
+    """
+    if cache is not None:
+        chiave = cache.chiave(frase, impronta_speaker, lingua, worker.id_modello)
+        dati = cache.leggi(chiave)
+        if dati is not None:
+            return leggi_pcm(dati)
+
+    if callable(condizionamento):
+        condizionamento = condizionamento()
+    worker.sintetizza(frase, speaker_wav, out_path, lingua=lingua, condizionamento=condizionamento)
+    if not os.path.exists(out_path) or os.path.getsize(out_path) == 0:
+        raise ErroreSintesi("Il worker TTS non ha prodotto audio per la frase.")
+    with open(out_path, "rb") as f:
+        dati = f.read()
+    os.remove(out_path)
+    if cache is not None:
+        cache.scrivi(chiave, dati)
+    return leggi_pcm(dati)
+
+
+def genera_blocchi(testo, speaker_wav, worker, lingua=LINGUA_PREDEFINITA, max_paralleli=None, cartella_lavoro=None,
+                   cache=None, condizionamento=None, impronta_speaker=None):
+    """
+    Sintetizza il testo frase per frase e produce, in ordine, tuple
+    (indice, totale, FormatoPCM, pcm) appena ogni blocco è pronto.
+    Al massimo `max_paralleli` frasi (predefinito: il parallelismo del worker) sono in lavorazione.
+    Con una `cache` (CacheSintesi) le frasi già sintetizzate con la stessa voce non tornano al worker.
+    `condizionamento` è il file del condizionamento precalcolato della voce (vedi indice_speaker.py),
+    oppure una funzione che lo restituisce: viene chiamata una sola volta, alla prima frase da sintetizzare.
+    """
+    frasi = dividi_in_frasi(testo)
+    if not frasi:
+        raise ErroreSintesi("Testo vuoto per la generazione vocale.")
+
+    cartella = cartella_lavoro or tempfile.mkdtemp(prefix="nova_tts_")
+    max_paralleli = max_paralleli or getattr(worker, "parallelismo", 1)
+    risolvi_condizionamento = risolutore_pigro(condizionamento)
+    if cache is not None and impronta_speaker is None:
+        impronta_speaker = impronta_file(speaker_wav)
+
+    def sintetizza_blocco(indice, frase):
+        try:
+            return sintetizza_frase(
+                frase, speaker_wav, worker, os.path.join(cartella, f"blocco_{indice:05d}.wav"), lingua=lingua,
+                cache=cache, condizionamento=risolvi_condizionamento, impronta_speaker=impronta_speaker,
+            )
+        except ErroreSintesi as e:
+            raise ErroreSintesi(f"Frase {indice + 1}: {e}") from e
+
+    pool = ThreadPoolExecutor(max_workers=max_paralleli, thread_name_prefix="nova-frasi")
+    try:
+        futures = [pool.submit(sintetizza_blocco, indice, frase) for indice, frase in enumerate(frasi)]
+        for indice, future in enumerate(futures):
+            formato, pcm = future.result()
+            yield indice, len(frasi), formato, pcm
+    finally:
+        # Se il consumatore si ferma prima della fine, le frasi non ancora avviate vengono annullate
+        pool.shutdown(wait=True, cancel_futures=True)
+        if cartella_lavoro is None:
+            shutil.rmtree(cartella, ignore_errors=True)
+
+
+def sintetizza_testo(testo, speaker_wav, worker, lingua=LINGUA_PREDEFINITA, pausa_ms=PAUSA_TRA_FRASI_MS,
+                     max_paralleli=None, al_blocco=None, cache=None, condizionamento=None, impronta_speaker=None,
+                     cartella_lavoro=None):
+    """
+    Sintetizza l'intero testo e restituisce i bytes del WAV ricucito, con `pausa_ms` di silenzio
+    tra le frasi. `al_blocco(indice, totale, formato, pcm)` viene chiamata per ogni blocco in
+    ordine, appena disponibile (utile per riprodurre subito la prima frase); un'eccezione
+    sollevata da `al_blocco` interrompe la sintesi delle frasi rimanenti.
+    """
+    formato = None
+    blocchi = []
+    generatore = genera_blocchi(
+        testo, speaker_wav, worker, lingua, max_paralleli, cartella_lavoro=cartella_lavoro,
+        cache=cache, condizionamento=condizionamento, impronta_speaker=impronta_speaker,
+    )
+    with closing(generatore):
+        for indice, totale, formato_blocco, pcm in generatore:
+            if formato is None:
+                formato = formato_blocco
+            elif formato_blocco != formato:
+                raise ErroreSintesi(f"Formato audio incoerente tra le frasi: {formato_blocco} invece di {formato}.")
+            if blocchi:
+                blocchi.append(silenzio_pcm(formato, pausa_ms))
+            blocchi.append(pcm)
+            if al_blocco is not None:
+                al_blocco(indice, totale, formato, pcm)
+    return componi_wav(formato, blocchi)
+
+
+def risolvi_voce(nome_speaker, cartella_speaker, worker, indice=None):
+    """
+    Argomenti di sintesi per una voce di `cartella_speaker`: percorso del WAV di riferimento e,
+    se è fornito l'indice degli speaker, impronta e condizionamento precalcolato (calcolato al
+    primo utilizzo; se non disponibile si ripiega sul WAV di riferimento).
+    """
+    speaker_wav = os.path.join(cartella_speaker, f"{nome_speaker}.wav")
+    if not os.path.exists(speaker_wav):
+        raise ErroreSintesi(f"Voce dello speaker non trovata: {speaker_wav}")
+
+    argomenti = {"speaker_wav": speaker_wav, "condizionamento": None, "impronta_speaker": None}
+    info = indice.info(nome_speaker) if indice is not None else None
+    if info is not None:
+        def condizionamento():
+            try:
+                return indice.condizionamento(nome_speaker, worker)
+            except ErroreSintesi:
+                return None
+
+        argomenti.update(condizionamento=condizionamento, impronta_speaker=info["impronta"])
+    return argomenti
+
+
+def sintetizza_voce(testo, nome_speaker, cartella_speaker, worker, indice=None, cache=None, lingua=LINGUA_PREDEFINITA,
+                    pausa_ms=PAUSA_TRA_FRASI_MS, max_paralleli=None, al_blocco=None, cartella_lavoro=None):
+    """
+    Sintetizza il testo con una voce di `cartella_speaker`, usando il condizionamento precalcolato
+    dell'indice degli speaker (se fornito) e la cache delle frasi. Restituisce i bytes del WAV.
+    """
+    return sintetizza_testo(
+        testo, worker=worker, lingua=lingua, pausa_ms=pausa_ms, max_paralleli=max_paralleli,
+        al_blocco=al_blocco, cache=cache, cartella_lavoro=cartella_lavoro,
+        **risolvi_voce(nome_speaker, cartella_speaker, worker, indice),
+    )
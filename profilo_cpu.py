@@ -0,0 +1,174 @@
+import os
+from collections import namedtuple
+
+# --- Profilo CPU dell'inferenza ---
+# Sui server senza GPU il worker TTS decide quanti core usa ogni sintesi: con più lavori in
+# parallelo nello stesso processo ogni thread chiamante apre il proprio gruppo OpenMP, quindi
+# `parallelismo` × thread intra-op non deve superare i core disponibili. Il profilo fissa thread
+# intra-op e inter-op, lavori paralleli, affinità ai core e quantizzazione dinamica int8 dei
+# livelli lineari, ed è applicato nel processo worker prima di importare torch.
+#   latenza:    una sintesi alla volta che usa tutti i core (la frase arriva prima)
+#   throughput: più sintesi in parallelo, ognuna con una parte dei core (più frasi al secondo)
+
+ENV_PRESET = "NOVA_CPU_PRESET"
+ENV_THREAD_INTRA = "NOVA_CPU_THREAD_INTRA"
+ENV_THREAD_INTER = "NOVA_CPU_THREAD_INTER"
+ENV_AFFINITA = "NOVA_CPU_AFFINITA"
+ENV_QUANTIZZAZIONE = "NOVA_CPU_QUANTIZZAZIONE"
+# Il parallelismo del worker resta configurabile anche con la variabile già esistente
+ENV_PARALLELISMO = "NOVA_TTS_PARALLELISMO"
+
+PRESET = ("latenza", "throughput")
+PRESET_PREDEFINITO = "latenza"
+QUANTIZZAZIONI = ("int8",)
+# Core assegnati a ogni sintesi nel preset throughput
+CORE_PER_SINTESI_THROUGHPUT = 4
+# Variabili lette dalle librerie di calcolo al loro caricamento
+_VARIABILI_THREAD = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+ProfiloCPU = namedtuple(
+    "ProfiloCPU", ["preset", "thread_intra", "thread_inter", "parallelismo", "affinita", "quantizzazione"]
+)
+ProfiloCPU.__doc__ = (
+    "Profilo CPU del worker TTS: preset, thread intra-op e inter-op per sintesi, sintesi in parallelo, "
+    "core su cui fissare il processo (tupla o None) e quantizzazione dei livelli lineari (\"int8\" o None)."
+)
+
+
+def core_disponibili():
+    """Core su cui il processo può girare (rispetta affinità e cgroup cpuset, dove supportati)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def analizza_affinita(testo):
+    """Elenco di core da un testo come "0-3,8,10-11"; None per un testo vuoto."""
+    if not testo or not testo.strip():
+        return None
+    core = set()
+    for parte in testo.split(","):
+        parte = parte.strip()
+        try:
+            if "-" in parte:
+                primo, ultimo = (int(valore) for valore in parte.split("-", 1))
+                if primo > ultimo:
+                    raise ValueError
+                core.update(range(primo, ultimo + 1))
+            else:
+                core.add(int(parte))
+        except ValueError:
+            raise ValueError(f"Affinità CPU non valida: {testo!r} (esempio: \"0-3,8\").") from None
+    if min(core) < 0:
+        raise ValueError(f"Affinità CPU non valida: {testo!r} (core negativi).")
+    return tuple(sorted(core))
+
+
+def testo_affinita(affinita):
+    """Forma compatta di un elenco di core, ad esempio (0, 1, 2, 3, 8) -> "0-3,8"."""
+    if not affinita:
+        return "tutti"
+    intervalli, inizio, precedente = [], affinita[0], affinita[0]
+    for core in list(affinita[1:]) + [None]:
+        if core is not None and core == precedente + 1:
+            precedente = core
+            continue
+        intervalli.append(str(inizio) if inizio == precedente else f"{inizio}-{precedente}")
+        inizio = precedente = core
+    return ",".join(intervalli)
+
+
+def crea_profilo(preset=PRESET_PREDEFINITO, thread_intra=None, thread_inter=None, parallelismo=None, affinita=None,
+                 quantizzazione=None, n_core=None):
+    """
+    Profilo dal preset, con i valori indicati al posto di quelli del preset. `n_core` è il
+    numero di core da ripartire (predefinito: quelli dell'affinità, altrimenti quelli disponibili).
+    """
+    if preset not in PRESET:
+        raise ValueError(f"Preset CPU sconosciuto: {preset}. Disponibili: {', '.join(PRESET)}")
+    if quantizzazione is not None and quantizzazione not in QUANTIZZAZIONI:
+        raise ValueError(f"Quantizzazione non supportata: {quantizzazione}. Disponibili: {', '.join(QUANTIZZAZIONI)}")
+    affinita = tuple(affinita) if affinita else None
+    n_core = max(1, int(n_core or (len(affinita) if affinita else core_disponibili())))
+
+    if parallelismo is None:
+        parallelismo = 1 if preset == "latenza" else max(1, n_core // CORE_PER_SINTESI_THROUGHPUT)
+    parallelismo = max(1, int(parallelismo))
+    if thread_intra is None:
+        thread_intra = max(1, n_core // parallelismo)
+    if thread_inter is None:
+        thread_inter = 1
+    return ProfiloCPU(preset, max(1, int(thread_intra)), max(1, int(thread_inter)), parallelismo, affinita, quantizzazione)
+
+
+def _intero_da_ambiente(nome):
+    valore = os.environ.get(nome)
+    return int(valore) if valore not in (None, "") else None
+
+
+def profilo_da_ambiente(**sostituzioni):
+    """
+    Profilo configurato dalle variabili NOVA_CPU_* (preset, thread intra/inter, affinità,
+    quantizzazione) e NOVA_TTS_PARALLELISMO; `sostituzioni` prevalgono sull'ambiente.
+    """
+    quantizzazione = os.environ.get(ENV_QUANTIZZAZIONE, "").strip().lower()
+    valori = {
+        "preset": os.environ.get(ENV_PRESET, PRESET_PREDEFINITO).strip().lower(),
+        "thread_intra": _intero_da_ambiente(ENV_THREAD_INTRA),
+        "thread_inter": _intero_da_ambiente(ENV_THREAD_INTER),
+        "parallelismo": _intero_da_ambiente(ENV_PARALLELISMO),
+        "affinita": analizza_affinita(os.environ.get(ENV_AFFINITA)),
+        "quantizzazione": quantizzazione if quantizzazione not in ("", "0", "no", "nessuna") else None,
+    }
+    valori.update({chiave: valore for chiave, valore in sostituzioni.items() if valore is not None})
+    return crea_profilo(**valori)
+
+
+def descrizione_profilo(profilo):
+    """Profilo come dizionario di valori semplici (metriche, log JSON, interfaccia)."""
+    return {
+        "preset": profilo.preset,
+        "thread_intra": profilo.thread_intra,
+        "thread_inter": profilo.thread_inter,
+        "parallelismo": profilo.parallelismo,
+        "affinita": testo_affinita(profilo.affinita),
+        "quantizzazione": profilo.quantizzazione or "nessuna",
+    }
+
+
+def applica_al_processo(profilo):
+    """
+    Da chiamare nel processo worker prima di importare torch: imposta i thread delle librerie
+    di calcolo (OpenMP, MKL, OpenBLAS) e l'affinità ai core. Restituisce la descrizione del
+    profilo applicato.
+    """
+    for variabile in _VARIABILI_THREAD:
+        os.environ[variabile] = str(profilo.thread_intra)
+    applicato = descrizione_profilo(profilo)
+    if profilo.affinita:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, profilo.affinita)
+        else:
+            # Es. macOS: l'affinità non è supportata dal sistema
+            applicato["affinita"] = "non supportata"
+    return applicato
+
+
+def applica_a_torch(torch, profilo, modello=None):
+    """
+    Imposta i thread di torch e, se richiesto, quantizza in int8 (dinamicamente, pesi int8 e
+    attivazioni quantizzate al volo) i torch.nn.Linear di `modello` sul posto.
+    Restituisce i valori effettivi da aggiungere alla descrizione del profilo.
+    """
+    torch.set_num_threads(profilo.thread_intra)
+    try:
+        torch.set_num_interop_threads(profilo.thread_inter)
+    except RuntimeError:
+        # Il pool inter-op è già partito (può essere impostato una sola volta per processo)
+        pass
+    effettivi = {"thread_intra": torch.get_num_threads(), "thread_inter": torch.get_num_interop_threads()}
+    if profilo.quantizzazione == "int8" and modello is not None:
+        lineari = sum(1 for modulo in modello.modules() if type(modulo) is torch.nn.Linear)
+        torch.ao.quantization.quantize_dynamic(modello, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        effettivi["moduli_int8"] = lineari
+    return effettivi
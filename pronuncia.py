@@ -0,0 +1,114 @@
+import os
+import re
+import json
+import threading
+from collections import Counter
+
+# --- Motore di correzione della pronuncia ---
+# Il vocabolario viene compilato una volta sola in un'unica espressione regolare a trie
+# (parole intere, priorità alla corrispondenza più lunga) e applicato al testo in un solo
+# passaggio. Il file viene ricaricato solo quando cambia il suo mtime.
+
+
+def _modello_trie(nodo):
+    """Espressione regolare del sottoalbero `nodo` di un trie di caratteri."""
+    terminale = "" in nodo
+    parti = []
+    caratteri_finali = []
+    for carattere in sorted(chiave for chiave in nodo if chiave != ""):
+        resto = _modello_trie(nodo[carattere])
+        if resto:
+            parti.append(re.escape(carattere) + resto)
+        else:
+            caratteri_finali.append(re.escape(carattere))
+    if caratteri_finali:
+        parti.append(caratteri_finali[0] if len(caratteri_finali) == 1 else "[" + "".join(caratteri_finali) + "]")
+    if not parti:
+        return ""
+    corpo = parti[0] if len(parti) == 1 else "(?:" + "|".join(parti) + ")"
+    # Un nodo terminale rende opzionale la continuazione: il quantificatore greedy prova
+    # prima la parola più lunga e torna indietro a quella più corta solo se serve
+    return f"(?:{corpo})?" if terminale else corpo
+
+
+def compila_vocabolario(parole):
+    """Compila un insieme di parole in un'unica regex a parole intere (None se l'insieme è vuoto)."""
+    trie = {}
+    for parola in parole:
+        nodo = trie
+        for carattere in parola:
+            nodo = nodo.setdefault(carattere, {})
+        nodo[""] = True
+    if not trie:
+        return None
+    return re.compile(r"\b" + _modello_trie(trie) + r"\b")
+
+
+def carica_sostituzioni(percorso):
+    """
+    Legge vocabolario.json ({"parola": ["sostituzione", ...], ...}) e restituisce
+    il dizionario parola -> prima sostituzione.
+    """
+    with open(percorso, "r", encoding="utf-8") as f:
+        vocabolario_raw = json.load(f)
+    return {
+        parola: sostituzioni[0]
+        for parola, sostituzioni in vocabolario_raw.items()
+        if isinstance(sostituzioni, list) and len(sostituzioni) > 0
+    }
+
+
+class MotorePronuncia:
+    """Correzione della pronuncia con il vocabolario di `percorso`, ricompilato solo se il file cambia."""
+
+    def __init__(self, percorso):
+        self.percorso = percorso
+        self._lock = threading.Lock()
+        self._mtime_ns = None
+        self._sostituzioni = {}
+        self._regex = None
+
+    def _aggiorna(self):
+        mtime_ns = os.stat(self.percorso).st_mtime_ns
+        with self._lock:
+            if mtime_ns == self._mtime_ns:
+                return self._sostituzioni, self._regex
+        sostituzioni = carica_sostituzioni(self.percorso)
+        regex = compila_vocabolario(sostituzioni)
+        with self._lock:
+            self._sostituzioni, self._regex, self._mtime_ns = sostituzioni, regex, mtime_ns
+            return sostituzioni, regex
+
+    @property
+    def numero_voci(self):
+        return len(self._aggiorna()[0])
+
+    def correggi(self, testo):
+        """
+        Applica tutte le sostituzioni del vocabolario in un solo passaggio (parole intere,
+        maiuscole e minuscole distinte). Restituisce (testo_corretto, Counter delle voci applicate).
+        """
+        sostituzioni, regex = self._aggiorna()
+        applicate = Counter()
+        if regex is None:
+            return testo, applicate
+
+        def sostituisci(corrispondenza):
+            parola = corrispondenza.group(0)
+            applicate[parola] += 1
+            return sostituzioni[parola]
+
+        return regex.sub(sostituisci, testo), applicate
+
+
+# --- Motori condivisi dall'applicazione ---
+_motori_condivisi = {}
+_lock_motori_condivisi = threading.Lock()
+
+
+def ottieni_motore_pronuncia(percorso):
+    """Restituisce il motore di pronuncia condiviso dal processo per il vocabolario `percorso`."""
+    with _lock_motori_condivisi:
+        if percorso not in _motori_condivisi:
+            _motori_condivisi[percorso] = MotorePronuncia(percorso)
+        return _motori_condivisi[percorso]
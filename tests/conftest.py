@@ -0,0 +1,40 @@
+import os
+import sys
+import importlib
+
+import pytest
+
+# I moduli dell'applicazione sono nella radice del repository
+CARTELLA_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CARTELLA_REPO)
+CARTELLA_BENCHMARK = os.path.join(CARTELLA_REPO, "benchmark")
+
+from audio_wav import FormatoPCM, componi_wav, silenzio_pcm  # noqa: E402
+from motore_tts import WorkerTTS  # noqa: E402
+
+FORMATO_PROVA = FormatoPCM(canali=1, larghezza=2, frequenza=24000)
+
+
+def importa_benchmark(nome):
+    """Importa uno script di benchmark/ (che a sua volta importa i moduli dalla radice del repository)."""
+    if CARTELLA_BENCHMARK not in sys.path:
+        sys.path.insert(0, CARTELLA_BENCHMARK)
+    return importlib.import_module(nome)
+
+
+@pytest.fixture(scope="session")
+def worker():
+    """Worker TTS con il motore stub (nessun modello), condiviso dai test della sessione."""
+    worker = WorkerTTS(motore="stub", parallelismo=2)
+    yield worker
+    worker.chiudi()
+
+
+@pytest.fixture
+def cartella_speaker(tmp_path):
+    """Cartella con due voci di riferimento (il motore stub ne legge solo l'esistenza e il contenuto)."""
+    cartella = tmp_path / "speaker"
+    cartella.mkdir()
+    for numero, nome in enumerate(("Solista", "Coro"), start=1):
+        (cartella / f"{nome}.wav").write_bytes(componi_wav(FORMATO_PROVA, [silenzio_pcm(FORMATO_PROVA, 100 * numero)]))
+    return str(cartella)
@@ -0,0 +1,89 @@
+import struct
+
+import pytest
+
+pytest.importorskip("flask")
+from werkzeug.test import Client  # noqa: E402
+
+import api_server  # noqa: E402
+from cache_sintesi import CacheSintesi  # noqa: E402
+from filtri_audio import ErroreFiltri  # noqa: E402
+
+
+def _crea_client(worker, cartella_speaker, tmp_path, **opzioni):
+    app = api_server.crea_app(worker=worker, cartella_speaker=cartella_speaker,
+                              cache=CacheSintesi(cartella=str(tmp_path / "cache")), **opzioni)
+    # Equivale a app.test_client(): FlaskClient di Flask 2.3 legge werkzeug.__version__, assente da Werkzeug 3
+    return Client(app)
+
+
+@pytest.fixture
+def client(worker, cartella_speaker, tmp_path, monkeypatch):
+    # L'indice degli speaker viene creato nella cartella di lavoro
+    monkeypatch.chdir(tmp_path)
+    return _crea_client(worker, cartella_speaker, tmp_path)
+
+
+def test_sintesi_in_streaming_con_intestazione_wav(client):
+    risposta = client.post("/api/synthesize", json={"text": "Ciao. Come va?", "speaker": "Solista", "pause_ms": 100})
+    assert risposta.status_code == 200
+    assert risposta.mimetype == "audio/wav"
+    dati = risposta.get_data()
+    assert dati[:4] == b"RIFF" and dati[8:16] == b"WAVEfmt "
+    canali, frequenza = struct.unpack("<HI", dati[22:28])
+    assert (canali, frequenza) == (1, 24000)
+    assert dati[36:40] == b"data"
+    # 60 ms per carattere con il motore stub, più la pausa tra le due frasi
+    campioni = (len("Ciao.") + len("Come va?")) * 0.06 * 24000 + 0.1 * 24000
+    assert len(dati) - 44 == pytest.approx(2 * campioni, abs=4)
+
+
+def test_elenco_speaker(client):
+    risposta = client.get("/api/speakers")
+    assert [voce["name"] for voce in risposta.get_json()["speakers"]] == ["Coro", "Solista"]
+
+
+@pytest.mark.parametrize("dati", [
+    {"text": "", "speaker": "Solista"},
+    {"text": "...", "speaker": "Solista"},
+    {"text": 42, "speaker": "Solista"},
+    {"text": ["Ciao."], "speaker": "Solista"},
+    {"text": "Ciao.", "speaker": None},
+    {"text": "Ciao.", "speaker": "Solista", "pitch": 40},
+    {"text": "Ciao.", "speaker": "Solista", "speed": "veloce"},
+])
+def test_richieste_non_valide(client, dati):
+    risposta = client.post("/api/synthesize", json=dati)
+    assert risposta.status_code == 400
+    assert "errore" in risposta.get_json()
+
+
+def test_speaker_sconosciuto(client):
+    risposta = client.post("/api/synthesize", json={"text": "Ciao.", "speaker": "Nessuno"})
+    assert risposta.status_code == 404
+
+
+def test_errore_dei_filtri_sulla_prima_frase(client, monkeypatch):
+    def filtra_wav(*argomenti, **opzioni):
+        raise ErroreFiltri("ffmpeg non disponibile")
+
+    monkeypatch.setattr(api_server, "filtra_wav", filtra_wav)
+    risposta = client.post("/api/synthesize", json={"text": "Ciao.", "speaker": "Solista", "pitch": 2})
+    assert risposta.status_code == 500
+    assert "ffmpeg" in risposta.get_json()["errore"]
+    # Il posto occupato dalla richiesta fallita è stato rilasciato
+    assert client.post("/api/synthesize", json={"text": "Ciao.", "speaker": "Solista"}).status_code == 200
+
+
+def test_servizio_saturo(worker, cartella_speaker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = _crea_client(worker, cartella_speaker, tmp_path, max_concorrenza=1, attesa_coda_s=0)
+    richiesta = {"text": "Prima. Seconda.", "speaker": "Solista"}
+    # Una risposta in streaming non ancora letta occupa l'unico posto disponibile
+    in_corso = client.post("/api/synthesize", json=richiesta, buffered=False)
+    assert in_corso.status_code == 200
+    saturo = client.post("/api/synthesize", json=richiesta)
+    assert saturo.status_code == 429
+    assert saturo.headers["Retry-After"] == "5"
+    in_corso.close()
+    assert client.post("/api/synthesize", json=richiesta).status_code == 200
@@ -0,0 +1,71 @@
+import pytest
+
+from archivio_audio import ArchivioAudio, AudioNonDisponibile
+
+
+def _archivio(tmp_path, max_bytes=1000, **opzioni):
+    return ArchivioAudio(cartella=str(tmp_path / "archivio"), max_bytes=max_bytes, **opzioni)
+
+
+def test_lo_stesso_audio_occupa_un_solo_file(tmp_path):
+    archivio = _archivio(tmp_path)
+    primo = archivio.aggiungi(b"audio" * 10, sessione="a")
+    secondo = archivio.aggiungi(bytearray(b"audio" * 10), sessione="b")
+    assert primo == secondo
+    assert archivio.statistiche()["voci"] == 1
+    with archivio.mappa(primo) as mappa:
+        assert mappa[:] == b"audio" * 10
+
+
+def test_pulisci_elimina_prima_gli_audio_non_usati(tmp_path):
+    archivio = _archivio(tmp_path, max_bytes=250)
+    usato = archivio.aggiungi(b"u" * 100, sessione="a")
+    libero = archivio.aggiungi(b"l" * 100, sessione="a")
+    archivio.rilascia(libero, "a")
+    nuovo = archivio.aggiungi(b"n" * 100, sessione="b")
+    # L'audio usato è il meno recente, ma viene eliminato quello che nessuna sessione usa
+    assert archivio.contiene(usato) and archivio.contiene(nuovo)
+    assert not archivio.contiene(libero)
+    with pytest.raises(AudioNonDisponibile):
+        archivio.percorso(libero)
+
+
+def test_pulisci_elimina_gli_audio_in_uso_solo_come_ultima_risorsa(tmp_path):
+    archivio = _archivio(tmp_path, max_bytes=250)
+    primo = archivio.aggiungi(b"1" * 100, sessione="a")
+    secondo = archivio.aggiungi(b"2" * 100, sessione="a")
+    archivio.percorso(primo)  # il primo diventa il più recente
+    terzo = archivio.aggiungi(b"3" * 100, sessione="b")
+    assert archivio.contiene(primo) and archivio.contiene(terzo)
+    assert not archivio.contiene(secondo)
+    assert archivio.statistiche()["bytes"] == 200
+
+
+def test_l_audio_appena_aggiunto_non_viene_eliminato(tmp_path):
+    archivio = _archivio(tmp_path, max_bytes=50)
+    id_audio = archivio.aggiungi(b"x" * 100, sessione="a")
+    assert archivio.contiene(id_audio)
+    assert archivio.pulisci(proteggi=id_audio) == 0
+    assert archivio.pulisci() == 1
+
+
+def test_chiudere_la_sessione_rilascia_gli_audio(tmp_path):
+    archivio = _archivio(tmp_path, max_bytes=10_000)
+    archivio.aggiungi(b"a" * 100, sessione="a")
+    archivio.aggiungi(b"b" * 100, sessione="b")
+    archivio.chiudi_sessione("a")
+    assert archivio.statistiche()["in_uso"] == 1
+    assert archivio.statistiche()["voci"] == 2
+
+
+def test_le_sessioni_scadute_vengono_rilasciate(tmp_path):
+    archivio = _archivio(tmp_path, max_bytes=150, scadenza_sessione_s=0)
+    primo = archivio.aggiungi(b"a" * 100, sessione="a")
+    # La sessione "a" è scaduta: il suo audio non è più in uso e lascia spazio al nuovo
+    secondo = archivio.aggiungi(b"b" * 100, sessione="b")
+    assert not archivio.contiene(primo) and archivio.contiene(secondo)
+
+
+def test_acquisire_un_audio_assente_solleva_errore(tmp_path):
+    with pytest.raises(AudioNonDisponibile):
+        _archivio(tmp_path).acquisisci("inesistente", "a")
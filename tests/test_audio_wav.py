@@ -0,0 +1,35 @@
+from audio_wav import ScrittoreWav, analizza_wav, leggi_pcm
+
+from conftest import FORMATO_PROVA
+
+
+def test_scrittore_produce_un_wav_valido(tmp_path):
+    percorso = str(tmp_path / "uscita.wav")
+    with ScrittoreWav(percorso, FORMATO_PROVA) as scrittore:
+        scrittore.scrivi(b"\x01\x00" * 100)
+        scrittore.scrivi(b"\x02\x00" * 50)
+    with open(percorso, "rb") as f:
+        formato, pcm = leggi_pcm(f.read())
+    assert formato == FORMATO_PROVA
+    assert bytes(pcm) == b"\x01\x00" * 100 + b"\x02\x00" * 50
+
+
+def test_ripresa_scarta_i_dati_oltre_il_punto_valido(tmp_path):
+    percorso = str(tmp_path / "uscita.wav")
+    scrittore = ScrittoreWav(percorso, FORMATO_PROVA)
+    scrittore.scrivi(b"\x01\x00" * 100)
+    scrittore.sincronizza()
+    valido = scrittore.n_bytes
+    # Dati scritti dopo l'ultima sincronizzazione, poi il processo si interrompe
+    scrittore.scrivi(b"\xff\x7f" * 30)
+    scrittore.chiudi()
+
+    with ScrittoreWav(percorso, FORMATO_PROVA, riprendi_da=valido) as ripreso:
+        assert ripreso.n_bytes == valido
+        ripreso.scrivi(b"\x02\x00" * 20)
+
+    with open(percorso, "rb") as f:
+        dati = f.read()
+    formato, offset, n_bytes = analizza_wav(dati)
+    assert n_bytes == valido + 40
+    assert dati[offset:] == b"\x01\x00" * 100 + b"\x02\x00" * 20
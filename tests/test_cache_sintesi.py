@@ -0,0 +1,45 @@
+from audio_wav import leggi_pcm
+from cache_sintesi import CacheSintesi
+from pipeline_sintesi import sintetizza_voce
+
+
+def test_chiave_normalizza_spazi_ma_non_maiuscole():
+    chiave = CacheSintesi.chiave("Ciao   a\ttutti ", "voce", "it", "modello")
+    assert chiave == CacheSintesi.chiave("Ciao a tutti", "voce", "it", "modello")
+    assert chiave != CacheSintesi.chiave("ciao a tutti", "voce", "it", "modello")
+    assert chiave != CacheSintesi.chiave("Ciao a tutti", "voce", "en", "modello")
+
+
+def test_oltre_il_limite_elimina_le_voci_meno_recenti(tmp_path):
+    cache = CacheSintesi(cartella=str(tmp_path), max_bytes=250)
+    for chiave in ("a", "b"):
+        cache.scrivi(chiave, b"x" * 100)
+    assert cache.leggi("a") is not None  # "a" diventa la più recente
+    cache.scrivi("c", b"x" * 100)
+    assert cache.leggi("b") is None
+    assert cache.leggi("a") is not None and cache.leggi("c") is not None
+
+
+def test_l_indice_sopravvive_al_riavvio(tmp_path):
+    CacheSintesi(cartella=str(tmp_path)).scrivi("a", b"dati")
+    assert CacheSintesi(cartella=str(tmp_path)).leggi("a") == b"dati"
+
+
+def test_la_cache_evita_di_risintetizzare_le_stesse_frasi(worker, cartella_speaker, tmp_path):
+    cache = CacheSintesi(cartella=str(tmp_path / "cache"))
+    testo = "Una frase. Un'altra frase."
+    primo = sintetizza_voce(testo, "Solista", cartella_speaker, worker, cache=cache)
+    assert (cache.hit, cache.miss) == (0, 2)
+    secondo = sintetizza_voce(testo + " Una nuova.", "Solista", cartella_speaker, worker, cache=cache)
+    assert (cache.hit, cache.miss) == (2, 3)
+    # Le frasi riprese dalla cache sono identiche a quelle sintetizzate la prima volta
+    _, pcm_primo = leggi_pcm(primo)
+    _, pcm_secondo = leggi_pcm(secondo)
+    assert bytes(pcm_secondo[:len(pcm_primo)]) == bytes(pcm_primo)
+
+
+def test_la_cache_distingue_le_voci(worker, cartella_speaker, tmp_path):
+    cache = CacheSintesi(cartella=str(tmp_path / "cache"))
+    sintetizza_voce("Ciao.", "Solista", cartella_speaker, worker, cache=cache)
+    sintetizza_voce("Ciao.", "Coro", cartella_speaker, worker, cache=cache)
+    assert (cache.hit, cache.miss) == (0, 2)
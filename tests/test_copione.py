@@ -0,0 +1,55 @@
+import pytest
+
+from audio_wav import durata_wav
+from copione import ErroreCopione, analizza_copione, renderizza_copione
+
+SPEAKER = ["Solista", "Coro"]
+
+
+def test_alias_preset_pause_e_righe_di_continuazione():
+    copione = analizza_copione(
+        "# Salmo\n"
+        "@voce Lettore = Solista pitch=-1 velocità=0,95 loudness=-16\n"
+        "Lettore: Il Signore è il mio pastore:\n"
+        "non manco di nulla.\n"
+        "@pausa 1500\n"
+        "Coro: Rit.\n",
+        SPEAKER,
+    )
+    assert [(b.voce, b.testo, b.pausa_prima_ms, b.riga) for b in copione.battute] == [
+        ("Lettore", "Il Signore è il mio pastore:\nnon manco di nulla.", None, 3),
+        ("Coro", "Rit.", 1500, 6),
+    ]
+    lettore = copione.voci["Lettore"]
+    assert (lettore.speaker, lettore.pitch, lettore.velocita, lettore.loudness) == ("Solista", -1, 0.95, -16.0)
+    assert copione.voci["Coro"].speaker == "Coro"
+
+
+@pytest.mark.parametrize("testo, messaggio", [
+    ("@voce Lettore = Nessuno\nLettore: Ciao.", "Riga 1: voce 'Nessuno' non trovata"),
+    ("Solista: Ciao.\n@voce Lettore = Solista tono=2", "Riga 2: opzione di voce sconosciuta 'tono'"),
+    ("@voce Lettore = Solista velocita=0", "Riga 1: la velocità deve essere maggiore di zero"),
+    ("@volume 3", "Riga 1: direttiva non valida"),
+    ("Narratore: C'era una volta", "Riga 1: voce 'Narratore' sconosciuta"),
+    ("Testo senza voce.", "Riga 1: testo senza voce"),
+    ("# solo commenti\n\n", "non contiene battute"),
+])
+def test_errori_con_il_numero_di_riga(testo, messaggio):
+    with pytest.raises(ErroreCopione, match=messaggio):
+        analizza_copione(testo, SPEAKER)
+
+
+def test_render_monta_le_battute_in_ordine_e_sintetizza_una_volta_i_ritornelli(worker, cartella_speaker, tmp_path):
+    copione = analizza_copione(
+        "Coro: Rit.\nSolista: Prima strofa.\nCoro: Rit.\n@pausa 1000\nSolista: Seconda.\nCoro: Rit.\n",
+        SPEAKER,
+    )
+    uscita = str(tmp_path / "copione.wav")
+    risultato = renderizza_copione(copione, uscita, cartella_speaker, worker, pausa_ms=100, intervallo_ms=500,
+                                   cartella_lavoro=str(tmp_path))
+    assert (risultato["battute"], risultato["frasi"], risultato["frasi_ripetute"]) == (5, 3, 2)
+    parlato = (3 * len("Rit.") + len("Prima strofa.") + len("Seconda.")) * 0.06
+    pause = 3 * 0.5 + 1.0
+    with open(uscita, "rb") as f:
+        assert durata_wav(f.read()) == pytest.approx(parlato + pause, abs=0.005)
+    assert risultato["durata_s"] == pytest.approx(parlato + pause, abs=0.005)
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from audio_wav import durata_wav
+from documento_lungo import leggi_paragrafi, percorsi_render, renderizza_documento
+
+
+class Interruzione(Exception):
+    pass
+
+
+def _scrivi_documento(tmp_path):
+    percorso = tmp_path / "documento.txt"
+    percorso.write_text("Primo paragrafo.\n\n***\n\nSecondo paragrafo.\nStessa parte.\n\nTerzo.\n", encoding="utf-8")
+    return str(percorso)
+
+
+def test_leggi_paragrafi_divide_alle_righe_vuote_e_oltre_il_limite(tmp_path):
+    percorso = tmp_path / "documento.txt"
+    percorso.write_text("uno\ndue\n\ntre\nquattro\ncinque\n", encoding="utf-8")
+    assert list(leggi_paragrafi(str(percorso))) == [("uno\ndue", True), ("tre\nquattro\ncinque", True)]
+    assert list(leggi_paragrafi(str(percorso), max_caratteri=8)) == [
+        ("uno\ndue", True), ("tre\nquattro", True), ("cinque", False),
+    ]
+
+
+def test_render_interrotto_riprende_dal_primo_paragrafo_mancante(worker, cartella_speaker, tmp_path):
+    documento = _scrivi_documento(tmp_path)
+    uscita = str(tmp_path / "uscita.wav")
+    completati = []
+
+    def interrompi_dopo_il_primo(numero, totale):
+        completati.append(numero)
+        if numero == 1:
+            raise Interruzione
+
+    with pytest.raises(Interruzione):
+        renderizza_documento(documento, uscita, "Solista", cartella_speaker, worker,
+                             al_paragrafo=interrompi_dopo_il_primo, cartella_lavoro=str(tmp_path))
+    _, percorso_ripresa = percorsi_render(uscita)
+    assert os.path.exists(percorso_ripresa) and not os.path.exists(uscita)
+
+    risultato = renderizza_documento(documento, uscita, "Solista", cartella_speaker, worker,
+                                     al_paragrafo=interrompi_dopo_il_primo, cartella_lavoro=str(tmp_path))
+    # Il secondo render parte dal paragrafo 2 ("***" non produce audio)
+    assert completati == [1, 3, 4]
+    assert risultato["paragrafi_ripresi"] == 1
+    assert not os.path.exists(percorso_ripresa)
+
+    intero = str(tmp_path / "intero.wav")
+    renderizza_documento(documento, intero, "Solista", cartella_speaker, worker, cartella_lavoro=str(tmp_path))
+    with open(uscita, "rb") as ripreso, open(intero, "rb") as senza_interruzioni:
+        assert ripreso.read() == senza_interruzioni.read()
+    with open(uscita, "rb") as f:
+        assert durata_wav(f.read()) == pytest.approx(risultato["durata_s"])
+
+
+def test_con_parametri_diversi_il_render_non_viene_ripreso(worker, cartella_speaker, tmp_path):
+    documento = _scrivi_documento(tmp_path)
+    uscita = str(tmp_path / "uscita.wav")
+
+    def interrompi(numero, totale):
+        raise Interruzione
+
+    with pytest.raises(Interruzione):
+        renderizza_documento(documento, uscita, "Solista", cartella_speaker, worker, al_paragrafo=interrompi,
+                             cartella_lavoro=str(tmp_path))
+    risultato = renderizza_documento(documento, uscita, "Coro", cartella_speaker, worker,
+                                     cartella_lavoro=str(tmp_path))
+    assert risultato["paragrafi_ripresi"] == 0
+
+
+def test_taglio_dei_silenzi_e_loudness_applicati_al_render(worker, cartella_speaker, tmp_path):
+    analisi_audio = pytest.importorskip("analisi_audio")
+    documento = _scrivi_documento(tmp_path)
+    uscita = str(tmp_path / "uscita.wav")
+    risultato = renderizza_documento(documento, uscita, "Solista", cartella_speaker, worker, taglia_silenzi=True,
+                                     loudness_lufs=-23.0, cartella_lavoro=str(tmp_path))
+    with open(uscita, "rb") as f:
+        dati = f.read()
+    assert durata_wav(dati) == pytest.approx(risultato["durata_s"])
+    assert analisi_audio.analizza_audio(dati)["loudness_lufs"] == pytest.approx(-23.0, abs=0.5)
+    assert sorted(os.listdir(tmp_path)) == ["documento.txt", "speaker", "uscita.wav"]
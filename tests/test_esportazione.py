@@ -0,0 +1,98 @@
+import os
+import math
+import array
+import shutil
+import subprocess
+
+import pytest
+
+import esportazione
+from audio_wav import componi_wav, durata_wav, leggi_pcm
+from esportazione import ErroreEsportazione, esporta_audio
+from filtri_audio import ErroreFiltri, filtra_file_in_formati
+
+from conftest import FORMATO_PROVA
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg non disponibile")
+
+
+@pytest.fixture
+def voce_wav(tmp_path):
+    """Un secondo di tono a 440 Hz nel formato di prova."""
+    passo = 2 * math.pi * 440 / FORMATO_PROVA.frequenza
+    campioni = array.array("h", (int(8000 * math.sin(passo * i)) for i in range(FORMATO_PROVA.frequenza)))
+    percorso = tmp_path / "voce.wav"
+    percorso.write_bytes(componi_wav(FORMATO_PROVA, [campioni.tobytes()]))
+    return str(percorso)
+
+
+def _decodifica(percorso):
+    """Decodifica un file audio qualsiasi in WAV PCM 16 bit con ffmpeg."""
+    comando = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", percorso, "-c:a", "pcm_s16le", "-f", "wav", "pipe:1"]
+    return subprocess.run(comando, check=True, capture_output=True).stdout
+
+
+def test_una_passata_per_tutti_i_formati(voce_wav, tmp_path):
+    cartella = tmp_path / "export"
+    cartella.mkdir()
+    percorsi = esporta_audio(voce_wav, str(cartella), "voce", ["wav", "flac", "mp3", "opus", "wav"], velocita_fattore=2.0)
+    assert percorsi == {
+        "wav": str(cartella / "voce.wav"),
+        "flac": str(cartella / "voce.flac"),
+        "mp3": str(cartella / "voce.mp3"),
+        "opus": str(cartella / "voce.ogg"),
+    }
+    # Nessun file temporaneo: tutte le uscite sono state rinominate
+    assert sorted(os.listdir(cartella)) == ["voce.flac", "voce.mp3", "voce.ogg", "voce.wav"]
+
+    # Tutti i rami dell'asplit ricevono lo stesso audio filtrato (velocità doppia: mezzo secondo)
+    with open(percorsi["wav"], "rb") as f:
+        wav = f.read()
+    assert durata_wav(wav) == pytest.approx(0.5, abs=0.01)
+    assert leggi_pcm(_decodifica(percorsi["flac"]))[1] == leggi_pcm(wav)[1]
+    for formato in ("mp3", "opus"):
+        assert durata_wav(_decodifica(percorsi[formato])) == pytest.approx(0.5, abs=0.08)
+
+
+def test_frequenza_e_bitrate_delle_uscite(voce_wav, tmp_path):
+    percorsi = esporta_audio(voce_wav, str(tmp_path), "voce", ["wav", "mp3"], frequenza=16000, bitrate_kbps=64)
+    with open(percorsi["wav"], "rb") as f:
+        assert leggi_pcm(f.read())[0].frequenza == 16000
+    assert leggi_pcm(_decodifica(percorsi["mp3"]))[0].frequenza == 16000
+
+
+def test_codifica_fallita_non_lascia_file(voce_wav, tmp_path, monkeypatch):
+    monkeypatch.setitem(esportazione.FORMATI_ESPORTAZIONE, "mp3", {
+        **esportazione.FORMATI_ESPORTAZIONE["mp3"], "opzioni": ["-c:a", "encoder_inesistente"],
+    })
+    cartella = tmp_path / "export"
+    cartella.mkdir()
+    with pytest.raises(ErroreEsportazione, match="Codifica fallita"):
+        esporta_audio(voce_wav, str(cartella), "voce", ["wav", "mp3"])
+    assert os.listdir(cartella) == []
+
+
+def test_file_parziali_rimossi_se_la_codifica_si_interrompe(voce_wav, tmp_path, monkeypatch):
+    scritti = []
+
+    def interrotta(input_path, uscite, *args, **kwargs):
+        # Le uscite vengono scritte, poi ffmpeg fallisce (o il lavoro viene annullato)
+        scritti.extend(filtra_file_in_formati(input_path, uscite, *args, **kwargs))
+        raise ErroreFiltri("ffmpeg terminato")
+
+    monkeypatch.setattr(esportazione, "filtra_file_in_formati", interrotta)
+    cartella = tmp_path / "export"
+    cartella.mkdir()
+    with pytest.raises(ErroreEsportazione):
+        esporta_audio(voce_wav, str(cartella), "voce", ["wav", "flac"])
+    assert [os.path.basename(percorso) for percorso in scritti] == ["voce.parziale.wav", "voce.parziale.flac"]
+    assert os.listdir(cartella) == []
+
+
+def test_formato_o_frequenza_non_validi(voce_wav, tmp_path):
+    with pytest.raises(ErroreEsportazione, match="sconosciuto"):
+        esporta_audio(voce_wav, str(tmp_path), "voce", ["aac"])
+    with pytest.raises(ErroreEsportazione, match="Opus non supporta"):
+        esporta_audio(voce_wav, str(tmp_path), "voce", ["opus"], frequenza=44100)
+    with pytest.raises(ErroreEsportazione, match="Nessun formato"):
+        esporta_audio(voce_wav, str(tmp_path), "voce", [])
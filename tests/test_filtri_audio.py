@@ -0,0 +1,50 @@
+import shutil
+
+import pytest
+
+from audio_wav import leggi_pcm
+from filtri_audio import applica_guadagno, filtra_wav
+
+from conftest import FORMATO_PROVA, importa_benchmark
+
+richiede_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg non disponibile")
+
+
+@pytest.fixture(scope="module")
+def bench_filtri():
+    pytest.importorskip("pydub")
+    return importa_benchmark("bench_filtri")
+
+
+@richiede_ffmpeg
+@pytest.mark.parametrize("pitch, velocita, volume", [
+    (0, 1.0, 0),
+    (0, 1.0, 3),
+    (0, 1.0, -6),
+    (0, 1.0, -7.5),
+    (2, 1.0, 0),
+    (-3, 1.0, 0),
+    (0, 1.25, 0),
+    (0, 0.5, 0),
+    (0, 2.5, 0),
+    (2, 1.25, 3),
+    (-5, 0.8, -4),
+])
+def test_stesso_audio_della_catena_storica(bench_filtri, tmp_path, pitch, velocita, volume):
+    dati = bench_filtri.audio_sintetico(1 / 60)
+    storico = bench_filtri.filtra_percorso_storico(dati, str(tmp_path), pitch, velocita, volume)
+    in_memoria = filtra_wav(dati, pitch, velocita, volume)
+    # Le intestazioni possono differire (ffmpeg aggiunge un blocco LIST), i campioni no
+    formato_storico, pcm_storico = leggi_pcm(storico)
+    formato_memoria, pcm_memoria = leggi_pcm(in_memoria)
+    assert formato_memoria == formato_storico
+    assert bytes(pcm_memoria) == bytes(pcm_storico)
+
+
+def test_guadagno_satura_e_arrotonda_per_difetto():
+    pcm = (b"\x00\x40" + b"\x00\xc0" + b"\x01\x00" + b"\xff\xff")  # 16384, -16384, 1, -1
+    amplificato = applica_guadagno(FORMATO_PROVA, pcm, 20)
+    assert memoryview(bytes(amplificato)).cast("h").tolist() == [32767, -32768, 10, -10]
+    attenuato = applica_guadagno(FORMATO_PROVA, pcm, -6)
+    assert memoryview(bytes(attenuato)).cast("h").tolist() == [8211, -8212, 0, -1]
+    assert bytes(applica_guadagno(FORMATO_PROVA, pcm, 0)) == pcm
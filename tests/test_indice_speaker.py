@@ -0,0 +1,117 @@
+import json
+import os
+
+import pytest
+
+from audio_wav import componi_wav, silenzio_pcm
+from indice_speaker import FILE_INDICE, IndiceSpeaker
+from motore_tts import ErroreSintesi
+from pipeline_sintesi import sintetizza_voce
+
+from conftest import FORMATO_PROVA
+
+
+class WorkerContatore:
+    """Inoltra al worker stub e conta i condizionamenti calcolati."""
+
+    def __init__(self, worker):
+        self._worker = worker
+        self.id_modello = worker.id_modello
+        self.parallelismo = worker.parallelismo
+        self.condizionamenti = 0
+
+    def calcola_condizionamento(self, speaker_wav, out_path):
+        self.condizionamenti += 1
+        return self._worker.calcola_condizionamento(speaker_wav, out_path)
+
+    def __getattr__(self, nome):
+        return getattr(self._worker, nome)
+
+
+@pytest.fixture
+def indice(cartella_speaker, tmp_path):
+    indice = IndiceSpeaker(cartella_speaker, cartella_indice=str(tmp_path / "indice"))
+    indice.aggiorna()
+    return indice
+
+
+def _sposta_mtime(percorso, secondi=10):
+    info = os.stat(percorso)
+    os.utime(percorso, ns=(info.st_atime_ns, info.st_mtime_ns + secondi * 1_000_000_000))
+
+
+def test_indicizza_le_voci_con_i_metadati_del_wav(indice):
+    assert indice.elenco() == ["Coro", "Solista"]
+    info = indice.info("Coro")
+    assert (info["durata_s"], info["frequenza"], info["canali"]) == (0.2, 24000, 1)
+    assert indice.info("Nessuno") is None
+    assert indice.aggiorna() == 0
+
+
+def test_l_indice_salvato_viene_ricaricato(indice, cartella_speaker, tmp_path):
+    with open(tmp_path / "indice" / FILE_INDICE, encoding="utf-8") as f:
+        salvato = json.load(f)
+    assert set(salvato["voci"]) == {"Coro", "Solista"}
+    riaperto = IndiceSpeaker(cartella_speaker, cartella_indice=str(tmp_path / "indice"))
+    assert riaperto.elenco() == ["Coro", "Solista"]
+    assert riaperto.aggiorna() == 0
+
+
+def test_voci_modificate_aggiunte_o_cancellate(indice, cartella_speaker):
+    solista = os.path.join(cartella_speaker, "Solista.wav")
+    _sposta_mtime(solista)
+    with open(os.path.join(cartella_speaker, "Nuova.wav"), "wb") as f:
+        f.write(componi_wav(FORMATO_PROVA, [silenzio_pcm(FORMATO_PROVA, 50)]))
+    os.remove(os.path.join(cartella_speaker, "Coro.wav"))
+    assert indice.aggiorna() == 2
+    assert indice.elenco() == ["Nuova", "Solista"]
+
+
+def test_il_condizionamento_viene_calcolato_una_volta_e_salvato(indice, worker, cartella_speaker, tmp_path):
+    contatore = WorkerContatore(worker)
+    percorso = indice.condizionamento("Solista", contatore)
+    assert os.path.exists(percorso)
+    assert indice.condizionamento("Solista", contatore) == percorso
+    assert contatore.condizionamenti == 1
+
+    # Anche un nuovo indice sulla stessa cartella trova il condizionamento già calcolato
+    riaperto = IndiceSpeaker(cartella_speaker, cartella_indice=str(tmp_path / "indice"))
+    assert riaperto.condizionamento("Solista", contatore) == percorso
+    assert contatore.condizionamenti == 1
+
+    # Un file di condizionamento cancellato viene ricalcolato
+    os.remove(percorso)
+    assert riaperto.condizionamento("Solista", contatore) == percorso
+    assert contatore.condizionamenti == 2
+
+
+def test_un_touch_conserva_il_condizionamento(indice, worker, cartella_speaker):
+    contatore = WorkerContatore(worker)
+    percorso = indice.condizionamento("Solista", contatore)
+    _sposta_mtime(os.path.join(cartella_speaker, "Solista.wav"))
+    assert indice.aggiorna() == 1
+    assert indice.condizionamento("Solista", contatore) == percorso
+    assert contatore.condizionamenti == 1
+
+
+def test_un_contenuto_diverso_invalida_il_condizionamento(indice, worker, cartella_speaker):
+    contatore = WorkerContatore(worker)
+    vecchio = indice.condizionamento("Solista", contatore)
+    impronta = indice.info("Solista")["impronta"]
+    with open(os.path.join(cartella_speaker, "Solista.wav"), "wb") as f:
+        f.write(componi_wav(FORMATO_PROVA, [b"\x01\x00" * 4800]))
+    assert indice.aggiorna() == 1
+    assert indice.info("Solista")["impronta"] != impronta
+    assert indice.info("Solista")["condizionamenti"] == {}
+    nuovo = indice.condizionamento("Solista", contatore)
+    assert nuovo != vecchio
+    assert contatore.condizionamenti == 2
+
+
+def test_la_sintesi_usa_il_condizionamento_dell_indice(indice, worker, cartella_speaker):
+    contatore = WorkerContatore(worker)
+    sintetizza_voce("Ciao. Come va?", "Coro", cartella_speaker, contatore, indice=indice)
+    sintetizza_voce("Di nuovo.", "Coro", cartella_speaker, contatore, indice=indice)
+    assert contatore.condizionamenti == 1
+    with pytest.raises(ErroreSintesi, match="non presente"):
+        indice.condizionamento("Nessuno", contatore)
@@ -0,0 +1,126 @@
+import os
+import threading
+
+import pytest
+
+from lavori import SchedulerLavori, ANNULLATO, COMPLETATO, ERRORE, IN_CODA
+
+TIMEOUT_S = 5
+
+
+@pytest.fixture
+def crea_scheduler(tmp_path):
+    creati = []
+
+    def crea(max_lavori=1, limiti_per_tipo=None):
+        scheduler = SchedulerLavori(max_lavori, limiti_per_tipo, cartella_lavori=str(tmp_path / "lavori"))
+        creati.append(scheduler)
+        return scheduler
+
+    yield crea
+    for scheduler in creati:
+        scheduler.chiudi()
+
+
+def _bloccato(lavoro, avviato, via, eseguiti=None, nome=None):
+    """Lavoro stub: segnala l'avvio e resta in esecuzione finché `via` non viene impostato."""
+    if eseguiti is not None:
+        eseguiti.append(nome)
+    avviato.set()
+    via.wait(TIMEOUT_S)
+    return nome
+
+
+def _registra(lavoro, eseguiti, nome):
+    eseguiti.append(nome)
+    return nome
+
+
+def test_ordine_fifo(crea_scheduler):
+    scheduler = crea_scheduler(max_lavori=1)
+    avviato, via, eseguiti = threading.Event(), threading.Event(), []
+    primo = scheduler.invia("sintesi", _bloccato, avviato, via, eseguiti, "primo")
+    assert avviato.wait(TIMEOUT_S)
+    successivi = [scheduler.invia("sintesi", _registra, eseguiti, nome) for nome in ("a", "b", "c")]
+    assert [lavoro.posizione for lavoro in successivi] == [1, 2, 3]
+    via.set()
+    assert all(lavoro.attendi(TIMEOUT_S) for lavoro in [primo] + successivi)
+    assert eseguiti == ["primo", "a", "b", "c"]
+    assert [lavoro.risultato for lavoro in successivi] == ["a", "b", "c"]
+
+
+def test_limite_per_tipo_lascia_passare_gli_altri_tipi(crea_scheduler):
+    scheduler = crea_scheduler(max_lavori=3, limiti_per_tipo={"sintesi": 1})
+    avviato, via, eseguiti = threading.Event(), threading.Event(), []
+    sintesi = scheduler.invia("sintesi", _bloccato, avviato, via, eseguiti, "sintesi 1")
+    assert avviato.wait(TIMEOUT_S)
+    in_attesa = scheduler.invia("sintesi", _registra, eseguiti, "sintesi 2")
+    filtri = scheduler.invia("filtri", _registra, eseguiti, "filtri")
+    assert filtri.attendi(TIMEOUT_S) and filtri.stato == COMPLETATO
+    # La seconda sintesi resta in coda, al primo posto, finché la prima non finisce
+    assert in_attesa.stato == IN_CODA and in_attesa.posizione == 1
+    via.set()
+    assert in_attesa.attendi(TIMEOUT_S) and sintesi.attendi(TIMEOUT_S)
+    assert eseguiti == ["sintesi 1", "filtri", "sintesi 2"]
+
+
+def test_annullamento_in_coda_e_in_esecuzione(crea_scheduler):
+    scheduler = crea_scheduler(max_lavori=1)
+    avviato, passi = threading.Event(), []
+
+    def lungo(lavoro):
+        avviato.set()
+        while True:
+            lavoro.verifica_annullamento()
+            passi.append(1)
+            threading.Event().wait(0.01)
+
+    in_esecuzione = scheduler.invia("filtri", lungo)
+    in_coda = scheduler.invia("filtri", _registra, passi, "mai")
+    assert avviato.wait(TIMEOUT_S)
+    in_coda.annulla()
+    assert in_coda.finito and in_coda.stato == ANNULLATO and in_coda.posizione == 0
+    in_esecuzione.annulla()
+    assert in_esecuzione.attendi(TIMEOUT_S) and in_esecuzione.stato == ANNULLATO
+    assert "mai" not in passi
+
+
+def test_annulla_sessione(crea_scheduler):
+    scheduler = crea_scheduler(max_lavori=1)
+    avviato, via = threading.Event(), threading.Event()
+    bloccante = scheduler.invia("sintesi", _bloccato, avviato, via, sessione="altra")
+    assert avviato.wait(TIMEOUT_S)
+    mio = scheduler.invia("sintesi", _registra, [], "mio", sessione="mia")
+    altrui = scheduler.invia("sintesi", _registra, [], "altrui", sessione="altra")
+    scheduler.annulla_sessione("mia")
+    via.set()
+    assert mio.stato == ANNULLATO
+    assert altrui.attendi(TIMEOUT_S) and altrui.stato == COMPLETATO
+    assert bloccante.attendi(TIMEOUT_S)
+
+
+def test_cartella_di_lavoro_eliminata_al_termine(crea_scheduler):
+    scheduler = crea_scheduler(max_lavori=2)
+
+    def scrive(lavoro, errore=False):
+        percorso = os.path.join(lavoro.cartella, "temporaneo.wav")
+        with open(percorso, "wb") as f:
+            f.write(b"RIFF")
+        if errore:
+            raise ValueError("render fallito")
+        return lavoro.cartella
+
+    riuscito = scheduler.invia("filtri", scrive)
+    fallito = scheduler.invia("filtri", scrive, errore=True)
+    assert riuscito.attendi(TIMEOUT_S) and fallito.attendi(TIMEOUT_S)
+    assert riuscito.stato == COMPLETATO and not os.path.exists(riuscito.risultato)
+    assert fallito.stato == ERRORE and isinstance(fallito.errore, ValueError)
+    assert not os.path.exists(fallito.cartella)
+    assert os.listdir(scheduler.cartella_lavori) == []
+
+
+def test_scheduler_chiuso_rifiuta_nuovi_lavori(crea_scheduler):
+    scheduler = crea_scheduler()
+    scheduler.chiudi()
+    with pytest.raises(RuntimeError):
+        scheduler.invia("sintesi", _registra, [], "tardi")
@@ -0,0 +1,28 @@
+import pytest
+
+from metriche import RegistroMetriche, memoria_residente_mb
+
+
+def test_contatori_prometheus_terminano_in_total():
+    registro = RegistroMetriche()
+    with registro.traccia("sintesi") as traccia:
+        traccia.audio_s = 1.0
+    testo = registro.testo_prometheus()
+    contatori = [riga.split()[2] for riga in testo.splitlines() if riga.startswith("# TYPE") and riga.endswith(" counter")]
+    assert "nova_lavori_total" in contatori
+    assert all(nome.endswith("_total") for nome in contatori)
+    assert 'nova_lavori_total{esito="ok",tipo="sintesi"} 1' in testo
+
+
+def test_traccia_misura_la_memoria_del_lavoro():
+    registro = RegistroMetriche()
+    with registro.traccia("filtri"):
+        blocco = bytearray(64 * 1024 * 1024)
+        blocco[::4096] = b"\x01" * len(blocco[::4096])  # pagine effettivamente residenti
+    voce = registro.ultime_tracce(1)[0]
+    del blocco
+    assert voce["rss_picco_incremento_mb"] >= 0
+    assert voce["rss_picco_processo_mb"] > 0
+    if memoria_residente_mb() is None:
+        pytest.skip("/proc/self/statm non disponibile")
+    assert voce["rss_delta_mb"] >= 60
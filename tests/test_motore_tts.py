@@ -0,0 +1,111 @@
+import os
+import time
+import concurrent.futures
+
+import pytest
+
+from audio_wav import durata_wav
+from motore_tts import GruppoWorkerTTS, MotoreStub, WorkerTTS, ErroreSintesi, crea_worker
+
+
+class MotoreNonThreadSafe(MotoreStub):
+    """Motore stub che, come XTTS, non dichiara di poter sintetizzare in parallelo."""
+    thread_safe = False
+
+
+# Caricato dal processo worker come motore esterno "modulo:Classe"
+MOTORE_NON_THREAD_SAFE = f"{__name__}:MotoreNonThreadSafe"
+
+
+def _durata_file(percorso):
+    with open(percorso, "rb") as f:
+        return durata_wav(f.read())
+
+
+def test_sintesi_scrive_un_wav_proporzionale_al_testo(worker, cartella_speaker, tmp_path):
+    speaker_wav = os.path.join(cartella_speaker, "Solista.wav")
+    corto, lungo = str(tmp_path / "corto.wav"), str(tmp_path / "lungo.wav")
+    worker.sintetizza("Ciao.", speaker_wav, corto)
+    worker.sintetizza("Ciao a tutti, benvenuti.", speaker_wav, lungo)
+    # Il motore stub produce 60 ms di audio per carattere
+    assert _durata_file(corto) == pytest.approx(len("Ciao.") * 0.06, abs=0.001)
+    assert _durata_file(lungo) > _durata_file(corto)
+
+
+def test_lavori_paralleli_ricevono_ciascuno_il_proprio_risultato(worker, cartella_speaker, tmp_path):
+    speaker_wav = os.path.join(cartella_speaker, "Solista.wav")
+    testi = [f"Frase numero {'x' * numero}." for numero in range(8)]
+
+    def sintetizza(numero):
+        percorso = str(tmp_path / f"{numero}.wav")
+        worker.sintetizza(testi[numero], speaker_wav, percorso)
+        return _durata_file(percorso)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        durate = list(pool.map(sintetizza, range(len(testi))))
+    assert durate == [pytest.approx(len(testo) * 0.06, abs=0.001) for testo in testi]
+
+
+def test_errore_del_motore_diventa_errore_sintesi(worker, tmp_path):
+    with pytest.raises(ErroreSintesi, match="non trovata"):
+        worker.sintetizza("Ciao.", str(tmp_path / "inesistente.wav"), str(tmp_path / "uscita.wav"))
+    assert not worker._in_corso
+
+
+def test_timeout_non_lascia_lavori_in_sospeso(cartella_speaker, tmp_path):
+    speaker_wav = os.path.join(cartella_speaker, "Solista.wav")
+    lento = WorkerTTS(motore="stub", opzioni_motore={"ritardo_s": 0.5})
+    try:
+        with pytest.raises(concurrent.futures.TimeoutError):
+            lento.sintetizza("Ciao.", speaker_wav, str(tmp_path / "lento.wav"), timeout=0.05)
+        assert not lento._in_corso
+        # La risposta in ritardo viene scartata e il worker resta utilizzabile
+        lento.sintetizza("Di nuovo.", speaker_wav, str(tmp_path / "dopo.wav"))
+        assert _durata_file(str(tmp_path / "dopo.wav")) == pytest.approx(len("Di nuovo.") * 0.06, abs=0.001)
+        assert not lento._in_corso
+    finally:
+        lento.chiudi()
+
+
+def test_worker_caduto_viene_riavviato(cartella_speaker, tmp_path):
+    speaker_wav = os.path.join(cartella_speaker, "Solista.wav")
+    fragile = WorkerTTS(motore="stub")
+    try:
+        fragile.sintetizza("Prima.", speaker_wav, str(tmp_path / "prima.wav"))
+        processo = fragile._processo
+        processo.kill()
+        processo.join()
+        fragile.sintetizza("Dopo.", speaker_wav, str(tmp_path / "dopo.wav"))
+        assert fragile._processo is not processo
+        assert os.path.getsize(tmp_path / "dopo.wav") > 44
+    finally:
+        fragile.chiudi()
+
+
+def _durata_sintesi_parallele(worker, speaker_wav, cartella, n):
+    worker.avvia()
+    inizio = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n) as pool:
+        list(pool.map(lambda numero: worker.sintetizza("Ciao.", speaker_wav, str(cartella / f"{numero}.wav")), range(n)))
+    return time.perf_counter() - inizio
+
+
+def test_motore_non_thread_safe_sintetizza_una_frase_alla_volta(cartella_speaker, tmp_path):
+    speaker_wav = os.path.join(cartella_speaker, "Solista.wav")
+    worker = WorkerTTS(motore=MOTORE_NON_THREAD_SAFE, opzioni_motore={"ritardo_s": 0.3}, parallelismo=2)
+    try:
+        assert _durata_sintesi_parallele(worker, speaker_wav, tmp_path, 2) >= 0.6
+    finally:
+        worker.chiudi()
+
+
+def test_crea_worker_usa_un_processo_per_sintesi_parallela(cartella_speaker, tmp_path):
+    speaker_wav = os.path.join(cartella_speaker, "Solista.wav")
+    assert isinstance(crea_worker("stub", parallelismo=2), WorkerTTS)
+    gruppo = crea_worker(MOTORE_NON_THREAD_SAFE, opzioni_motore={"ritardo_s": 0.3}, parallelismo=2)
+    try:
+        assert isinstance(gruppo, GruppoWorkerTTS) and gruppo.parallelismo == 2
+        assert _durata_sintesi_parallele(gruppo, speaker_wav, tmp_path, 2) < 0.55
+        assert gruppo.attivo and len({worker._processo.pid for worker in gruppo.worker}) == 2
+    finally:
+        gruppo.chiudi()
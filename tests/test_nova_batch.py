@@ -0,0 +1,118 @@
+import os
+import json
+import shutil
+
+import pytest
+
+import nova_batch
+import cache_sintesi
+import indice_speaker
+from audio_wav import durata_wav
+
+richiede_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg non disponibile")
+
+
+@pytest.fixture
+def esegui_batch(tmp_path, cartella_speaker, monkeypatch):
+    """Esegue la CLI con il motore stub; indice degli speaker e cache finiscono in tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    # Indice e cache condivisi dal processo vengono ricreati nella nuova cartella di lavoro
+    monkeypatch.setattr(cache_sintesi, "_cache_condivisa", None)
+    monkeypatch.setattr(indice_speaker, "_indici_condivisi", {})
+
+    def esegui(ingresso, *opzioni):
+        uscita = str(tmp_path / "uscita")
+        codice = nova_batch.main([
+            str(ingresso), "--uscita", uscita, "--speaker-dir", cartella_speaker,
+            "--motore", "stub", "--paralleli", "2", *opzioni,
+        ])
+        return codice, uscita
+
+    return esegui
+
+
+def _leggi_report(uscita):
+    with open(os.path.join(uscita, nova_batch.NOME_REPORT), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _durata_file(percorso):
+    with open(percorso, "rb") as f:
+        return durata_wav(f.read())
+
+
+def test_cartella_salta_gli_output_presenti(esegui_batch, tmp_path):
+    letture = tmp_path / "letture"
+    letture.mkdir()
+    (letture / "a.txt").write_text("Ciao a tutti.", encoding="utf-8")
+    (letture / "b.txt").write_text("Seconda lettura.", encoding="utf-8")
+    (letture / "c.txt").write_text("   ", encoding="utf-8")
+    (letture / "note.md").write_text("ignorato", encoding="utf-8")
+    uscita = tmp_path / "uscita"
+    uscita.mkdir()
+    (uscita / "b.wav").write_bytes(b"gia' renderizzato")
+
+    codice, uscita = esegui_batch(letture, "--speaker", "Solista")
+
+    assert codice == 1  # l'elemento vuoto è un errore
+    report = _leggi_report(uscita)
+    assert report["conteggi"] == {"ok": 1, "saltato": 1, "errore": 1}
+    assert [(voce["id"], voce["stato"]) for voce in report["elementi"]] == [
+        ("a.txt", "ok"), ("b.txt", "saltato"), ("c.txt", "errore"),
+    ]
+    assert report["elementi"][2]["errore"] == "testo vuoto"
+    assert _durata_file(os.path.join(uscita, "a.wav")) == pytest.approx(len("Ciao a tutti.") * 0.06, abs=0.01)
+    with open(os.path.join(uscita, "b.wav"), "rb") as f:
+        assert f.read() == b"gia' renderizzato"
+    assert sorted(os.listdir(uscita)) == ["a.wav", "b.wav", nova_batch.NOME_REPORT]
+
+    # Rilanciato, il batch riprende: tutto ciò che esiste viene saltato
+    codice, _ = esegui_batch(letture, "--speaker", "Solista")
+    assert _leggi_report(uscita)["conteggi"] == {"saltato": 2, "errore": 1}
+
+
+@richiede_ffmpeg
+def test_manifest_jsonl(esegui_batch, tmp_path, monkeypatch):
+    (tmp_path / "testi").mkdir()
+    (tmp_path / "testi" / "capitolo.txt").write_text("Capitolo primo.", encoding="utf-8")
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text("\n".join([
+        json.dumps({"text": "Buongiorno.", "output": "saluto"}),
+        "",
+        json.dumps({"file": "testi/capitolo.txt", "speaker": "Coro", "speed": 2.0}),
+        json.dumps({"text": "Senza nome di uscita.", "volume": -6}),
+    ]) + "\n", encoding="utf-8")
+
+    parziali = []
+    filtra_originale = nova_batch.filtra_wav_su_file
+
+    def filtra_e_registra(wav, percorso, *args, **kwargs):
+        parziali.append(os.path.basename(percorso))
+        return filtra_originale(wav, percorso, *args, **kwargs)
+
+    monkeypatch.setattr(nova_batch, "filtra_wav_su_file", filtra_e_registra)
+    codice, uscita = esegui_batch(manifest, "--speaker", "Solista")
+
+    assert codice == 0
+    report = _leggi_report(uscita)
+    assert [(voce["id"], voce["speaker"], os.path.basename(voce["output"])) for voce in report["elementi"]] == [
+        ("riga 1", "Solista", "saluto.wav"),
+        ("riga 3", "Coro", "capitolo.wav"),
+        ("riga 4", "Solista", "riga_00004.wav"),
+    ]
+    # Ogni output viene scritto come .part e rinominato solo a filtri completati
+    assert sorted(parziali) == ["capitolo.wav.part", "riga_00004.wav.part", "saluto.wav.part"]
+    assert sorted(os.listdir(uscita)) == ["capitolo.wav", nova_batch.NOME_REPORT, "riga_00004.wav", "saluto.wav"]
+    # Velocità doppia: metà della durata prodotta dal motore stub
+    assert _durata_file(os.path.join(uscita, "capitolo.wav")) == pytest.approx(len("Capitolo primo.") * 0.03, abs=0.02)
+    assert report["elementi"][1]["durata_audio_s"] == pytest.approx(len("Capitolo primo.") * 0.06, abs=0.01)
+
+
+def test_ingresso_non_valido(esegui_batch, tmp_path):
+    manifest = tmp_path / "rotto.jsonl"
+    manifest.write_text('{"text": "ok"}\n{non json\n', encoding="utf-8")
+    assert esegui_batch(manifest, "--speaker", "Solista")[0] == 2
+
+    manifest.write_text('{"text": "senza voce"}\n', encoding="utf-8")
+    assert esegui_batch(manifest)[0] == 2
+    assert not os.path.exists(tmp_path / "uscita")
@@ -0,0 +1,65 @@
+import os
+import concurrent.futures
+
+import pytest
+
+from audio_wav import analizza_wav, durata_wav
+from motore_tts import ErroreSintesi
+from pipeline_sintesi import dividi_in_frasi, risolutore_pigro, sintetizza_testo, sintetizza_voce
+
+
+def test_dividi_in_frasi_ai_confini_di_frase_e_a_capo():
+    assert dividi_in_frasi("Ciao a tutti. Come va?\nBene") == ["Ciao a tutti.", "Come va?", "Bene"]
+
+
+def test_la_punteggiatura_isolata_resta_con_la_frase_precedente():
+    assert dividi_in_frasi("Primo. ... Secondo.") == ["Primo....", "Secondo."]
+    assert dividi_in_frasi("...") == []
+
+
+def test_le_frasi_lunghe_vengono_spezzate_alle_virgole_e_tra_le_parole():
+    blocchi = dividi_in_frasi("uno, due, tre, quattro", max_caratteri=10)
+    assert blocchi == ["uno, due,", "tre,", "quattro"]
+    assert all(len(blocco) <= 30 for blocco in dividi_in_frasi("parola " * 40, max_caratteri=30))
+
+
+def test_frasi_ricucite_in_ordine_con_la_pausa(worker, cartella_speaker, tmp_path):
+    speaker_wav = os.path.join(cartella_speaker, "Solista.wav")
+    ordine = []
+    wav = sintetizza_testo(
+        "Prima frase. Seconda frase, più lunga. Terza.", speaker_wav, worker, pausa_ms=200,
+        al_blocco=lambda indice, totale, formato, pcm: ordine.append((indice, totale)),
+        cartella_lavoro=str(tmp_path),
+    )
+    assert ordine == [(0, 3), (1, 3), (2, 3)]
+    caratteri = len("Prima frase.") + len("Seconda frase, più lunga.") + len("Terza.")
+    assert durata_wav(wav) == pytest.approx(caratteri * 0.06 + 2 * 0.2, abs=0.003)
+
+
+def test_voce_inesistente_e_testo_vuoto(worker, cartella_speaker):
+    with pytest.raises(ErroreSintesi, match="non trovata"):
+        sintetizza_voce("Ciao.", "Nessuno", cartella_speaker, worker)
+    with pytest.raises(ErroreSintesi, match="vuoto"):
+        sintetizza_voce("  ...  ", "Solista", cartella_speaker, worker)
+
+
+def test_formato_del_wav_ricucito(worker, cartella_speaker):
+    wav = sintetizza_voce("Ciao. Come va?", "Solista", cartella_speaker, worker)
+    formato, offset, n_bytes = analizza_wav(wav)
+    assert (formato.canali, formato.larghezza, formato.frequenza) == (1, 2, 24000)
+    assert offset + n_bytes == len(wav)
+
+
+def test_risolutore_pigro_calcola_una_sola_volta():
+    chiamate = []
+
+    def calcola():
+        chiamate.append(1)
+        return "condizionamento.pth"
+
+    risolvi = risolutore_pigro(calcola)
+    assert not chiamate
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        assert set(pool.map(lambda _: risolvi(), range(8))) == {"condizionamento.pth"}
+    assert len(chiamate) == 1
+    assert risolutore_pigro("gia_pronto.pth")() == "gia_pronto.pth"
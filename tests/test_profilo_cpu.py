@@ -0,0 +1,55 @@
+import pytest
+
+from profilo_cpu import (
+    ENV_AFFINITA, ENV_PARALLELISMO, ENV_PRESET, analizza_affinita, crea_profilo, profilo_da_ambiente,
+)
+from profilo_cpu import testo_affinita as formatta_affinita
+
+
+def test_analizza_affinita():
+    assert analizza_affinita("0-3,8") == (0, 1, 2, 3, 8)
+    assert analizza_affinita(" 5, 2 ,2 ") == (2, 5)
+    assert analizza_affinita("") is None
+    assert analizza_affinita("   ") is None
+
+
+@pytest.mark.parametrize("testo", ["a", "3-1", "1,,2", "-1", "0-"])
+def test_affinita_non_valida(testo):
+    with pytest.raises(ValueError, match="Affinità CPU non valida"):
+        analizza_affinita(testo)
+
+
+def test_testo_affinita_e_l_inverso_di_analizza_affinita():
+    assert formatta_affinita((0, 1, 2, 3, 8, 10, 11)) == "0-3,8,10-11"
+    assert analizza_affinita(formatta_affinita((0, 1, 2, 3, 8))) == (0, 1, 2, 3, 8)
+    assert formatta_affinita(None) == "tutti"
+
+
+def test_preset_ripartiscono_i_core():
+    latenza = crea_profilo("latenza", n_core=8)
+    assert (latenza.thread_intra, latenza.parallelismo) == (8, 1)
+    throughput = crea_profilo("throughput", n_core=16)
+    assert (throughput.thread_intra, throughput.parallelismo) == (4, 4)
+    # Con poche CPU il throughput resta comunque a un lavoro alla volta
+    assert crea_profilo("throughput", n_core=2).parallelismo == 1
+
+
+def test_i_valori_espliciti_prevalgono_sul_preset():
+    profilo = crea_profilo("throughput", parallelismo=3, affinita=[0, 1, 2, 3, 4, 5])
+    assert (profilo.thread_intra, profilo.parallelismo, profilo.affinita) == (2, 3, (0, 1, 2, 3, 4, 5))
+
+
+def test_preset_o_quantizzazione_sconosciuti():
+    with pytest.raises(ValueError, match="Preset CPU sconosciuto"):
+        crea_profilo("turbo")
+    with pytest.raises(ValueError, match="Quantizzazione non supportata"):
+        crea_profilo(quantizzazione="int4")
+
+
+def test_profilo_da_ambiente(monkeypatch):
+    monkeypatch.setenv(ENV_PRESET, "Throughput")
+    monkeypatch.setenv(ENV_AFFINITA, "0-7")
+    monkeypatch.setenv(ENV_PARALLELISMO, "")
+    profilo = profilo_da_ambiente()
+    assert (profilo.preset, profilo.parallelismo, profilo.thread_intra) == ("throughput", 2, 4)
+    assert profilo_da_ambiente(parallelismo=1).thread_intra == 8
@@ -0,0 +1,85 @@
+import os
+import json
+
+import pytest
+
+from pronuncia import MotorePronuncia, compila_vocabolario
+
+
+def _scrivi_vocabolario(percorso, voci, mtime_ns=None):
+    with open(percorso, "w", encoding="utf-8") as f:
+        json.dump({parola: [sostituzione] for parola, sostituzione in voci.items()}, f, ensure_ascii=False)
+    if mtime_ns is not None:
+        # mtime esplicito: la riscrittura resta visibile anche con filesystem a bassa risoluzione
+        os.utime(percorso, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def vocabolario(tmp_path):
+    percorso = str(tmp_path / "vocabolario.json")
+    _scrivi_vocabolario(percorso, {
+        "New": "Niu",
+        "New York": "Niu Iork",
+        "York": "Iork",
+        "perché": "perchè",
+        "caffè": "caffé",
+        "GPU": "gi pi iu",
+    }, mtime_ns=1_000_000_000)
+    return percorso
+
+
+def test_regex_preferisce_la_corrispondenza_piu_lunga():
+    regex = compila_vocabolario(["ab", "abc", "abcd", "b"])
+    assert regex.findall("abcd abc ab b") == ["abcd", "abc", "ab", "b"]
+
+
+def test_regex_riconosce_solo_parole_intere():
+    regex = compila_vocabolario(["ab", "abc"])
+    # "abcx" non contiene né "abc" né "ab" come parola intera: niente ritorno al prefisso
+    assert regex.findall("abcx xab ab_c abc.") == ["abc"]
+
+
+def test_vocabolario_vuoto_non_compila_nulla():
+    assert compila_vocabolario([]) is None
+
+
+def test_chiavi_sovrapposte_e_piu_parole(vocabolario):
+    motore = MotorePronuncia(vocabolario)
+    testo, applicate = motore.correggi("New York, New Jersey e York.")
+    assert testo == "Niu Iork, Niu Jersey e Iork."
+    assert applicate == {"New York": 1, "New": 1, "York": 1}
+
+
+def test_parole_accentate(vocabolario):
+    motore = MotorePronuncia(vocabolario)
+    testo, applicate = motore.correggi("perché un caffè? perchénon caffèlatte")
+    assert testo == "perchè un caffé? perchénon caffèlatte"
+    assert applicate == {"perché": 1, "caffè": 1}
+
+
+def test_maiuscole_e_minuscole_distinte(vocabolario):
+    motore = MotorePronuncia(vocabolario)
+    testo, applicate = motore.correggi("GPU, gpu e Gpu: GPU")
+    assert testo == "gi pi iu, gpu e Gpu: gi pi iu"
+    assert applicate == {"GPU": 2}
+
+
+def test_ricarica_solo_quando_il_file_cambia(vocabolario):
+    motore = MotorePronuncia(vocabolario)
+    assert motore.numero_voci == 6
+    regex = motore._regex
+    assert motore.correggi("GPU")[0] == "gi pi iu"
+    assert motore._regex is regex  # stesso mtime: nessuna ricompilazione
+
+    _scrivi_vocabolario(vocabolario, {"GPU": "scheda video", "CPU": "ci pi iu"}, mtime_ns=2_000_000_000)
+    testo, applicate = motore.correggi("GPU e CPU, New York")
+    assert testo == "scheda video e ci pi iu, New York"
+    assert applicate == {"GPU": 1, "CPU": 1}
+    assert motore.numero_voci == 2
+
+
+def test_voci_senza_sostituzioni_vengono_ignorate(tmp_path):
+    percorso = tmp_path / "vocabolario.json"
+    percorso.write_text(json.dumps({"vuota": [], "non_lista": "x", "ok": ["okay", "oké"]}), encoding="utf-8")
+    motore = MotorePronuncia(str(percorso))
+    assert motore.correggi("vuota non_lista ok") == ("vuota non_lista okay", {"ok": 1})
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from conftest import importa_benchmark
+
+pytest.importorskip("streamlit.testing.v1")
+
+# Il budget e gli scenari sono quelli di benchmark/bench_rerun.py
+bench_rerun = importa_benchmark("bench_rerun")
+percentile = importa_benchmark("bench_pipeline").percentile
+
+SCENARI = (
+    "rerun senza modifiche", "cursore pitch", "cursore volume", "cambio voce",
+    "audio base, nessuna modifica", "audio base, cursore pitch",
+)
+
+# Le misure di tempo dipendono dalla macchina: il controllo del budget va chiesto esplicitamente
+misura_tempi = pytest.mark.skipif(
+    os.environ.get("NOVA_BENCHMARK") != "1", reason="controllo del budget di rerun: impostare NOVA_BENCHMARK=1"
+)
+
+
+@pytest.fixture(scope="module")
+def cartella_app(tmp_path_factory):
+    """Cartella di lavoro dell'app: indice degli speaker, cache delle frasi e output restano fuori dal progetto."""
+    return str(tmp_path_factory.mktemp("app"))
+
+
+@pytest.fixture
+def app(cartella_app):
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("NOVA_TTS_MOTORE", "stub")
+        monkeypatch.chdir(os.getcwd())  # crea_app si sposta nella cartella di lavoro
+        app = bench_rerun.crea_app(cartella_lavoro=cartella_app)
+        app.run()
+        assert not app.exception, f"Eccezione al primo avvio: {app.exception}"
+        yield app
+
+
+@pytest.mark.parametrize("nome", SCENARI)
+def test_scenario_senza_eccezioni(app, nome):
+    # misura_reruns solleva RuntimeError se lo script fallisce
+    tempi, _ = bench_rerun.misura_reruns(app, bench_rerun.scenari(app)[nome], 3)
+    assert len(tempi) == 3
+
+
+def test_audio_base_mostra_l_analisi(app):
+    bench_rerun.misura_reruns(app, bench_rerun.scenari(app)["audio base, nessuna modifica"], 1)
+    app.session_state["lavoro_analisi"]["lavoro"].attendi(10)
+    app.run()
+    assert any(caption.value.startswith("Picco ") for caption in app.caption)
+
+
+@misura_tempi
+@pytest.mark.parametrize("nome", SCENARI)
+def test_rerun_entro_il_budget(app, nome):
+    tempi, _ = bench_rerun.misura_reruns(
+        app, bench_rerun.scenari(app)[nome], bench_rerun.RIPETIZIONI, bench_rerun.RISCALDAMENTO
+    )
+    p95 = percentile(tempi, 0.95)
+    assert p95 <= bench_rerun.BUDGET_MS, f"{nome}: p95 {p95:.1f} ms oltre il budget di {bench_rerun.BUDGET_MS:.0f} ms"